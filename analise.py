@@ -0,0 +1,363 @@
+import json
+import os
+import threading
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional: sem ele a análise fica indisponível
+    np = None
+
+import database as db
+from database import get_db_connection
+
+# Análise de vendas (curva ABC, margens, giro e cobertura de estoque) feita em
+# arrays do numpy em vez de consultas agrupadas.
+#
+# Os itens vendidos ficam num cache colunar ao lado do banco
+# (estoque_vendas_analise/), um .npy por coluna aberto como memmap:
+#   venda_id, produto_id, dia (dias desde 1970-01-01), quantidade  int32
+#   faturamento, custo (da linha, quantidade x preço)               float32
+# 24 bytes por item vendido. O cache é completado pelo id da venda: a cada
+# análise só as vendas com id maior que o último lido são carregadas, em
+# lotes. Vendas arquivadas (arquivamento.py) entram na primeira carga e
+# continuam no cache depois de saírem do banco principal.
+#
+# O cadastro (estoque e categoria) é lido a cada análise; os indicadores saem
+# de np.bincount sobre as colunas, sem laços em Python por item.
+
+VERSAO_CACHE = 2  # 2: dia local das vendas (migração 16)
+LOTE_ITENS = 200_000
+CAPACIDADE_INICIAL = 1 << 16
+EPOCA = date(1970, 1, 1).toordinal()
+FAIXAS_ABC = (0.80, 0.95)  # participação acumulada no faturamento que fecha as classes A e B
+CLASSES = ("A", "B", "C")
+
+COLUNAS = {
+    "venda_id": "int32",
+    "produto_id": "int32",
+    "dia": "int32",
+    "quantidade": "int32",
+    "faturamento": "float32",
+    "custo": "float32",
+}
+
+_CONSULTA_ITENS = '''
+    SELECT v.id, iv.produto_id, CAST(julianday(date(v.data, 'localtime')) - 2440587.5 AS INTEGER),
+           iv.quantidade, iv.quantidade * iv.preco_unitario, iv.quantidade * COALESCE(iv.custo_unitario, 0)
+    FROM {esquema}.vendas v
+    JOIN {esquema}.itens_venda iv ON iv.venda_id = v.id
+    WHERE v.id > ?
+    ORDER BY v.id
+'''
+
+_lock = threading.Lock()
+_cache = None  # {"pasta", "linhas", "ultimo_id", "colunas": {nome: memmap}}
+
+def disponivel():
+    return np is not None
+
+def pasta_cache():
+    """Pasta do cache, na mesma pasta e com o mesmo nome base do banco principal."""
+    base, _ = os.path.splitext(os.path.abspath(db.DB_NAME))
+    return f"{base}_analise"
+
+def _caminho(pasta, nome):
+    return os.path.join(pasta, f"{nome}.npy")
+
+# --- Cache colunar -------------------------------------------------------------
+
+def _ler_meta(pasta):
+    try:
+        with open(os.path.join(pasta, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get("versao") != VERSAO_CACHE or any(not os.path.exists(_caminho(pasta, nome)) for nome in COLUNAS):
+        return None
+    return meta
+
+def _gravar_meta(pasta, linhas, ultimo_id):
+    # Gravada depois dos dados: um lote interrompido no meio é simplesmente ignorado
+    temporario = os.path.join(pasta, "meta.json.tmp")
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump({"versao": VERSAO_CACHE, "linhas": linhas, "ultimo_id": ultimo_id}, f)
+    os.replace(temporario, os.path.join(pasta, "meta.json"))
+
+def _abrir(pasta, meta):
+    colunas = {nome: np.load(_caminho(pasta, nome), mmap_mode="r+") for nome in COLUNAS}
+    return {"pasta": pasta, "linhas": meta["linhas"], "ultimo_id": meta["ultimo_id"], "colunas": colunas}
+
+def _criar(pasta):
+    os.makedirs(pasta, exist_ok=True)
+    # Sem meta.json até a carga completa terminar: se for interrompida, recomeça do zero
+    if os.path.exists(os.path.join(pasta, "meta.json")):
+        os.remove(os.path.join(pasta, "meta.json"))
+    colunas = {nome: np.lib.format.open_memmap(_caminho(pasta, nome), mode="w+", dtype=tipo, shape=(CAPACIDADE_INICIAL,))
+               for nome, tipo in COLUNAS.items()}
+    return {"pasta": pasta, "linhas": 0, "ultimo_id": 0, "colunas": colunas}
+
+def _garantir_capacidade(cache, linhas):
+    capacidade = len(cache["colunas"]["venda_id"])
+    if linhas <= capacidade:
+        return
+    while capacidade < linhas:
+        capacidade *= 2
+    n = cache["linhas"]
+    for nome, tipo in COLUNAS.items():
+        # Arquivo novo com o dobro do espaço; o antigo é fechado antes da troca
+        caminho = _caminho(cache["pasta"], nome)
+        novo = np.lib.format.open_memmap(caminho + ".novo", mode="w+", dtype=tipo, shape=(capacidade,))
+        novo[:n] = cache["colunas"][nome][:n]
+        novo.flush()
+        del novo
+        cache["colunas"][nome] = None
+        os.replace(caminho + ".novo", caminho)
+        cache["colunas"][nome] = np.load(caminho, mmap_mode="r+")
+
+def _acrescentar(cache, lote):
+    dados = np.array(lote, dtype=[(nome, tipo) for nome, tipo in COLUNAS.items()])
+    inicio = cache["linhas"]
+    fim = inicio + len(dados)
+    _garantir_capacidade(cache, fim)
+    for nome in COLUNAS:
+        coluna = cache["colunas"][nome]
+        coluna[inicio:fim] = dados[nome]
+        coluna.flush()
+    cache["linhas"] = fim
+    cache["ultimo_id"] = max(cache["ultimo_id"], int(dados["venda_id"].max()))
+
+def _carregar(cache, conn, esquema, desde, gravar_lotes=False):
+    cursor = conn.cursor()
+    cursor.row_factory = None  # tuplas simples: o numpy monta o lote direto delas
+    cursor.execute(_CONSULTA_ITENS.format(esquema=esquema), (desde,))
+    while True:
+        lote = cursor.fetchmany(LOTE_ITENS)
+        if not lote:
+            break
+        _acrescentar(cache, lote)
+        if gravar_lotes:
+            # Em ordem de id, mas a última venda do lote pode continuar no
+            # próximo: o ponto de retomada é a última venda completa, e as
+            # linhas seguintes são regravadas se a carga for interrompida
+            ultima = lote[-1][0]
+            completas = len(lote)
+            while completas and lote[completas - 1][0] == ultima:
+                completas -= 1
+            if completas:
+                linhas = cache["linhas"] - len(lote) + completas
+                _gravar_meta(cache["pasta"], linhas, lote[completas - 1][0])
+    if gravar_lotes:
+        _gravar_meta(cache["pasta"], cache["linhas"], cache["ultimo_id"])
+
+def atualizar_cache(reconstruir=False):
+    """
+    Acrescenta ao cache os itens das vendas novas (id maior que o último lido)
+    e retorna {"linhas", "ultimo_id"}. reconstruir=True apaga e recarrega tudo.
+    """
+    global _cache
+    from arquivamento import anexar, anos_arquivados
+    with _lock:
+        pasta = pasta_cache()
+        conn = get_db_connection()
+        meta = None if reconstruir else _ler_meta(pasta)
+        maior_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM vendas").fetchone()[0]
+        if meta is None or meta["ultimo_id"] > maior_id:
+            # Primeira carga (ou cache de outro banco): arquivos anuais e depois o banco principal inteiro
+            _cache = None
+            _cache = _criar(pasta)
+            for ano in anos_arquivados(conn):
+                try:
+                    esquema = anexar(conn, ano)
+                except FileNotFoundError as e:
+                    print(f"Análise sem as vendas de {ano}: {e}")
+                    continue
+                _carregar(_cache, conn, esquema, 0)
+            _carregar(_cache, conn, "main", 0)
+            _gravar_meta(pasta, _cache["linhas"], _cache["ultimo_id"])
+        else:
+            if _cache is None or _cache["pasta"] != pasta or _cache["linhas"] != meta["linhas"]:
+                # Outro banco, ou o cache foi completado por outro processo
+                _cache = _abrir(pasta, meta)
+            if maior_id > _cache["ultimo_id"]:
+                _carregar(_cache, conn, "main", _cache["ultimo_id"], gravar_lotes=True)
+        return {"linhas": _cache["linhas"], "ultimo_id": _cache["ultimo_id"]}
+
+def colunas():
+    """Arrays dos itens vendidos (views dos memmaps, até a última linha), já atualizados."""
+    atualizar_cache()
+    n = _cache["linhas"]
+    return {nome: coluna[:n] for nome, coluna in _cache["colunas"].items()}
+
+def fechar():
+    """Solta os memmaps (antes de apagar ou mover a pasta do cache)."""
+    global _cache
+    with _lock:
+        _cache = None
+
+# --- Indicadores ---------------------------------------------------------------
+
+def _dia(hoje):
+    return (hoje or date.today()).toordinal() - EPOCA
+
+def _produtos():
+    # Cadastro em arrays alinhados em ordem de id: estoque, ativo e código da categoria
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.row_factory = None  # tuplas simples: o numpy converte as colunas direto
+    linhas = cursor.execute('''
+        SELECT id, COALESCE(ativo, 1), MAX(COALESCE(quantidade, 0), 0), COALESCE(NULLIF(categoria, ''), 'Sem categoria')
+        FROM produtos ORDER BY id
+    ''').fetchall()
+    ids, ativo, estoque, categoria = zip(*linhas) if linhas else ((), (), (), ())
+    # Código da categoria pela ordem alfabética do nome
+    vistas = {}
+    codigos = np.fromiter((vistas.setdefault(c, len(vistas)) for c in categoria), dtype=np.int64, count=len(categoria))
+    categorias = np.array(sorted(vistas), dtype=object)
+    ordem = np.empty(len(vistas), dtype=np.int64)
+    ordem[[vistas[c] for c in categorias]] = np.arange(len(categorias))
+    return (np.array(ids, dtype=np.int32), np.array(estoque, dtype=np.int64),
+            np.array(ativo, dtype=bool), categorias, ordem[codigos])
+
+def indicadores(dias=None, hoje=None):
+    """
+    Indicadores por produto (arrays alinhados com `ids`, em ordem de id) das
+    vendas dos últimos `dias` dias (None: todo o histórico):
+    faturamento, custo, vendido, estoque, classe (0=A 1=B 2=C, -1 sem vendas),
+    giro (% do disponível que foi vendido: vendido / (vendido + estoque)) e
+    cobertura (dias de estoque no ritmo de venda do período; inf sem vendas).
+    """
+    if np is None:
+        raise RuntimeError("Análise de vendas requer o numpy (pip install numpy).")
+    itens = colunas()
+    ids, estoque, ativo, categorias, codigos = _produtos()
+    fim = _dia(hoje)
+    dia, produto = itens["dia"], itens["produto_id"]
+    if dias is None:
+        filtro = dia <= fim
+        inicio = int(dia.min()) if len(dia) else fim
+    else:
+        inicio = fim - dias + 1
+        filtro = (dia >= inicio) & (dia <= fim)
+
+    # Posição de cada produto_id no cadastro (-1: produto excluído)
+    posicao = np.full(max(int(ids.max(initial=0)), int(produto.max(initial=0))) + 1, -1, dtype=np.int64)
+    posicao[ids] = np.arange(len(ids))
+    indice = posicao[produto[filtro]]
+    validos = indice >= 0
+    indice = indice[validos]
+
+    def somar(coluna):
+        return np.bincount(indice, weights=itens[coluna][filtro][validos], minlength=len(ids))
+
+    faturamento, custo, vendido = somar("faturamento"), somar("custo"), somar("quantidade")
+
+    # Curva ABC: ordena pelo faturamento e classifica pela participação acumulada antes de cada produto
+    ordem = np.argsort(-faturamento, kind="stable")
+    total = faturamento.sum()
+    classe = np.full(len(ids), -1, dtype=np.int8)
+    if total > 0:
+        acumulado_antes = (np.cumsum(faturamento[ordem]) - faturamento[ordem]) / total
+        classe[ordem] = np.searchsorted(FAIXAS_ABC, acumulado_antes, side="right")
+        classe[faturamento <= 0] = -1
+
+    periodo = max(fim - inicio + 1, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        giro = np.where(vendido + estoque > 0, vendido / (vendido + estoque) * 100, 0.0)
+        cobertura = np.where(vendido > 0, estoque / (vendido / periodo), np.inf)
+    return {
+        "ids": ids, "ativo": ativo, "categorias": categorias, "codigos": codigos,
+        "faturamento": faturamento, "custo": custo, "vendido": vendido, "estoque": estoque,
+        "classe": classe, "giro": giro, "cobertura": cobertura,
+        "inicio": date.fromordinal(inicio + EPOCA), "fim": date.fromordinal(fim + EPOCA),
+        "linhas": int(validos.sum()),
+    }
+
+def _pct(parte, total):
+    return round(float(parte) / float(total) * 100, 1) if total else 0.0
+
+def _dias_cobertura(valor):
+    return None if not np.isfinite(valor) else round(float(valor), 1)
+
+def resumo_analitico(dias=90, limite=10, hoje=None):
+    """
+    Resumo para o Dashboard: curva ABC, margem e giro por categoria, os
+    produtos que mais faturaram e os de menor cobertura de estoque.
+    None se o numpy não estiver instalado.
+    """
+    if np is None:
+        return None
+    r = indicadores(dias, hoje)
+    faturamento, custo, vendido, estoque = r["faturamento"], r["custo"], r["vendido"], r["estoque"]
+    total = faturamento.sum()
+    periodo = (r["fim"] - r["inicio"]).days + 1
+
+    abc = []
+    for codigo, nome in enumerate(CLASSES):
+        da_classe = r["classe"] == codigo
+        abc.append({"classe": nome, "produtos": int(da_classe.sum()), "faturamento": round(float(faturamento[da_classe].sum()), 2),
+                    "participacao": _pct(faturamento[da_classe].sum(), total)})
+
+    # Categorias: as mesmas somas agrupadas pelo código da categoria (estoque só dos ativos)
+    n = len(r["categorias"])
+    por_categoria = {nome: np.bincount(r["codigos"], weights=valores, minlength=n)
+                     for nome, valores in (("faturamento", faturamento), ("custo", custo), ("vendido", vendido),
+                                           ("estoque", np.where(r["ativo"], estoque, 0)))}
+    categorias = []
+    for i in np.argsort(-por_categoria["faturamento"], kind="stable"):
+        fat, cus, ven, est = (por_categoria[nome][i] for nome in ("faturamento", "custo", "vendido", "estoque"))
+        if not fat and not est:
+            continue
+        categorias.append({
+            "categoria": r["categorias"][i], "faturamento": round(float(fat), 2), "margem": round(float(fat - cus), 2),
+            "margem_pct": _pct(fat - cus, fat), "vendido": int(ven), "estoque": int(est), "giro": _pct(ven, ven + est),
+            "dias_cobertura": _dias_cobertura(est / (ven / periodo)) if ven else None,
+        })
+
+    def linhas(posicoes):
+        nomes = dict(get_db_connection().execute(
+            f"SELECT id, nome FROM produtos WHERE id IN ({','.join('?' * len(posicoes))})",
+            [int(r["ids"][i]) for i in posicoes]).fetchall()) if len(posicoes) else {}
+        return [{
+            "id": int(r["ids"][i]), "nome": nomes.get(int(r["ids"][i])), "categoria": r["categorias"][r["codigos"][i]],
+            "classe": CLASSES[r["classe"][i]] if r["classe"][i] >= 0 else None,
+            "faturamento": round(float(faturamento[i]), 2), "margem": round(float(faturamento[i] - custo[i]), 2),
+            "margem_pct": _pct(faturamento[i] - custo[i], faturamento[i]), "vendido": int(vendido[i]),
+            "estoque": int(estoque[i]), "giro": round(float(r["giro"][i]), 1), "dias_cobertura": _dias_cobertura(r["cobertura"][i]),
+        } for i in posicoes]
+
+    mais_faturaram = np.argsort(-faturamento, kind="stable")[:limite]
+    mais_faturaram = mais_faturaram[faturamento[mais_faturaram] > 0]
+    # Cobertura baixa: produtos ativos que venderam no período, do que acaba primeiro
+    candidatos = np.flatnonzero(r["ativo"] & (vendido > 0))
+    cobertura_baixa = candidatos[np.argsort(r["cobertura"][candidatos], kind="stable")[:limite]]
+    return {
+        "inicio": r["inicio"].isoformat(), "fim": r["fim"].isoformat(), "linhas": r["linhas"],
+        "faturamento": round(float(total), 2), "margem": round(float(total - custo.sum()), 2),
+        "margem_pct": _pct(total - custo.sum(), total),
+        "abc": abc,
+        "sem_vendas": int((r["ativo"] & (r["classe"] < 0)).sum()),
+        "categorias": categorias,
+        "produtos": linhas(mais_faturaram),
+        "cobertura_baixa": linhas(cobertura_baixa),
+    }
+
+def verificar_cache():
+    """
+    Confere as somas do cache por produto com o resumo diário (vendas_dia_produto).
+    Retorna {produto_id: ((quantidade, faturamento) no cache, no banco)} dos divergentes.
+    """
+    itens = colunas()
+    produto = itens["produto_id"]
+    tamanho = int(produto.max(initial=0)) + 1
+    quantidade = np.bincount(produto, weights=itens["quantidade"], minlength=tamanho)
+    faturamento = np.bincount(produto, weights=itens["faturamento"], minlength=tamanho)
+    banco = {r[0]: (r[1], r[2]) for r in get_db_connection().execute(
+        "SELECT produto_id, SUM(quantidade), SUM(faturamento) FROM vendas_dia_produto GROUP BY produto_id")}
+    divergencias = {}
+    for produto_id in set(banco) | set(np.flatnonzero(quantidade).tolist()):
+        cache = (int(quantidade[produto_id]), float(faturamento[produto_id])) if produto_id < tamanho else (0, 0.0)
+        qtd, fat = banco.get(produto_id, (0, 0.0))
+        if cache[0] != qtd or abs(cache[1] - (fat or 0)) > max(0.05, abs(fat or 0) * 1e-5):
+            divergencias[produto_id] = (cache, (qtd, fat))
+    return divergencias
@@ -0,0 +1,307 @@
+import argparse
+import os
+import sqlite3
+from datetime import date, timedelta
+
+import database as db
+from database import get_db_connection, transacao
+
+# Arquivamento de vendas antigas em bancos anuais.
+# Vendas PAGO mais antigas que o horizonte (ESTOQUE_ARQUIVO_DIAS, padrão 2
+# anos) saem de vendas/itens_venda do banco principal e vão, com os itens,
+# para um arquivo por ano ao lado dele (estoque_vendas_arquivo_2023.db).
+# Vendas em aberto nunca são arquivadas.
+#
+#   python arquivamento.py --dias 730 [--vacuum]
+#
+# Os arquivos são anexados (ATTACH DATABASE) só quando uma consulta precisa
+# deles: arquivos_vendas guarda o período de cada ano e arquivos_vendas_clientes
+# quais clientes têm vendas em cada um (migração 14). As consultas recebem o
+# esquema no lugar do banco ({esquema}.vendas) e rodam uma vez por partição,
+# ver particoes(). Os resumos (resumo_dashboard, vendas_dia, saldos_clientes)
+# não mudam ao arquivar (vendas não têm triggers de exclusão), e os totais
+# diários das vendas arquivadas ficam no banco principal para que possam ser
+# recalculados sem abrir os arquivos.
+
+HORIZONTE_DIAS = int(os.environ.get("ESTOQUE_ARQUIVO_DIAS", 730))
+LOTE_VENDAS = 5000
+TABELAS = ("vendas", "itens_venda")
+
+def caminho_arquivo(ano):
+    """Arquivo do ano, na mesma pasta e com o mesmo nome base do banco principal."""
+    base, _ = os.path.splitext(os.path.abspath(db.DB_NAME))
+    return f"{base}_arquivo_{ano}.db"
+
+def _esquema(ano):
+    return f"arquivo_{int(ano)}"
+
+def anos_arquivados(conn, inicio=None, fim=None, cliente_id=None):
+    """Anos arquivados com vendas em [inicio, fim) (e do cliente, se informado)."""
+    condicoes, params = [], []
+    if inicio:
+        condicoes.append("data_fim >= ?")
+        params.append(str(inicio))
+    if fim:
+        condicoes.append("data_inicio < ?")
+        params.append(str(fim))
+    if cliente_id is not None:
+        condicoes.append("ano IN (SELECT ano FROM arquivos_vendas_clientes WHERE cliente_id = ?)")
+        params.append(cliente_id)
+    query = "SELECT ano FROM arquivos_vendas"
+    if condicoes:
+        query += " WHERE " + " AND ".join(condicoes)
+    return sorted(r[0] for r in conn.execute(query, params))
+
+def limite_arquivo(conn):
+    """Data da venda arquivada mais recente (None se nada foi arquivado)."""
+    return conn.execute("SELECT MAX(data_fim) FROM arquivos_vendas").fetchone()[0]
+
+def anexar(conn, ano, criar=False, manter=()):
+    """
+    Anexa o arquivo do ano à conexão (se ainda não estiver) e retorna o nome do esquema.
+    No limite de bancos anexados, desanexa um arquivo que não esteja em `manter`.
+    ATTACH/DETACH não podem rodar dentro de uma transação.
+    """
+    esquema = _esquema(ano)
+    anexados = [r['name'] for r in conn.execute("PRAGMA database_list")]
+    if esquema in anexados:
+        return esquema
+    caminho = caminho_arquivo(ano)
+    if not criar and not os.path.exists(caminho):
+        raise FileNotFoundError(f"Arquivo das vendas de {ano} não encontrado: {caminho}")
+    arquivos = [nome for nome in anexados if nome.startswith("arquivo_")]
+    if len(arquivos) >= conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED):
+        livre = next((nome for nome in arquivos if nome not in manter), None)
+        if livre is None:
+            raise sqlite3.OperationalError(f"mais de {len(arquivos)} arquivos de vendas na mesma consulta")
+        conn.execute(f"DETACH DATABASE {livre}")
+    conn.execute(f"ATTACH DATABASE ? AS {esquema}", (caminho,))
+    return esquema
+
+def particoes(conn, inicio=None, fim=None, cliente_id=None):
+    """
+    Esquemas onde ler vendas/itens_venda do período [inicio, fim): os arquivos
+    anuais que o cobrem, do mais antigo ao mais novo, e por último 'main'.
+    Cada arquivo é anexado quando chega a vez dele (a leitura de uma partição
+    termina antes da próxima); sem vendas arquivadas no período, nenhum é aberto.
+    """
+    for ano in anos_arquivados(conn, inicio, fim, cliente_id):
+        yield anexar(conn, ano)
+    yield "main"
+
+# --- Arquivamento -------------------------------------------------------------
+
+def _preparar_arquivo(conn, esquema):
+    # Mesmas colunas do banco principal (as que faltarem num arquivo antigo são criadas)
+    with transacao():
+        for tabela in TABELAS:
+            existentes = {r['name'] for r in conn.execute(f"PRAGMA {esquema}.table_info({tabela})")}
+            colunas = conn.execute(f"PRAGMA main.table_info({tabela})").fetchall()
+            if not existentes:
+                definicoes = ", ".join("id INTEGER PRIMARY KEY" if c['name'] == "id" else f"{c['name']} {c['type']}" for c in colunas)
+                conn.execute(f"CREATE TABLE {esquema}.{tabela} ({definicoes})")
+                continue
+            for c in colunas:
+                if c['name'] not in existentes:
+                    conn.execute(f"ALTER TABLE {esquema}.{tabela} ADD COLUMN {c['name']} {c['type']}")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_vendas_cliente_data ON vendas (cliente_id, data)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_vendas_data ON vendas (data)")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {esquema}.idx_itens_venda_venda ON itens_venda (venda_id)")
+
+def _colunas(conn, tabela):
+    return ", ".join(r['name'] for r in conn.execute(f"PRAGMA main.table_info({tabela})"))
+
+def _somar_totais_diarios(conn, esquema, filtro=""):
+    # Totais por dia local (o mesmo dia dos resumos vendas_dia, migração 16)
+    conn.execute(f'''
+        INSERT INTO arquivos_vendas_dia (dia, vendas, faturamento)
+        SELECT date(v.data, 'localtime') AS dia, COUNT(*), SUM(v.total) FROM {esquema}.vendas v
+        {filtro}
+        GROUP BY dia
+        ON CONFLICT (dia) DO UPDATE SET vendas = vendas + excluded.vendas, faturamento = faturamento + excluded.faturamento
+    ''')
+    conn.execute(f'''
+        INSERT INTO arquivos_vendas_dia_produto (dia, produto_id, quantidade, faturamento, custo)
+        SELECT date(v.data, 'localtime') AS dia, iv.produto_id, SUM(iv.quantidade), SUM(iv.quantidade * iv.preco_unitario),
+               SUM(iv.quantidade * iv.custo_unitario)
+        FROM {esquema}.vendas v
+        JOIN {esquema}.itens_venda iv ON iv.venda_id = v.id
+        {filtro}
+        GROUP BY dia, iv.produto_id
+        ON CONFLICT (dia, produto_id) DO UPDATE SET
+            quantidade = quantidade + excluded.quantidade,
+            faturamento = faturamento + excluded.faturamento,
+            custo = custo + excluded.custo
+    ''')
+
+def recalcular_totais_diarios():
+    """
+    Refaz arquivos_vendas_dia e arquivos_vendas_dia_produto lendo todos os
+    arquivos anuais. Se algum arquivo não for encontrado, nada é alterado
+    e retorna False.
+    """
+    conn = get_db_connection()
+    anos = anos_arquivados(conn)
+    faltando = [ano for ano in anos if not os.path.exists(caminho_arquivo(ano))]
+    if faltando:
+        print(f"Totais diários dos arquivos não recalculados: arquivo(s) de {', '.join(map(str, faltando))} não encontrado(s).")
+        return False
+    esquemas = []
+    for ano in anos:
+        esquemas.append(anexar(conn, ano, manter=esquemas))
+    with transacao():
+        conn.execute("DELETE FROM arquivos_vendas_dia")
+        conn.execute("DELETE FROM arquivos_vendas_dia_produto")
+        for esquema in esquemas:
+            _somar_totais_diarios(conn, esquema)
+    return True
+
+def _arquivar_lote(conn, ano, esquema, inicio, fim, lote):
+    # 1) Copia o lote para o arquivo. Em WAL, uma transação com bancos anexados
+    # não é atômica entre os arquivos: a cópia é confirmada antes de apagar do
+    # principal. Se o processo cair entre as duas etapas, a venda fica nos dois
+    # até a próxima execução, que a encontra de novo (INSERT OR IGNORE) e conclui.
+    with transacao():
+        conn.execute("DELETE FROM temp.vendas_a_arquivar")
+        conn.execute('''
+            INSERT INTO temp.vendas_a_arquivar
+            SELECT id FROM main.vendas WHERE data >= ? AND data < ? AND status = 'PAGO' ORDER BY data LIMIT ?
+        ''', (inicio, fim, lote))
+        quantidade = conn.execute("SELECT COUNT(*) FROM temp.vendas_a_arquivar").fetchone()[0]
+        if not quantidade:
+            return 0
+        for tabela, chave in (("vendas", "id"), ("itens_venda", "venda_id")):
+            colunas = _colunas(conn, tabela)
+            conn.execute(f'''
+                INSERT OR IGNORE INTO {esquema}.{tabela} ({colunas})
+                SELECT {colunas} FROM main.{tabela} WHERE {chave} IN (SELECT id FROM temp.vendas_a_arquivar)
+            ''')
+
+    # 2) Apaga do principal e soma o lote aos totais do arquivo
+    with transacao():
+        copiadas = conn.execute(f"SELECT COUNT(*) FROM {esquema}.vendas WHERE id IN (SELECT id FROM temp.vendas_a_arquivar)").fetchone()[0]
+        if copiadas != quantidade:
+            raise RuntimeError(f"Arquivo de {ano}: {copiadas} de {quantidade} vendas copiadas; nada foi apagado.")
+        conn.execute(f'''
+            INSERT INTO arquivos_vendas (ano, vendas, itens, total, lucro, data_inicio, data_fim)
+            SELECT ?, COUNT(*), COALESCE(SUM(i.itens), 0), COALESCE(SUM(v.total), 0), COALESCE(SUM(i.lucro), 0),
+                   MIN(v.data), MAX(v.data)
+            FROM {esquema}.vendas v
+            LEFT JOIN (
+                SELECT venda_id, SUM(quantidade) AS itens, SUM((preco_unitario - custo_unitario) * quantidade) AS lucro
+                FROM {esquema}.itens_venda WHERE venda_id IN (SELECT id FROM temp.vendas_a_arquivar)
+                GROUP BY venda_id
+            ) i ON i.venda_id = v.id
+            WHERE v.id IN (SELECT id FROM temp.vendas_a_arquivar)
+            ON CONFLICT (ano) DO UPDATE SET
+                vendas = vendas + excluded.vendas,
+                itens = itens + excluded.itens,
+                total = total + excluded.total,
+                lucro = lucro + excluded.lucro,
+                data_inicio = MIN(data_inicio, excluded.data_inicio),
+                data_fim = MAX(data_fim, excluded.data_fim),
+                atualizado_em = CURRENT_TIMESTAMP
+        ''', (ano,))
+        _somar_totais_diarios(conn, esquema, "WHERE v.id IN (SELECT id FROM temp.vendas_a_arquivar)")
+        conn.execute(f'''
+            INSERT INTO arquivos_vendas_clientes (cliente_id, ano, vendas)
+            SELECT cliente_id, ?, COUNT(*) FROM {esquema}.vendas
+            WHERE id IN (SELECT id FROM temp.vendas_a_arquivar) AND cliente_id IS NOT NULL
+            GROUP BY cliente_id
+            ON CONFLICT (cliente_id, ano) DO UPDATE SET vendas = vendas + excluded.vendas
+        ''', (ano,))
+        conn.execute("DELETE FROM main.itens_venda WHERE venda_id IN (SELECT id FROM temp.vendas_a_arquivar)")
+        conn.execute("DELETE FROM main.vendas WHERE id IN (SELECT id FROM temp.vendas_a_arquivar)")
+    return quantidade
+
+def arquivar_vendas(horizonte_dias=HORIZONTE_DIAS, hoje=None, lote=LOTE_VENDAS, progresso=None):
+    """
+    Move as vendas PAGO anteriores a (hoje - horizonte_dias) para os arquivos
+    anuais, `lote` vendas por transação. Pode ser interrompido e repetido.
+    Retorna {ano: vendas arquivadas}.
+    """
+    corte = ((hoje or date.today()) - timedelta(days=horizonte_dias)).isoformat()
+    conn = get_db_connection()
+    primeira = conn.execute("SELECT MIN(data) FROM vendas WHERE status = 'PAGO'").fetchone()[0]
+    if primeira is None or primeira >= corte:
+        return {}
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS vendas_a_arquivar (id INTEGER PRIMARY KEY)")
+
+    arquivadas = {}
+    for ano in range(int(primeira[:4]), int(corte[:4]) + 1):
+        inicio, fim = f"{ano}-01-01", min(f"{ano + 1}-01-01", corte)
+        tem_vendas = conn.execute("SELECT 1 FROM vendas WHERE data >= ? AND data < ? AND status = 'PAGO' LIMIT 1",
+                                  (inicio, fim)).fetchone()
+        if not tem_vendas:
+            continue
+        novo = not os.path.exists(caminho_arquivo(ano))
+        esquema = anexar(conn, ano, criar=True)
+        if novo:
+            conn.execute(f"PRAGMA {esquema}.journal_mode = WAL")
+        _preparar_arquivo(conn, esquema)
+        while True:
+            movidas = _arquivar_lote(conn, ano, esquema, inicio, fim, lote)
+            if not movidas:
+                break
+            arquivadas[ano] = arquivadas.get(ano, 0) + movidas
+            if progresso:
+                progresso(ano, arquivadas[ano])
+        conn.execute(f"ANALYZE {esquema}")
+    conn.execute("DROP TABLE IF EXISTS temp.vendas_a_arquivar")
+    return arquivadas
+
+def verificar_arquivos():
+    """
+    Confere cada arquivo com os totais de arquivos_vendas e procura vendas
+    presentes no arquivo e no banco principal. Retorna {ano: [problemas]}.
+    """
+    conn = get_db_connection()
+    problemas = {}
+    for linha in conn.execute("SELECT * FROM arquivos_vendas ORDER BY ano").fetchall():
+        ano = linha['ano']
+        try:
+            esquema = anexar(conn, ano)
+        except FileNotFoundError as e:
+            problemas[ano] = [str(e)]
+            continue
+        real = conn.execute(f'''
+            SELECT (SELECT COUNT(*) FROM {esquema}.vendas) AS vendas,
+                   (SELECT COALESCE(SUM(quantidade), 0) FROM {esquema}.itens_venda) AS itens,
+                   (SELECT COALESCE(SUM(total), 0) FROM {esquema}.vendas) AS total,
+                   (SELECT COALESCE(SUM((preco_unitario - custo_unitario) * quantidade), 0) FROM {esquema}.itens_venda) AS lucro
+        ''').fetchone()
+        erros = [f"{campo}: {linha[campo]} no resumo, {real[campo]} no arquivo"
+                 for campo in ("vendas", "itens", "total", "lucro") if abs(linha[campo] - real[campo]) > 0.005]
+        duplicadas = conn.execute(f"SELECT COUNT(*) FROM main.vendas WHERE id IN (SELECT id FROM {esquema}.vendas)").fetchone()[0]
+        if duplicadas:
+            erros.append(f"{duplicadas} venda(s) também no banco principal (rode o arquivamento de novo)")
+        if erros:
+            problemas[ano] = erros
+    return problemas
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Move vendas pagas antigas para arquivos anuais.")
+    parser.add_argument("--banco", default=db.DB_NAME)
+    parser.add_argument("--dias", type=int, default=HORIZONTE_DIAS, help="mantém no banco principal as vendas dos últimos N dias")
+    parser.add_argument("--lote", type=int, default=LOTE_VENDAS, help="vendas por transação")
+    parser.add_argument("--vacuum", action="store_true", help="compacta o banco principal no final")
+    args = parser.parse_args(argv)
+
+    db.DB_NAME = args.banco
+    db.init_db()
+    arquivadas = arquivar_vendas(args.dias, lote=args.lote,
+                                 progresso=lambda ano, n: print(f"  {ano}: {n} vendas arquivadas...", end="\r"))
+    if arquivadas:
+        print()
+    for ano, n in sorted(arquivadas.items()):
+        print(f"{ano}: {n} vendas -> {caminho_arquivo(ano)}")
+    if not arquivadas:
+        print(f"Nenhuma venda paga com mais de {args.dias} dias.")
+    conn = get_db_connection()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if args.vacuum and arquivadas:
+        conn.execute("VACUUM main")
+    db.close_db_connections()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+"""
+Benchmarks do database.py sobre dados sintéticos.
+
+    python -m benchmarks.gerador --banco bench_estoque.db
+    python -m benchmarks.executar --banco bench_estoque.db --saida resultados.json
+    python -m benchmarks.executar --banco bench_estoque.db --baseline resultados.json
+    python -m benchmarks.carga_servidor --banco bench_estoque.db --caixas 1 2 4 8 16
+"""
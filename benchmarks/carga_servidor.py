@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import cliente_api
+
+# Teste de carga do servidor.py: N caixas simultâneos fazendo vendas.
+# Cada venda lê 3 códigos de barras (como o leitor do Caixa) e registra a venda
+# com esses itens. Mede vendas/s e a latência (p50/p95) da venda completa e do
+# registrar_venda para cada número de caixas.
+#
+#   python -m benchmarks.carga_servidor --banco bench_estoque.db --caixas 1 2 4 8 16
+#
+# Sem --servidor, sobe um servidor.py num processo separado sobre o banco
+# informado (que é alterado: as vendas ficam gravadas).
+
+PORTA = 8799
+ITENS_POR_VENDA = 3
+
+def _percentil(tempos, p):
+    return round(tempos[min(len(tempos) - 1, int(len(tempos) * p))], 3) if tempos else None
+
+def _produtos(banco, limite=2000):
+    conn = sqlite3.connect(banco)
+    try:
+        return conn.execute(
+            "SELECT codigo_barras FROM produtos WHERE ativo = 1 AND quantidade >= 100 AND codigo_barras IS NOT NULL LIMIT ?",
+            (limite,)).fetchall()
+    finally:
+        conn.close()
+
+def _caixa(indice, codigos, fim, resultado):
+    vendas, registro, erros = [], [], 0
+    i = indice * 7919  # cada caixa começa num ponto diferente da lista
+    while time.perf_counter() < fim:
+        inicio = time.perf_counter()
+        try:
+            itens = []
+            for k in range(ITENS_POR_VENDA):
+                produto = cliente_api.buscar_por_codigo_barras(codigos[(i + k) % len(codigos)][0])
+                itens.append({"produto_id": produto['id'], "quantidade": 1, "preco_unitario": produto['preco_venda']})
+            antes_registro = time.perf_counter()
+            cliente_api.registrar_venda(None, itens)
+        except Exception as e:
+            erros += 1
+            if erros <= 3:
+                print(f"  caixa {indice}: {e}")
+            continue
+        finally:
+            i += ITENS_POR_VENDA
+        agora = time.perf_counter()
+        vendas.append((agora - inicio) * 1000)
+        registro.append((agora - antes_registro) * 1000)
+    resultado[indice] = (vendas, registro, erros)
+
+def medir(caixas, codigos, duracao):
+    resultado = {}
+    fim = time.perf_counter() + duracao
+    threads = [threading.Thread(target=_caixa, args=(i, codigos, fim, resultado)) for i in range(caixas)]
+    inicio = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    decorrido = time.perf_counter() - inicio
+
+    vendas = sorted(t for v, _, _ in resultado.values() for t in v)
+    registro = sorted(t for _, r, _ in resultado.values() for t in r)
+    return {
+        "caixas": caixas,
+        "vendas": len(vendas),
+        "vendas_por_s": round(len(vendas) / decorrido, 1),
+        "venda_p50_ms": _percentil(vendas, 0.5),
+        "venda_p95_ms": _percentil(vendas, 0.95),
+        "registro_p50_ms": _percentil(registro, 0.5),
+        "registro_p95_ms": _percentil(registro, 0.95),
+        "registro_media_ms": round(statistics.fmean(registro), 3) if registro else None,
+        "erros": sum(e for _, _, e in resultado.values()),
+    }
+
+def _subir_servidor(banco, porta, leitores):
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    processo = subprocess.Popen([sys.executable, os.path.join(raiz, "servidor.py"), "--banco", banco,
+                                 "--porta", str(porta), "--leitores", str(leitores)])
+    for _ in range(100):
+        try:
+            cliente_api.saude()
+            return processo
+        except cliente_api.ServidorIndisponivelError:
+            time.sleep(0.1)
+    processo.terminate()
+    raise SystemExit("O servidor não respondeu.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do servidor.py com N caixas simultâneos.")
+    parser.add_argument("--banco", default="bench_estoque.db")
+    parser.add_argument("--servidor", help="URL de um servidor já rodando (senão sobe um local)")
+    parser.add_argument("--caixas", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duracao", type=float, default=5, help="segundos por nível de carga")
+    parser.add_argument("--leitores", type=int, default=4)
+    parser.add_argument("--saida", help="grava os resultados em JSON")
+    args = parser.parse_args(argv)
+
+    codigos = _produtos(args.banco)
+    if not codigos:
+        raise SystemExit("Banco sem produtos com código de barras e estoque >= 100 (gere com benchmarks.gerador).")
+
+    cliente_api.SERVIDOR = args.servidor or f"http://127.0.0.1:{PORTA}"
+    processo = None if args.servidor else _subir_servidor(args.banco, PORTA, args.leitores)
+    try:
+        resultados = []
+        for caixas in args.caixas:
+            r = medir(caixas, codigos, args.duracao)
+            resultados.append(r)
+            print(f"{caixas:>3} caixas: {r['vendas_por_s']:>8.1f} vendas/s  venda p50 {r['venda_p50_ms']:>7.2f} ms  "
+                  f"p95 {r['venda_p95_ms']:>7.2f} ms  registrar_venda p50 {r['registro_p50_ms']:>7.2f} ms  erros {r['erros']}")
+    finally:
+        if processo:
+            processo.terminate()
+            processo.wait()
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({
+                "meta": {"data": datetime.now().isoformat(timespec="seconds"), "banco": args.banco,
+                         "servidor": cliente_api.SERVIDOR, "duracao_s": args.duracao, "leitores": args.leitores,
+                         "python": platform.python_version(), "sqlite": sqlite3.sqlite_version},
+                "resultados": resultados,
+            }, f, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {args.saida}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import argparse
+import json
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime
+
+import analise
+import database as db
+import relatorios
+
+# Mede as funções do database.py sobre um banco gerado por benchmarks.gerador.
+# Cada caso roda algumas vezes para aquecer o cache e depois N vezes medidas;
+# o relatório traz p50/p95/média em milissegundos e pode ser comparado com
+# uma execução anterior (--baseline) para detectar regressões.
+
+FILTROS = {
+    "sem_filtro": {},
+    "busca": {"search_term": "capinha samsung"},
+    "busca_prefixo": {"search_term": "carreg"},
+    "categoria": {"category": "Cabo"},
+    "faixa_preco": {"min_price": 20, "max_price": 100},
+    "estoque_baixo": {"low_stock": True},
+    "sem_estoque": {"out_of_stock": True},
+    "inativos": {"show_inactive": True},
+}
+ORDENACOES = [None, "name_asc", "price_asc", "stock_desc", "date_desc", "best_sellers"]
+TAMANHO_PAGINA = 50
+
+def medir(funcao, repeticoes, aquecimento=2):
+    for _ in range(aquecimento):
+        funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    tempos.sort()
+    return {
+        "p50_ms": round(statistics.median(tempos), 3),
+        "p95_ms": round(tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))], 3),
+        "media_ms": round(statistics.fmean(tempos), 3),
+        "n": len(tempos),
+    }
+
+def _listar(filtros, sort_by, cursor=None):
+    return lambda: db.get_produtos(sort_by=sort_by, cursor=cursor, page_size=TAMANHO_PAGINA, **filtros)
+
+def casos_listagem():
+    for nome_filtro, filtros in FILTROS.items():
+        yield f"contar_produtos[{nome_filtro}]", lambda filtros=filtros: db.contar_produtos(**filtros)
+        for sort_by in ORDENACOES:
+            nome = f"get_produtos[{nome_filtro}|{sort_by or 'padrao'}]"
+            yield nome, _listar(filtros, sort_by)
+            # Segunda página: mede o custo do cursor, não só do primeiro LIMIT
+            primeira = db.get_produtos(sort_by=sort_by, page_size=TAMANHO_PAGINA, **filtros)
+            if len(primeira) == TAMANHO_PAGINA:
+                yield nome + "[pagina_2]", _listar(filtros, sort_by, db.proximo_cursor(primeira))
+
+def casos_consultas():
+    conn = db.get_db_connection()
+    cliente = conn.execute("SELECT cliente_id FROM vendas WHERE cliente_id IS NOT NULL GROUP BY cliente_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    produto = conn.execute("SELECT produto_id FROM itens_venda GROUP BY produto_id ORDER BY COUNT(*) DESC LIMIT 1").fetchone()
+    yield "get_dashboard_stats", db.get_dashboard_stats
+    yield "get_unique_categories", db.get_unique_categories
+    yield "get_mais_vendidos_por_categoria[total]", db.get_mais_vendidos_por_categoria
+    for dias in db.JANELAS_MAIS_VENDIDOS:
+        yield f"get_mais_vendidos_por_categoria[{dias}d]", lambda dias=dias: db.get_mais_vendidos_por_categoria(dias=dias)
+    yield "buscar_clientes[nome]", lambda: db.buscar_clientes("silva")
+    yield "buscar_clientes[cpf]", lambda: db.buscar_clientes("123.4")
+    yield "buscar_clientes[lista]", lambda: db.buscar_clientes(limite=TAMANHO_PAGINA)
+    yield "get_devedores", lambda: db.get_devedores(page_size=TAMANHO_PAGINA)
+    if cliente:
+        yield "get_historico_compras[cliente_mais_ativo]", lambda: db.get_historico_compras(cliente[0])
+    if produto:
+        yield "get_produto_movimentacoes[produto_mais_vendido]", lambda: db.get_produto_movimentacoes(produto[0])
+        primeira = db.get_produto_movimentacoes(produto[0])
+        yield ("get_produto_movimentacoes[produto_mais_vendido][pagina_2]",
+               lambda: db.get_produto_movimentacoes(produto[0], cursor=db.proximo_cursor(primeira)))
+
+def casos_relatorios():
+    for periodo in ("hoje", "30d", "12m", "tudo"):
+        inicio, fim = relatorios.intervalo_rapido(periodo)
+        agrupamento = relatorios.agrupamento_sugerido(inicio, fim)
+        for detalhamento in (None, "categoria", "produto"):
+            yield (f"serie_vendas[{periodo}|{detalhamento or 'total'}]",
+                   lambda i=inicio, f=fim, a=agrupamento, d=detalhamento: relatorios.serie_vendas(i, f, a, d))
+
+def casos_analise():
+    # Cache completo antes das medições: os casos medem a análise, não a primeira carga
+    analise.atualizar_cache()
+    yield "analise.indicadores[tudo]", analise.indicadores
+    for dias in (30, 90, None):
+        yield f"resumo_analitico[{dias or 'tudo'}]", lambda dias=dias: analise.resumo_analitico(dias)
+
+def caso_registrar_venda():
+    """Vende 1 unidade de produtos com estoque folgado; altera o banco de benchmark."""
+    produtos = db.get_db_connection().execute(
+        "SELECT id, preco_venda FROM produtos WHERE ativo = 1 AND quantidade >= 100 LIMIT 200").fetchall()
+    if not produtos:
+        return None
+    proximo = iter(range(sys.maxsize))
+
+    def vender():
+        i = next(proximo)
+        linhas = [produtos[(i + k) % len(produtos)] for k in range(3)]
+        itens = [{"produto_id": p["id"], "quantidade": 1, "preco_unitario": p["preco_venda"]} for p in linhas]
+        db.registrar_venda(None, itens)
+    return vender
+
+def executar(caminho, repeticoes=20, filtro_nome=None, verbose=True):
+    db.DB_NAME = caminho
+    db.close_db_connections()
+    conn = db.get_db_connection()
+    contagens = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("produtos", "clientes", "vendas", "itens_venda")}
+
+    casos = list(casos_listagem()) + list(casos_consultas()) + list(casos_relatorios())
+    if analise.disponivel():
+        casos += list(casos_analise())
+    vender = caso_registrar_venda()
+    if vender:
+        casos.append(("registrar_venda[3_itens]", vender))
+    # O recálculo completo é caro; roda menos vezes
+    casos.append(("calcular_dashboard_stats", db.calcular_dashboard_stats))
+    if analise.disponivel():
+        casos.append(("analise.atualizar_cache[completo]", lambda: analise.atualizar_cache(reconstruir=True)))
+
+    resultados = {}
+    for nome, funcao in casos:
+        if filtro_nome and filtro_nome not in nome:
+            continue
+        n = max(3, repeticoes // 5) if nome in ("calcular_dashboard_stats", "analise.atualizar_cache[completo]") else repeticoes
+        resultados[nome] = medir(funcao, n)
+        if verbose:
+            r = resultados[nome]
+            print(f"{nome:<60} p50 {r['p50_ms']:>9.2f} ms  p95 {r['p95_ms']:>9.2f} ms")
+
+    return {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "banco": caminho,
+            "linhas": contagens,
+            "repeticoes": repeticoes,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+        },
+        "resultados": resultados,
+    }
+
+def comparar(atual, baseline, tolerancia=0.2):
+    """Lista os casos cujo p50 piorou mais que `tolerancia` em relação ao baseline."""
+    regressoes = []
+    for nome, r in atual["resultados"].items():
+        anterior = baseline["resultados"].get(nome)
+        if anterior and r["p50_ms"] > anterior["p50_ms"] * (1 + tolerancia):
+            regressoes.append((nome, anterior["p50_ms"], r["p50_ms"]))
+    return regressoes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa os benchmarks do database.py.")
+    parser.add_argument("--banco", default="bench_estoque.db")
+    parser.add_argument("--saida", help="grava os resultados em JSON")
+    parser.add_argument("--baseline", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita no p50 (0.2 = 20%%)")
+    parser.add_argument("--repeticoes", type=int, default=20)
+    parser.add_argument("--filtro", help="roda só os casos cujo nome contém este texto")
+    args = parser.parse_args(argv)
+
+    resultado = executar(args.banco, args.repeticoes, args.filtro)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {args.saida}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = comparar(resultado, json.load(f), args.tolerancia)
+        for nome, antes, depois in regressoes:
+            print(f"REGRESSÃO {nome}: {antes:.2f} ms -> {depois:.2f} ms")
+        if regressoes:
+            sys.exit(1)
+        print("Nenhuma regressão em relação ao baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import argparse
+import bisect
+import itertools
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import database as db
+
+# Gerador determinístico de dados sintéticos para os benchmarks.
+# A mesma semente (e a mesma data final) sempre produz o mesmo banco. As distribuições imitam uma
+# loja real: poucos produtos e clientes concentram a maior parte das vendas
+# (lei de potência), o movimento cresce ao longo do tempo e parte das vendas
+# fica pendente (fiado).
+
+TIPOS = ["Capinha", "Película", "Carregador", "Cabo", "Fone", "Suporte", "Caixa de Som", "Power Bank",
+         "Adaptador", "Smartwatch", "Pulseira", "Cartão de Memória", "Pen Drive", "Mouse", "Teclado"]
+MARCAS = ["Samsung", "Apple", "Motorola", "Xiaomi", "LG", "Asus", "Multilaser", "JBL", "Baseus", "Ugreen"]
+ADJETIVOS = ["Proteção", "Premium", "Turbo", "Slim", "Magnético", "Reforçado", "Transparente", "Anti-impacto",
+             "Sem Fio", "USB-C", "Lightning", "Original", "Compatível", "Pro", "Mini"]
+NOMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+         "Karina", "Lucas", "Mariana", "Nicolas", "Otávio", "Paula", "Rafael", "Sofia", "Thiago", "Vitória"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima",
+              "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Castro"]
+
+TAMANHO_LOTE = 20000
+ITENS_POR_VENDA = (1, 2, 3, 4, 5, 8)
+PESOS_ITENS_POR_VENDA = (40, 25, 15, 10, 6, 4)
+
+def _pesos_acumulados(n, expoente):
+    # Popularidade do item de posição k proporcional a 1 / k^expoente
+    return list(itertools.accumulate(1.0 / (k ** expoente) for k in range(1, n + 1)))
+
+def _sorteador(rng, pesos_acumulados):
+    total = pesos_acumulados[-1]
+    return lambda: bisect.bisect_left(pesos_acumulados, rng.random() * total)
+
+def _em_lotes(linhas, tamanho=TAMANHO_LOTE):
+    iterador = iter(linhas)
+    while lote := list(itertools.islice(iterador, tamanho)):
+        yield lote
+
+def gerar_produtos(rng, n):
+    for i in range(1, n + 1):
+        tipo = rng.choice(TIPOS)
+        marca = rng.choice(MARCAS)
+        preco_compra = round(rng.lognormvariate(3.0, 0.8), 2)
+        yield (
+            i,
+            f"{tipo} {rng.choice(ADJETIVOS)} {marca} {rng.randint(1, 999)}",
+            tipo,
+            round(preco_compra * rng.uniform(1.3, 2.5), 2),
+            preco_compra,
+            0 if rng.random() < 0.05 else rng.randint(1, 200),
+            0 if rng.random() < 0.05 else 1,
+            f"789{i:010d}",
+            f"{tipo} {marca} de alta qualidade",
+            f"Distribuidora {rng.randint(1, 50)}",
+        )
+
+def gerar_clientes(rng, n):
+    for i in range(1, n + 1):
+        yield (
+            i,
+            f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}",
+            f"(11) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+            f"{rng.randint(0, 999_999_999_99):011d}",
+            f"cliente{i}@exemplo.com",
+        )
+
+def gerar_vendas(rng, n_itens, n_produtos, n_clientes, precos, fim, anos=3):
+    """Gera (venda, itens) em ordem cronológica até somar n_itens itens. precos: (venda, compra) por produto."""
+    sortear_produto = _sorteador(rng, _pesos_acumulados(n_produtos, 1.1))
+    sortear_cliente = _sorteador(rng, _pesos_acumulados(n_clientes, 0.8))
+    inicio = fim - timedelta(days=365 * anos)
+    segundos_totais = 365 * anos * 86400
+
+    # Quantidade esperada de vendas, para distribuir as datas
+    media_itens = sum(n * p for n, p in zip(ITENS_POR_VENDA, PESOS_ITENS_POR_VENDA)) / sum(PESOS_ITENS_POR_VENDA)
+    n_vendas = max(1, round(n_itens / media_itens))
+    venda_id = item_id = 0
+    while item_id < n_itens:
+        venda_id += 1
+        # Movimento cresce com o tempo: mais vendas perto do fim do período
+        fracao = min(1.0, (venda_id / n_vendas) ** 0.7)
+        data = inicio + timedelta(seconds=int(fracao * segundos_totais))
+        cliente_id = None if rng.random() < 0.3 else sortear_cliente() + 1
+        status = 'PENDENTE' if cliente_id and rng.random() < 0.15 else 'PAGO'
+
+        n = rng.choices(ITENS_POR_VENDA, weights=PESOS_ITENS_POR_VENDA)[0]
+        itens = []
+        for _ in range(min(n, n_itens - item_id)):
+            item_id += 1
+            produto_id = sortear_produto() + 1
+            quantidade = rng.choices((1, 2, 3, 5), weights=(75, 15, 7, 3))[0]
+            preco_venda, preco_compra = precos[produto_id - 1]
+            itens.append((item_id, venda_id, produto_id, quantidade, preco_venda, preco_compra))
+        total = round(sum(q * p for _, _, _, q, p, _ in itens), 2)
+        yield (venda_id, cliente_id, total, status, data.strftime("%Y-%m-%d %H:%M:%S")), itens
+
+def gerar_banco(caminho, produtos=200_000, clientes=50_000, itens=2_000_000, semente=42, fim=None, verbose=True):
+    """Cria (do zero) um banco sintético em `caminho`. As vendas terminam em `fim` (padrão: hoje)."""
+    fim = fim or datetime.combine(date.today(), datetime.min.time())
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    db.DB_NAME = caminho
+    db.close_db_connections()
+    db.init_db()
+    rng = random.Random(semente)
+
+    def log(msg):
+        if verbose:
+            print(msg)
+
+    inicio = time.perf_counter()
+    precos = []
+    for lote in _em_lotes(gerar_produtos(rng, produtos)):
+        precos.extend((p[3], p[4]) for p in lote)
+        with db.transacao() as conn:
+            conn.executemany(
+                "INSERT INTO produtos (id, nome, categoria, preco_venda, preco_compra, quantidade, ativo, codigo_barras, descricao, fornecedor) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", lote)
+    log(f"{produtos} produtos gerados")
+
+    for lote in _em_lotes(gerar_clientes(rng, clientes)):
+        with db.transacao() as conn:
+            conn.executemany(
+                "INSERT INTO clientes (id, nome, telefone, cpf, email, busca_nome, cpf_digitos, telefone_digitos) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", [(*c, *db.chaves_busca_cliente(c[1], c[2], c[3])) for c in lote])
+    log(f"{clientes} clientes gerados")
+
+    gravados = 0
+    for lote in _em_lotes(gerar_vendas(rng, itens, produtos, clientes, precos, fim), TAMANHO_LOTE // 3):
+        with db.transacao() as conn:
+            conn.executemany("INSERT INTO vendas (id, cliente_id, total, status, data) VALUES (?, ?, ?, ?, ?)", [v for v, _ in lote])
+            linhas = [item for _, itens_venda in lote for item in itens_venda]
+            conn.executemany("INSERT INTO itens_venda (id, venda_id, produto_id, quantidade, preco_unitario, custo_unitario) "
+                               "VALUES (?, ?, ?, ?, ?, ?)", linhas)
+        gravados += len(linhas)
+        log(f"  {gravados}/{itens} itens de venda...")
+
+    # Itens inseridos direto no SQL: o histórico de estoque é reconstituído das vendas
+    db.preencher_movimentacoes()
+    log("Movimentações de estoque geradas")
+    db.reconstruir_total_vendido()
+    log("Contadores de mais vendidos calculados")
+
+    db.get_db_connection().execute("ANALYZE")
+    log(f"Banco sintético gerado em {time.perf_counter() - inicio:.1f}s: {caminho}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera um banco sintético determinístico para benchmarks.")
+    parser.add_argument("--banco", default="bench_estoque.db")
+    parser.add_argument("--produtos", type=int, default=200_000)
+    parser.add_argument("--clientes", type=int, default=50_000)
+    parser.add_argument("--itens", type=int, default=2_000_000, help="linhas de itens_venda")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--fim", type=datetime.fromisoformat, help="data da última venda (AAAA-MM-DD, padrão: hoje)")
+    args = parser.parse_args(argv)
+    gerar_banco(args.banco, args.produtos, args.clientes, args.itens, args.semente, args.fim)
+
+if __name__ == "__main__":
+    main()
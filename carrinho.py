@@ -0,0 +1,166 @@
+import copy
+
+# Carrinho do Caixa indexado por produto_id.
+# O total é mantido a cada alteração (sem somar tudo de novo) e cada mudança
+# gera um evento para os ouvintes, que atualizam só a linha afetada:
+#   ("adicionado", item), ("alterado", item), ("removido", item), ("limpo", None)
+
+class ItemCarrinho:
+    def __init__(self, produto_id, nome, preco_unitario, quantidade=1, desconto=0.0):
+        self.produto_id = produto_id
+        self.nome = nome
+        self.preco_unitario = preco_unitario
+        self.quantidade = quantidade
+        self.desconto = desconto  # em R$, sobre a linha inteira
+
+    @property
+    def bruto(self):
+        return self.quantidade * self.preco_unitario
+
+    @property
+    def subtotal(self):
+        return round(self.bruto - self.desconto, 2)
+
+class Carrinho:
+    """
+    Uso:
+        carrinho = Carrinho()
+        carrinho.ouvir(lambda evento, item: ...)
+        carrinho.adicionar(produto['id'], produto['nome'], produto['preco_venda'])
+        registrar_venda(cliente_id, carrinho.itens_venda())
+    """
+
+    LIMITE_DESFAZER = 100
+
+    def __init__(self):
+        self._itens = {}
+        self._total = 0.0
+        self._ouvintes = []
+        self._desfazer = []  # cada passo: lista de (produto_id, cópia do item antes da mudança ou None)
+
+    # --- Consulta ---------------------------------------------------------
+
+    @property
+    def total(self):
+        return round(self._total, 2)
+
+    def __len__(self):
+        return len(self._itens)
+
+    def __iter__(self):
+        return iter(self._itens.values())
+
+    def __contains__(self, produto_id):
+        return produto_id in self._itens
+
+    def get(self, produto_id):
+        return self._itens.get(produto_id)
+
+    def pode_desfazer(self):
+        return bool(self._desfazer)
+
+    def itens_venda(self):
+        """
+        Itens no formato de registrar_venda; o desconto da linha entra no preço
+        unitário, em centavos. Se o subtotal não se divide igualmente pelas
+        unidades, a linha é gravada em duas (preços com um centavo de diferença)
+        para que quantidade * preço some exatamente o subtotal exibido.
+        """
+        itens = []
+        for item in self._itens.values():
+            centavos = round(item.subtotal * 100)
+            preco, sobra = divmod(centavos, item.quantidade)
+            if item.quantidade - sobra:
+                itens.append({'produto_id': item.produto_id, 'quantidade': item.quantidade - sobra, 'preco_unitario': preco / 100})
+            if sobra:
+                itens.append({'produto_id': item.produto_id, 'quantidade': sobra, 'preco_unitario': (preco + 1) / 100})
+        return itens
+
+    # --- Eventos ----------------------------------------------------------
+
+    def ouvir(self, ouvinte):
+        self._ouvintes.append(ouvinte)
+
+    def _emitir(self, evento, item):
+        for ouvinte in self._ouvintes:
+            ouvinte(evento, item)
+
+    # --- Alterações -------------------------------------------------------
+
+    def _guardar(self, *produto_ids):
+        self._desfazer.append([(pid, copy.copy(self._itens.get(pid))) for pid in produto_ids])
+        del self._desfazer[:-self.LIMITE_DESFAZER]
+
+    def _gravar(self, item, evento):
+        # Ajusta o total pela diferença do subtotal da linha
+        anterior = self._itens.get(item.produto_id)
+        self._total += item.subtotal - (anterior.subtotal if anterior else 0.0)
+        self._itens[item.produto_id] = item
+        self._emitir(evento, item)
+
+    def _retirar(self, produto_id):
+        item = self._itens.pop(produto_id)
+        self._total -= item.subtotal
+        self._emitir("removido", item)
+
+    def adicionar(self, produto_id, nome, preco_unitario, quantidade=1):
+        atual = self._itens.get(produto_id)
+        self._guardar(produto_id)
+        if atual:
+            self.alterar_quantidade(produto_id, atual.quantidade + quantidade, desfazivel=False)
+        else:
+            self._gravar(ItemCarrinho(produto_id, nome, preco_unitario, quantidade), "adicionado")
+
+    def alterar_quantidade(self, produto_id, quantidade, desfazivel=True):
+        """Quantidade zero (ou negativa) retira o item."""
+        atual = self._itens[produto_id]
+        if quantidade == atual.quantidade:
+            return
+        if desfazivel:
+            self._guardar(produto_id)
+        if quantidade <= 0:
+            self._retirar(produto_id)
+            return
+        item = copy.copy(atual)
+        item.quantidade = quantidade
+        item.desconto = min(item.desconto, item.bruto)
+        self._gravar(item, "alterado")
+
+    def alterar_desconto(self, produto_id, desconto):
+        """Desconto em R$ sobre a linha, limitado ao valor da linha."""
+        atual = self._itens[produto_id]
+        desconto = max(0.0, min(round(float(desconto), 2), atual.bruto))
+        if desconto == atual.desconto:
+            return
+        self._guardar(produto_id)
+        item = copy.copy(atual)
+        item.desconto = desconto
+        self._gravar(item, "alterado")
+
+    def remover(self, produto_id):
+        if produto_id in self._itens:
+            self._guardar(produto_id)
+            self._retirar(produto_id)
+
+    def limpar(self, desfazivel=True):
+        """Esvazia o carrinho. Depois de uma venda use desfazivel=False (zera o histórico)."""
+        if desfazivel and self._itens:
+            self._guardar(*self._itens)
+        else:
+            self._desfazer.clear()
+        self._itens.clear()
+        self._total = 0.0
+        self._emitir("limpo", None)
+
+    def desfazer(self):
+        """Volta a última alteração; retorna False se não houver o que desfazer."""
+        if not self._desfazer:
+            return False
+        for produto_id, anterior in self._desfazer.pop():
+            if anterior is None:
+                if produto_id in self._itens:
+                    self._retirar(produto_id)
+            else:
+                evento = "alterado" if produto_id in self._itens else "adicionado"
+                self._gravar(anterior, evento)
+        return True
@@ -0,0 +1,200 @@
+import http.client
+import json
+import os
+import threading
+from datetime import date
+from urllib.parse import urlsplit
+
+import relatorios as _relatorios
+from database import (CAMPOS_EDITAVEIS, CLIENTES_POR_BUSCA, CodigoBarrasDuplicadoError, ConflitoVersao,
+                      EstoqueInsuficienteError, JANELAS_MAIS_VENDIDOS, TIPOS_MOVIMENTO, normalizar_busca, proximo_cursor, somente_digitos)
+
+# Cliente do servidor.py: mesmas funções que a interface usa do database.py,
+# executadas no servidor. Linhas voltam como Linha (índice ou nome de coluna,
+# como sqlite3.Row) e os erros do servidor são relançados com o tipo original.
+# Usado pela interface quando ESTOQUE_SERVIDOR=http://host:porta (ver dados.py).
+
+SERVIDOR = os.environ.get("ESTOQUE_SERVIDOR", "http://127.0.0.1:8765")
+TIMEOUT = 15  # segundos
+
+class ServidorIndisponivelError(ConnectionError):
+    """Não foi possível falar com o servidor.py."""
+
+class ErroServidor(Exception):
+    """Erro inesperado dentro do servidor (HTTP 500)."""
+
+class Linha(tuple):
+    """Linha vinda do servidor: acessível por índice ou por nome de coluna, como sqlite3.Row."""
+
+    def __new__(cls, indices, valores):
+        linha = super().__new__(cls, valores)
+        linha._indices = indices
+        return linha
+
+    def __getitem__(self, chave):
+        if isinstance(chave, str):
+            chave = self._indices[chave]
+        return tuple.__getitem__(self, chave)
+
+    def keys(self):
+        return list(self._indices)
+
+def decodificar(valor):
+    if isinstance(valor, dict):
+        if "__linhas__" in valor:
+            colunas, linhas = valor["__linhas__"]
+            indices = {coluna: i for i, coluna in enumerate(colunas)}
+            return [Linha(indices, linha) for linha in linhas]
+        if "__linha__" in valor:
+            colunas, linha = valor["__linha__"]
+            return Linha({coluna: i for i, coluna in enumerate(colunas)}, linha)
+        return {chave: decodificar(v) for chave, v in valor.items()}
+    if isinstance(valor, list):
+        return [decodificar(v) for v in valor]
+    return valor
+
+def _relancar(erro):
+    tipo, mensagem, dados = erro.get("tipo"), erro.get("mensagem", ""), erro.get("dados") or {}
+    if tipo == "EstoqueInsuficienteError":
+        excecao = EstoqueInsuficienteError(dados.get("faltas", []))
+        excecao.indice_venda = dados.get("indice_venda")
+        raise excecao
+    if tipo == "ConflitoVersao":
+        raise ConflitoVersao(dados.get("produto_id"), decodificar(dados.get("produto")))
+    if tipo == "CodigoBarrasDuplicadoError":
+        raise CodigoBarrasDuplicadoError(dados.get("codigo_barras"))
+    if tipo == "ValueError":
+        raise ValueError(mensagem)
+    if tipo == "TypeError":
+        raise TypeError(mensagem)
+    raise ErroServidor(f"{tipo}: {mensagem}")
+
+# Uma conexão HTTP (keep-alive) por thread, como o pool do database.py
+_local = threading.local()
+
+def _conexao():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        url = urlsplit(SERVIDOR)
+        conn = _local.conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=TIMEOUT)
+    return conn
+
+def _descartar_conexao():
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+def _requisitar(metodo, caminho, corpo=None, repetivel=True):
+    cabecalhos = {"Content-Type": "application/json"} if corpo is not None else {}
+    for tentativa in (1, 2):
+        conn = _conexao()
+        try:
+            conn.request(metodo, caminho, body=corpo, headers=cabecalhos)
+        except OSError as e:
+            # Falhou antes de o servidor receber o pedido: pode repetir numa conexão nova
+            _descartar_conexao()
+            if tentativa == 2:
+                raise ServidorIndisponivelError(f"Servidor {SERVIDOR} indisponível: {e}") from e
+            continue
+        try:
+            resposta = conn.getresponse()
+            return resposta.status, json.loads(resposta.read() or b"{}")
+        except (OSError, http.client.HTTPException) as e:
+            _descartar_conexao()
+            # Escritas não são repetidas: o servidor pode ter gravado antes de a conexão cair
+            if tentativa == 2 or not repetivel:
+                raise ServidorIndisponivelError(f"Sem resposta do servidor {SERVIDOR}: {e}") from e
+
+_geracao_escrita = 0
+
+def _chamar(nome, args, kwargs, escrita):
+    global _geracao_escrita
+    corpo = json.dumps({"args": args, "kwargs": kwargs}, default=str).encode("utf-8")
+    status, resposta = _requisitar("POST", f"/api/{nome}", corpo, repetivel=not escrita)
+    if escrita and status != 404:
+        _geracao_escrita += 1
+    if "erro" in resposta:
+        _relancar(resposta["erro"])
+    return decodificar(resposta.get("resultado"))
+
+def _operacao(nome, escrita=False):
+    def chamar(*args, **kwargs):
+        return _chamar(nome, list(args), kwargs, escrita)
+    chamar.__name__ = nome
+    return chamar
+
+# --- Operações (mesmos nomes e argumentos do database.py) ----------------------
+
+get_produtos = _operacao("get_produtos")
+get_produto = _operacao("get_produto")
+contar_produtos = _operacao("contar_produtos")
+get_unique_categories = _operacao("get_unique_categories")
+get_fornecedores = _operacao("get_fornecedores")
+get_produto_movimentacoes = _operacao("get_produto_movimentacoes")
+buscar_por_codigo_barras = _operacao("buscar_por_codigo_barras")
+buscar_clientes = _operacao("buscar_clientes")
+get_clientes = _operacao("get_clientes")
+get_historico_compras = _operacao("get_historico_compras")
+get_devedores = _operacao("get_devedores")
+get_resumo_devedores = _operacao("get_resumo_devedores")
+get_saldo_cliente = _operacao("get_saldo_cliente")
+get_pagamentos = _operacao("get_pagamentos")
+get_dashboard_stats = _operacao("get_dashboard_stats")
+get_mais_vendidos = _operacao("get_mais_vendidos")
+get_mais_vendidos_por_categoria = _operacao("get_mais_vendidos_por_categoria")
+estatisticas_cache = _operacao("estatisticas_cache")
+
+add_produto = _operacao("add_produto", escrita=True)
+update_produto = _operacao("update_produto", escrita=True)
+ajustar_estoque = _operacao("ajustar_estoque", escrita=True)
+registrar_devolucao = _operacao("registrar_devolucao", escrita=True)
+delete_produto = _operacao("delete_produto", escrita=True)
+add_cliente = _operacao("add_cliente", escrita=True)
+delete_cliente = _operacao("delete_cliente", escrita=True)
+registrar_venda = _operacao("registrar_venda", escrita=True)
+registrar_vendas_em_lote = _operacao("registrar_vendas_em_lote", escrita=True)
+registrar_pagamento = _operacao("registrar_pagamento", escrita=True)
+quitar_divida = _operacao("quitar_divida", escrita=True)
+
+def saude():
+    status, resposta = _requisitar("GET", "/api/saude")
+    return resposta
+
+def init_db():
+    # O esquema é mantido pelo servidor; aqui só confere se ele responde
+    info = saude()
+    print(f"Usando o servidor {SERVIDOR} (banco {info['banco']}, esquema v{info['versao_esquema']})")
+
+def carregar_codigos_barras():
+    # O mapa de códigos de barras fica no servidor
+    pass
+
+def geracao_escrita():
+    """Escritas feitas por este terminal (a pré-carga descarta resultados anteriores a elas)."""
+    return _geracao_escrita
+
+class _Relatorios:
+    """Funções de relatorios.py usadas pela interface, com as consultas feitas no servidor."""
+    agrupamento_sugerido = staticmethod(_relatorios.agrupamento_sugerido)
+    serie_vendas = staticmethod(_operacao("serie_vendas"))
+    totais_periodo = staticmethod(_operacao("totais_periodo"))
+
+    @staticmethod
+    def primeira_venda():
+        dia = _chamar("primeira_venda", [], {}, False)
+        return date.fromisoformat(dia) if dia else None
+
+    def intervalo_rapido(self, nome, hoje=None):
+        if nome == "tudo":
+            hoje = hoje or date.today()
+            return self.primeira_venda() or hoje, hoje
+        return _relatorios.intervalo_rapido(nome, hoje)
+
+relatorios = _Relatorios()
+
+class _Analise:
+    """Funções de analise.py usadas pela interface (o cache do numpy fica no servidor)."""
+    resumo_analitico = staticmethod(_operacao("resumo_analitico"))
+
+analise = _Analise()
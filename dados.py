@@ -0,0 +1,15 @@
+import os
+
+# Origem dos dados da interface: com ESTOQUE_SERVIDOR=http://host:porta as
+# telas falam com o servidor.py (cliente_api.py), que compartilha um único
+# banco entre vários caixas; sem a variável, usam o database.py local.
+
+SERVIDOR = os.environ.get("ESTOQUE_SERVIDOR")
+
+if SERVIDOR:
+    from cliente_api import *
+    from cliente_api import analise, relatorios
+else:
+    from database import *
+    import analise
+    import relatorios
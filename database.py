@@ -1,111 +1,258 @@
+import random
+import re
 import sqlite3
-from datetime import datetime
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from profiler import ConexaoInstrumentada, instrumentado
 
 DB_NAME = "estoque_vendas.db"
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+# Configuração das conexões persistentes
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16384          # ~16 MiB de cache de páginas por conexão
+MMAP_SIZE = 256 * 1024 * 1024   # leitura via memória mapeada (256 MiB)
+# Se outro processo (ex.: servidor.py e um main.py local) segurar o lock de
+# escrita além do busy_timeout, o BEGIN IMMEDIATE é tentado de novo com espera
+# crescente em vez de falhar na primeira vez
+TENTATIVAS_OCUPADO = 4
+ESPERA_OCUPADO_S = 0.05
+
+# Pool por thread: cada thread mantém uma conexão aberta durante toda a vida
+# do app. Em modo WAL os leitores não bloqueiam o escritor (e vice-versa).
+_local = threading.local()
+_pool = []  # (thread, conexão) de todas as conexões abertas
+_pool_lock = threading.Lock()
+
+def _abrir_conexao():
+    # isolation_level=None: as transações são controladas explicitamente em transacao()
+    # ConexaoInstrumentada só anota o SQL quando o profiler está ligado (profiler.py)
+    conn = sqlite3.connect(DB_NAME, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None, check_same_thread=False,
+                           factory=ConexaoInstrumentada)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
-def init_db():
+def get_db_connection():
+    """Retorna a conexão persistente da thread atual, abrindo-a na primeira chamada."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.db_name == DB_NAME:
+        return conn
+
+    conn = _abrir_conexao()
+    _local.conn = conn
+    _local.db_name = DB_NAME
+    with _pool_lock:
+        # Descarta conexões de threads que já terminaram
+        vivas = []
+        for thread, c in _pool:
+            if thread.is_alive() and thread is not threading.current_thread():
+                vivas.append((thread, c))
+            else:
+                c.close()
+        vivas.append((threading.current_thread(), conn))
+        _pool[:] = vivas
+    return conn
+
+def close_db_connections():
+    """Fecha todas as conexões do pool (ao encerrar o app ou trocar de banco)."""
+    with _pool_lock:
+        for _, c in _pool:
+            c.close()
+        _pool.clear()
+    _local.__dict__.clear()
+    invalidar_cache()
+
+# Contador de transações de escrita concluídas neste processo: quem guarda um
+# resultado para usar depois (ex.: pré-carga das telas) sabe se ele ficou velho
+_geracao_escrita = 0
+
+def geracao_escrita():
+    return _geracao_escrita
+
+@contextmanager
+def transacao():
+    """
+    Abre uma transação de escrita (BEGIN IMMEDIATE) na conexão da thread.
+    Faz commit ao sair do bloco e rollback se ocorrer exceção.
+    Blocos aninhados participam da transação mais externa.
+    """
+    global _geracao_escrita
     conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Tabela Produtos
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS produtos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            categoria TEXT,
-            preco_venda REAL NOT NULL,
-            preco_compra REAL,
-            quantidade INTEGER NOT NULL,
-            ativo INTEGER DEFAULT 1,
-            foto TEXT,
-            codigo_barras TEXT,
-            descricao TEXT,
-            fornecedor TEXT
-        )
-    ''')
-
-    # Tabela Clientes
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS clientes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nome TEXT NOT NULL,
-            telefone TEXT,
-            cpf TEXT,
-            email TEXT
-        )
-    ''')
-
-    # Tabela Vendas
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS vendas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            cliente_id INTEGER,
-            total REAL NOT NULL,
-            status TEXT DEFAULT 'PAGO', -- 'PAGO' ou 'PENDENTE'
-            data DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (cliente_id) REFERENCES clientes (id)
-        )
-    ''')
-
-    # Tabela Itens da Venda
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS itens_venda (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            venda_id INTEGER,
-            produto_id INTEGER,
-            quantidade INTEGER NOT NULL,
-            preco_unitario REAL NOT NULL,
-            FOREIGN KEY (venda_id) REFERENCES vendas (id),
-            FOREIGN KEY (produto_id) REFERENCES produtos (id)
-        )
-    ''')
-    
+    if conn.in_transaction:
+        yield conn
+        return
+    _iniciar_escrita(conn)
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
     conn.commit()
-    conn.close()
+    _geracao_escrita += 1
+
+def _ocupado(erro):
+    # SQLITE_BUSY (5) / SQLITE_LOCKED (6), inclusive os códigos estendidos
+    codigo = getattr(erro, "sqlite_errorcode", None)
+    if codigo is not None:
+        return codigo & 0xFF in (5, 6)
+    return "locked" in str(erro) or "busy" in str(erro)
+
+def _iniciar_escrita(conn):
+    # Com BEGIN IMMEDIATE o lock de escrita é obtido logo no início: é o único
+    # comando da transação que pode encontrar o banco ocupado
+    for tentativa in range(TENTATIVAS_OCUPADO):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            return
+        except sqlite3.OperationalError as e:
+            if not _ocupado(e) or tentativa == TENTATIVAS_OCUPADO - 1:
+                raise
+            # Sem aviso por tentativa: a espera entra no tempo da função
+            # instrumentada, e as tentativas no SQL do log de consultas lentas
+            time.sleep(ESPERA_OCUPADO_S * 2 ** tentativa * random.uniform(0.5, 1.5))
+
+def init_db():
+    # O esquema é criado e atualizado pelas migrações versionadas (migrate_db.py)
+    from migrate_db import aplicar_migracoes
+    aplicar_migracoes()
+
+# Cache de dados de referência (categorias, fornecedores, lista de clientes).
+# Mudam raramente e são lidos a cada carga de tela: ficam em memória até que
+# uma função de escrita os invalide (sempre depois do commit). A geração
+# impede que uma leitura iniciada antes da invalidação grave dado antigo.
+_cache = {}
+_cache_lock = threading.Lock()
+_cache_geracao = 0
+_cache_contadores = {"acertos": 0, "faltas": 0}
+_leitor_contadores = {"acertos": 0, "faltas": 0}  # leituras do leitor de código de barras, à parte
+
+def _referencia(chave, carregar):
+    with _cache_lock:
+        if chave in _cache:
+            _cache_contadores["acertos"] += 1
+            return list(_cache[chave])
+        _cache_contadores["faltas"] += 1
+        geracao = _cache_geracao
+    valores = tuple(carregar())
+    with _cache_lock:
+        if geracao == _cache_geracao:
+            _cache[chave] = valores
+    return list(valores)
+
+def invalidar_cache(*chaves):
+    """Descarta as chaves informadas do cache de referência (todas, se nenhuma for informada)."""
+    global _cache_geracao
+    with _cache_lock:
+        _cache_geracao += 1
+        for chave in chaves or list(_cache):
+            _cache.pop(chave, None)
+
+def estatisticas_cache():
+    """Acertos, faltas e chaves carregadas do cache de referência, e as leituras do leitor de código de barras."""
+    with _cache_lock:
+        return {**_cache_contadores, "chaves": sorted(_cache), "leitor": dict(_leitor_contadores)}
 
 # Funções CRUD para Produtos
+class CodigoBarrasDuplicadoError(Exception):
+    """O código de barras informado já pertence a outro produto."""
+    def __init__(self, codigo_barras):
+        super().__init__(f"Código de barras {codigo_barras} já cadastrado em outro produto.")
+        self.codigo_barras = codigo_barras
+
+class ConflitoVersao(Exception):
+    """O produto foi alterado desde que foi lido. `produto` é a linha atual (None se foi excluído)."""
+    def __init__(self, produto_id, produto):
+        if produto is None:
+            mensagem = "Este produto foi excluído por outra pessoa."
+        else:
+            mensagem = "Este produto foi alterado por outra pessoa enquanto você editava. Os dados foram recarregados: confira e salve de novo."
+        super().__init__(mensagem)
+        self.produto_id = produto_id
+        self.produto = produto
+
+def _codigo_barras_duplicado(erro):
+    # Só a violação do índice único de codigo_barras é código duplicado; NOT NULL e outras sobem como estão
+    return "produtos.codigo_barras" in str(erro)
+
+def _normalizar_codigo(codigo_barras):
+    # Código vazio é gravado como NULL: o índice único aceita vários NULL, mas não vários ''
+    return (codigo_barras or "").strip() or None
+
+@instrumentado
 def add_produto(nome, categoria, preco_venda, preco_compra, quantidade, ativo=1, foto="", codigo_barras="", descricao="", fornecedor=""):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO produtos (nome, categoria, preco_venda, preco_compra, quantidade, ativo, foto, codigo_barras, descricao, fornecedor) 
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (nome, categoria, preco_venda, preco_compra, quantidade, ativo, foto, codigo_barras, descricao, fornecedor))
-    conn.commit()
-    conn.close()
+    codigo_barras = _normalizar_codigo(codigo_barras)
+    try:
+        with transacao() as conn:
+            cursor = conn.execute('''
+                INSERT INTO produtos (nome, categoria, preco_venda, preco_compra, quantidade, ativo, foto, codigo_barras, descricao, fornecedor) 
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (nome, categoria, preco_venda, preco_compra, quantidade, ativo, foto, codigo_barras, descricao, fornecedor))
+            if quantidade:
+                _registrar_movimentos(conn, [(cursor.lastrowid, "ENTRADA", quantidade, None, "Cadastro do produto")])
+    except sqlite3.IntegrityError as e:
+        if not _codigo_barras_duplicado(e):
+            raise
+        raise CodigoBarrasDuplicadoError(codigo_barras)
+    invalidar_cache("categorias", "fornecedores")
+    _atualizar_codigos_barras([cursor.lastrowid])
 
+@instrumentado
 def get_unique_categories():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL AND categoria != ''")
-    categories = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    return categories
+    def carregar():
+        conn = get_db_connection()
+        cursor = conn.execute("SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL AND categoria != '' ORDER BY categoria")
+        return [row[0] for row in cursor.fetchall()]
+    return _referencia("categorias", carregar)
 
-def get_produtos(search_term="", category=None, min_price=None, max_price=None, low_stock=False, out_of_stock=False, best_sellers=False, show_inactive=False, sort_by=None):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    query = "SELECT p.* FROM produtos p"
+@instrumentado
+def get_fornecedores():
+    def carregar():
+        conn = get_db_connection()
+        cursor = conn.execute("SELECT DISTINCT fornecedor FROM produtos WHERE fornecedor IS NOT NULL AND fornecedor != '' ORDER BY fornecedor")
+        return [row[0] for row in cursor.fetchall()]
+    return _referencia("fornecedores", carregar)
+
+# Pesos do bm25 por coluna do produtos_fts: nome, categoria, codigo_barras, descricao, fornecedor
+PESOS_BUSCA = (10.0, 2.0, 5.0, 1.0, 1.0)
+
+def _termo_fts(search_term):
+    """Converte o texto digitado numa consulta FTS5: cada palavra vira um prefixo ("capa"*)."""
+    palavras = re.findall(r"\w+", search_term or "")
+    return " ".join(f'"{p}"*' for p in palavras)
+
+# Ordenações da listagem: expressão SQL e direção. O id desempata, o que
+# torna a ordem total e permite paginar por cursor (keyset) sem pular linhas.
+ORDENACOES = {
+    'name_asc': ("p.nome", "ASC"),
+    'price_asc': ("p.preco_venda", "ASC"),
+    'stock_desc': ("p.quantidade", "DESC"),
+    'date_desc': ("p.id", "DESC"), # Data de cadastro (ID as proxy)
+    'best_sellers': ("p.total_vendido", "DESC"),  # contador mantido pela venda (índice ativo, total_vendido)
+}
+
+def _filtros_produtos(search_term="", category=None, min_price=None, max_price=None, low_stock=False, out_of_stock=False, show_inactive=False):
+    """Monta a origem (FROM), condições e parâmetros comuns à listagem e à contagem."""
+    origem = "produtos p"
     params = []
     conditions = []
 
-    # Join for best sellers if needed
-    if best_sellers or sort_by == 'best_sellers':
-        query = """
-            SELECT p.*, COALESCE(SUM(iv.quantidade), 0) as total_sold
-            FROM produtos p
-            LEFT JOIN itens_venda iv ON p.id = iv.produto_id
-        """
-
-    if search_term:
-        conditions.append("p.nome LIKE ?")
-        params.append(f'%{search_term}%')
+    # Busca textual pelo índice FTS5 (nome, categoria, código, descrição, fornecedor)
+    termo_fts = _termo_fts(search_term)
+    if termo_fts:
+        # CROSS JOIN fixa o índice FTS como laço externo; sem isso o planejador
+        # pode preferir varrer produtos pelo índice de ativo e consultar o FTS linha a linha
+        origem = "produtos_fts CROSS JOIN produtos p ON p.id = produtos_fts.rowid"
+        conditions.append("produtos_fts MATCH ?")
+        params.append(termo_fts)
     
     if category:
         conditions.append("p.categoria = ?")
@@ -130,218 +277,994 @@ def get_produtos(search_term="", category=None, min_price=None, max_price=None,
     elif show_inactive == "only_inactive":
         conditions.append("p.ativo = 0")
 
-    if conditions:
-        query += " WHERE " + " AND ".join(conditions)
-        
-    # Group by if we joined
-    if best_sellers or sort_by == 'best_sellers':
-        query += " GROUP BY p.id"
+    return origem, conditions, params, termo_fts
+
+@instrumentado
+def get_produtos(search_term="", category=None, min_price=None, max_price=None, low_stock=False, out_of_stock=False, best_sellers=False, show_inactive=False, sort_by=None, cursor=None, page_size=None):
+    """
+    Lista produtos com filtros e ordenação.
+    Com page_size, retorna no máximo page_size linhas; para a página seguinte
+    passe cursor=proximo_cursor(pagina_anterior).
+    """
+    conn = get_db_connection()
+    query, params = _consulta_produtos(search_term, category, min_price, max_price, low_stock, out_of_stock, best_sellers, show_inactive, sort_by, cursor, page_size)
+    return conn.execute(query, params).fetchall()
+
+@instrumentado
+def iter_produtos(tamanho_lote=500, **filtros):
+    """Mesmo resultado de get_produtos(**filtros), lido em blocos (fetchmany) para exportações."""
+    query, params = _consulta_produtos(**filtros)
+    yield from _iterar(query, params, tamanho_lote)
+
+def _iterar(query, params=(), tamanho_lote=500):
+    # Gerador: mantém em memória só um bloco de linhas por vez
+    cursor = get_db_connection().execute(query, params)
+    try:
+        while True:
+            linhas = cursor.fetchmany(tamanho_lote)
+            if not linhas:
+                break
+            yield from linhas
+    finally:
+        cursor.close()
+
+def _consulta_produtos(search_term="", category=None, min_price=None, max_price=None, low_stock=False, out_of_stock=False, best_sellers=False, show_inactive=False, sort_by=None, cursor=None, page_size=None):
+    origem, conditions, params, termo_fts = _filtros_produtos(search_term, category, min_price, max_price, low_stock, out_of_stock, show_inactive)
 
     # Sorting Logic
-    if sort_by == 'name_asc':
-        query += " ORDER BY p.nome ASC"
-    elif sort_by == 'price_asc':
-        query += " ORDER BY p.preco_venda ASC"
-    elif sort_by == 'stock_desc':
-        query += " ORDER BY p.quantidade DESC"
-    elif sort_by == 'date_desc': # Data de cadastro (ID as proxy)
-        query += " ORDER BY p.id DESC"
+    if sort_by in ORDENACOES:
+        chave, direcao = ORDENACOES[sort_by]
     elif best_sellers: # Fallback for the checkbox if no specific sort
-        query += " ORDER BY total_sold DESC"
+        chave, direcao = ORDENACOES['best_sellers']
+    elif termo_fts: # Busca sem ordenação escolhida: mais relevantes primeiro
+        chave, direcao = f"bm25(produtos_fts, {', '.join(map(str, PESOS_BUSCA))})", "ASC"
     else:
-        query += " ORDER BY p.nome ASC" # Default sort
+        chave, direcao = "p.nome", "ASC" # Default sort
+
+    query = f"SELECT p.*, {chave} as ordem FROM {origem}"
+
+    # Keyset: continua a partir da última linha da página anterior
+    if cursor is not None:
+        operador = ">" if direcao == "ASC" else "<"
+        conditions.append(f"(ordem, p.id) {operador} (?, ?)")
+        params.extend(cursor)
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+
+    query += f" ORDER BY ordem {direcao}, p.id {direcao}"
+    if page_size:
+        query += " LIMIT ?"
+        params.append(page_size)
     
-    cursor.execute(query, params)
-    produtos = cursor.fetchall()
-    conn.close()
-    return produtos
+    return query, params
+
+def proximo_cursor(produtos):
+    """Cursor para buscar a página seguinte à lista de produtos (ou de devedores) informada."""
+    if not produtos:
+        return None
+    ultimo = produtos[-1]
+    return (ultimo['ordem'], ultimo['id'])
 
-def update_produto(id, nome, categoria, preco_venda, preco_compra, quantidade, ativo=1, foto="", codigo_barras="", descricao="", fornecedor=""):
+@instrumentado
+def contar_produtos(search_term="", category=None, min_price=None, max_price=None, low_stock=False, out_of_stock=False, show_inactive=False, **_):
+    """Total de produtos que atendem aos filtros (sem ordenar nem juntar vendas)."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        UPDATE produtos 
-        SET nome = ?, categoria = ?, preco_venda = ?, preco_compra = ?, quantidade = ?, ativo = ?, foto = ?, codigo_barras = ?, descricao = ?, fornecedor = ?
-        WHERE id = ?
-    ''', (nome, categoria, preco_venda, preco_compra, quantidade, ativo, foto, codigo_barras, descricao, fornecedor, id))
-    conn.commit()
-    conn.close()
+    origem, conditions, params, _termo = _filtros_produtos(search_term, category, min_price, max_price, low_stock, out_of_stock, show_inactive)
+    query = f"SELECT COUNT(*) FROM {origem}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    return conn.execute(query, params).fetchone()[0]
 
-def get_produto_movimentacoes(produto_id):
+@instrumentado
+def get_produto(id):
+    return get_db_connection().execute("SELECT * FROM produtos WHERE id = ?", (id,)).fetchone()
+
+# Mais vendidos: produtos.total_vendido (migração 15) é somado pela própria
+# venda (_baixar_estoque) e lido pelos índices (ativo, total_vendido) e
+# (categoria, ativo, total_vendido). As janelas de 7/30/90 dias somam o
+# resumo diário vendas_dia_produto, no máximo 90 dias por consulta.
+JANELAS_MAIS_VENDIDOS = (7, 30, 90)
+
+def _inicio_janela(dias):
+    if dias not in JANELAS_MAIS_VENDIDOS:
+        raise ValueError(f"janela inválida: {dias} (use {', '.join(map(str, JANELAS_MAIS_VENDIDOS))})")
+    return (datetime.now().date() - timedelta(days=dias - 1)).isoformat()
+
+@instrumentado
+def get_mais_vendidos(categoria=None, dias=None, limite=10):
+    """
+    Produtos ativos mais vendidos (id, nome, categoria, preco_venda, quantidade, vendido).
+    dias: None para o total desde o início, ou 7, 30 ou 90 para os últimos dias.
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT v.data, v.id, c.nome, iv.quantidade, iv.preco_unitario, v.status
-        FROM itens_venda iv
-        JOIN vendas v ON iv.venda_id = v.id
-        LEFT JOIN clientes c ON v.cliente_id = c.id
-        WHERE iv.produto_id = ?
-        ORDER BY v.data DESC
-        LIMIT 50
-    ''', (produto_id,))
-    movimentacoes = cursor.fetchall()
-    conn.close()
-    return movimentacoes
+    filtro = "AND p.categoria = ?" if categoria else ""
+    if dias is None:
+        params = [categoria] if categoria else []
+        return conn.execute(f'''
+            SELECT p.id, p.nome, p.categoria, p.preco_venda, p.quantidade, p.total_vendido AS vendido
+            FROM produtos p
+            WHERE p.ativo = 1 {filtro} AND p.total_vendido > 0
+            ORDER BY p.total_vendido DESC, p.id DESC
+            LIMIT ?
+        ''', [*params, limite]).fetchall()
+    params = [_inicio_janela(dias)] + ([categoria] if categoria else [])
+    return conn.execute(f'''
+        SELECT p.id, p.nome, p.categoria, p.preco_venda, p.quantidade, x.vendido
+        FROM (SELECT produto_id, SUM(quantidade) AS vendido FROM vendas_dia_produto WHERE dia >= ? GROUP BY produto_id) x
+        JOIN produtos p ON p.id = x.produto_id
+        WHERE p.ativo = 1 {filtro} AND x.vendido > 0
+        ORDER BY x.vendido DESC, p.id DESC
+        LIMIT ?
+    ''', [*params, limite]).fetchall()
 
-def delete_produto(id):
+@instrumentado
+def get_mais_vendidos_por_categoria(limite=3, dias=None):
+    """{categoria: linhas de get_mais_vendidos} com os `limite` mais vendidos de cada categoria."""
+    if dias is None:
+        # Uma leitura curta pelo índice (categoria, ativo, total_vendido) por categoria
+        ranking = {categoria: get_mais_vendidos(categoria, None, limite) for categoria in get_unique_categories()}
+        return {categoria: linhas for categoria, linhas in ranking.items() if linhas}
+    # Janela: uma única passada no resumo diário, numerada por categoria
+    linhas = get_db_connection().execute('''
+        SELECT id, nome, categoria, preco_venda, quantidade, vendido FROM (
+            SELECT p.id, p.nome, p.categoria, p.preco_venda, p.quantidade, x.vendido,
+                   ROW_NUMBER() OVER (PARTITION BY p.categoria ORDER BY x.vendido DESC, p.id DESC) AS posicao
+            FROM (SELECT produto_id, SUM(quantidade) AS vendido FROM vendas_dia_produto WHERE dia >= ? GROUP BY produto_id) x
+            JOIN produtos p ON p.id = x.produto_id
+            WHERE p.ativo = 1 AND p.categoria IS NOT NULL AND p.categoria != '' AND x.vendido > 0
+        )
+        WHERE posicao <= ?
+        ORDER BY categoria, posicao
+    ''', (_inicio_janela(dias), limite)).fetchall()
+    ranking = {}
+    for linha in linhas:
+        ranking.setdefault(linha['categoria'], []).append(linha)
+    return ranking
+
+# Edição concorrente: produtos.versao (migração 12) é incrementada a cada
+# alteração de cadastro. update_produto só grava se a versão ainda for a lida
+# (compare-and-swap) e altera apenas os campos informados; o estoque nunca é
+# sobrescrito, só ajustado por diferença (vendas e ajustes não mudam a versão).
+CAMPOS_EDITAVEIS = ("nome", "categoria", "preco_venda", "preco_compra", "ativo", "foto", "codigo_barras", "descricao", "fornecedor")
+
+@instrumentado
+def update_produto(id, versao, ajuste_estoque=0, **alteracoes):
+    """
+    Grava as alterações (campos de CAMPOS_EDITAVEIS) se o produto ainda estiver
+    na `versao` lida; senão levanta ConflitoVersao com a linha atual.
+    ajuste_estoque soma (ou subtrai) da quantidade atual na mesma transação.
+    Retorna a nova versão.
+    """
+    invalidos = set(alteracoes) - set(CAMPOS_EDITAVEIS)
+    if invalidos:
+        raise ValueError(f"Campos não editáveis: {', '.join(sorted(invalidos))}")
+    if 'codigo_barras' in alteracoes:
+        alteracoes['codigo_barras'] = _normalizar_codigo(alteracoes['codigo_barras'])
+    atribuicoes = [f"{campo} = ?" for campo in alteracoes] + ["versao = versao + 1"]
+    try:
+        with transacao() as conn:
+            cursor = conn.execute(f"UPDATE produtos SET {', '.join(atribuicoes)} WHERE id = ? AND versao = ?",
+                                  [*alteracoes.values(), id, versao])
+            if cursor.rowcount == 0:
+                raise ConflitoVersao(id, conn.execute("SELECT * FROM produtos WHERE id = ?", (id,)).fetchone())
+            if ajuste_estoque:
+                _ajustar_estoque(conn, id, ajuste_estoque)
+    except sqlite3.IntegrityError as e:
+        if not _codigo_barras_duplicado(e):
+            raise
+        raise CodigoBarrasDuplicadoError(alteracoes.get('codigo_barras'))
+    if {'categoria', 'fornecedor'} & set(alteracoes):
+        invalidar_cache("categorias", "fornecedores")
+    _atualizar_codigos_barras([id])
+    return versao + 1
+
+def _ajustar_estoque(conn, produto_id, quantidade, tipo="AJUSTE", observacao=None, venda_id=None):
+    conn.execute("UPDATE produtos SET quantidade = quantidade + ? WHERE id = ? AND quantidade + ? >= 0",
+                 (quantidade, produto_id, quantidade))
+    if conn.execute("SELECT changes()").fetchone()[0] == 0:
+        raise EstoqueInsuficienteError(_faltas_estoque(conn, {produto_id: -quantidade}))
+    _registrar_movimentos(conn, [(produto_id, tipo, quantidade, venda_id, observacao)])
+
+@instrumentado
+def ajustar_estoque(produto_id, quantidade, tipo="AJUSTE", observacao=None):
+    """
+    Soma `quantidade` (negativa para baixar) ao estoque atual, sem depender do
+    valor lido antes. tipo: 'ENTRADA' (reposição) ou 'AJUSTE' (correção/inventário).
+    Levanta EstoqueInsuficienteError se o estoque ficaria negativo.
+    """
+    if tipo not in ("ENTRADA", "AJUSTE"):
+        raise ValueError(f"Tipo de ajuste inválido: {tipo}")
+    with transacao() as conn:
+        _ajustar_estoque(conn, produto_id, quantidade, tipo, observacao)
+
+def _id_por_codigo_barras(conn, codigo_barras):
+    row = conn.execute("SELECT id FROM produtos WHERE codigo_barras = ?", (codigo_barras,)).fetchone()
+    return row['id'] if row else None
+
+@instrumentado
+def importar_produtos_lote(produtos):
+    """
+    Insere ou atualiza (pelo código de barras) um lote de produtos numa transação.
+    produtos: lista de dicionários com as colunas da tabela produtos.
+    Campos ausentes do dicionário, ou vazios (None/''), não são alterados nos
+    produtos existentes; produtos novos precisam de nome e preco_venda, e
+    preco_compra e quantidade começam em 0 se não vierem.
+    Retorna (inseridos, atualizados, [(indice, motivo), ...] dos rejeitados).
+    """
+    inseridos = atualizados = 0
+    rejeitados = []
+    with transacao() as conn:
+        for indice, produto in enumerate(produtos):
+            if 'codigo_barras' in produto:
+                produto = {**produto, 'codigo_barras': _normalizar_codigo(produto['codigo_barras'])}
+            produto = {c: v for c, v in produto.items() if v is not None and v != ''}
+            produto_id = _id_por_codigo_barras(conn, produto['codigo_barras']) if produto.get('codigo_barras') else None
+            colunas = list(produto)
+            if produto_id:
+                anterior = conn.execute("SELECT quantidade FROM produtos WHERE id = ?", (produto_id,)).fetchone()[0]
+                conn.execute(
+                    f"UPDATE produtos SET {', '.join([*(f'{c} = ?' for c in colunas), 'versao = versao + 1'])} WHERE id = ?",
+                    [produto[c] for c in colunas] + [produto_id]
+                )
+                if 'quantidade' in produto and produto['quantidade'] != anterior:
+                    _registrar_movimentos(conn, [(produto_id, "AJUSTE", produto['quantidade'] - anterior, None, "Importação")])
+                atualizados += 1
+            elif not produto.get('nome') or produto.get('preco_venda') is None:
+                rejeitados.append((indice, "produto novo sem 'nome' ou 'preco_venda'"))
+            else:
+                colunas += [c for c in ('preco_compra', 'quantidade') if c not in produto]
+                cursor = conn.execute(
+                    f"INSERT INTO produtos ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+                    [produto.get(c, 0) for c in colunas]
+                )
+                if produto.get('quantidade'):
+                    _registrar_movimentos(conn, [(cursor.lastrowid, "ENTRADA", produto['quantidade'], None, "Importação")])
+                inseridos += 1
+    invalidar_cache("categorias", "fornecedores", "codigos_barras")
+    return inseridos, atualizados, rejeitados
+
+# Movimentações de estoque (migração 13): registro só de inclusão com cada
+# entrada, venda, ajuste e devolução, a quantidade com sinal e o saldo do
+# produto logo depois. Toda função que altera produtos.quantidade grava aqui na
+# mesma transação, então a soma das movimentações é o estoque atual.
+TIPOS_MOVIMENTO = {
+    "SALDO_INICIAL": "Saldo inicial",
+    "ENTRADA": "Entrada",
+    "VENDA": "Venda",
+    "AJUSTE": "Ajuste",
+    "DEVOLUCAO": "Devolução",
+}
+MOVIMENTACOES_POR_PAGINA = 50
+
+def _registrar_movimentos(conn, movimentos, data=None):
+    """movimentos: [(produto_id, tipo, quantidade, venda_id, observacao)], gravados depois de alterar o estoque."""
+    conn.executemany('''
+        INSERT INTO movimentacoes_estoque (produto_id, data, tipo, quantidade, saldo, venda_id, observacao)
+        VALUES (?, COALESCE(?, CURRENT_TIMESTAMP), ?, ?, (SELECT quantidade FROM produtos WHERE id = ?), ?, ?)
+    ''', [(produto_id, data, tipo, quantidade, produto_id, venda_id, observacao)
+          for produto_id, tipo, quantidade, venda_id, observacao in movimentos])
+
+@instrumentado
+def get_produto_movimentacoes(produto_id, cursor=None, page_size=MOVIMENTACOES_POR_PAGINA):
+    """
+    Movimentações do produto, da mais recente para a mais antiga, page_size por vez.
+    Para a página seguinte passe cursor=proximo_cursor(pagina_anterior).
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM produtos WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    condicao = ""
+    params = [produto_id]
+    if cursor is not None:
+        condicao = "AND (m.data, m.id) < (?, ?)"
+        params.extend(cursor)
+    params.append(page_size)
+    consulta = '''
+        SELECT m.id, m.data, m.tipo, m.quantidade, m.saldo, m.venda_id, m.observacao, c.nome AS cliente, m.data AS ordem
+        FROM movimentacoes_estoque m
+        LEFT JOIN vendas v ON v.id = m.venda_id
+        LEFT JOIN clientes c ON c.id = {cliente}
+        WHERE m.produto_id = ? {condicao}
+        ORDER BY m.data DESC, m.id DESC
+        LIMIT ?
+    '''
+    rows = conn.execute(consulta.format(cliente="v.cliente_id", condicao=condicao), params).fetchall()
+
+    # As movimentações ficam sempre no banco principal, mas a venda pode ter
+    # sido arquivada: o cliente vem dos arquivos do período da página, lido um
+    # arquivo por vez para uma tabela temporária (vendas arquivadas não mudam)
+    from arquivamento import limite_arquivo, particoes
+    sem_cliente = [r['venda_id'] for r in rows if r['venda_id'] is not None and r['cliente'] is None]
+    if sem_cliente:
+        limite = limite_arquivo(conn)
+        if limite and rows[-1]['data'] <= limite:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS clientes_vendas_arquivadas (venda_id INTEGER PRIMARY KEY, cliente_id INTEGER)")
+            marcadores = ", ".join("?" * len(sem_cliente))
+            fim = datetime.fromisoformat(rows[0]['data'][:10]) + timedelta(days=1)
+            for esquema in particoes(conn, rows[-1]['data'][:10], str(fim)):
+                if esquema != "main":
+                    conn.execute(f'''
+                        INSERT OR IGNORE INTO temp.clientes_vendas_arquivadas
+                        SELECT id, cliente_id FROM {esquema}.vendas WHERE id IN ({marcadores})
+                    ''', sem_cliente)
+            cliente = "COALESCE(v.cliente_id, (SELECT cliente_id FROM temp.clientes_vendas_arquivadas WHERE venda_id = m.venda_id))"
+            rows = conn.execute(consulta.format(cliente=cliente, condicao=condicao), params).fetchall()
+    return rows
+
+def _itens_vendidos(conn, venda_id):
+    # {produto_id: quantidade} da venda, no banco principal ou, se ela foi
+    # arquivada, no arquivo anual dela (anexado fora de transação; vendas
+    # arquivadas não mudam, então a leitura pode ficar fora da devolução)
+    from arquivamento import particoes
+    consulta = "SELECT produto_id, SUM(quantidade) FROM {esquema}.itens_venda WHERE venda_id = ? GROUP BY produto_id"
+    if conn.execute("SELECT 1 FROM vendas WHERE id = ?", (venda_id,)).fetchone():
+        return dict(conn.execute(consulta.format(esquema="main"), (venda_id,)).fetchall())
+    for esquema in particoes(conn):
+        if esquema != "main" and conn.execute(f"SELECT 1 FROM {esquema}.vendas WHERE id = ?", (venda_id,)).fetchone():
+            return dict(conn.execute(consulta.format(esquema=esquema), (venda_id,)).fetchall())
+    raise ValueError(f"Venda #{venda_id} não encontrada.")
+
+@instrumentado
+def registrar_devolucao(venda_id, itens, observacao=None):
+    """
+    Devolve ao estoque itens de uma venda. itens: [{'produto_id', 'quantidade'}].
+    Não aceita devolver mais do que foi vendido (descontadas as devoluções
+    anteriores). O valor da venda não é alterado.
+    """
+    vendidos = _itens_vendidos(get_db_connection(), venda_id)
+    with transacao() as conn:
+        for item in itens:
+            vendido = vendidos.get(item['produto_id'], 0)
+            devolvido = conn.execute(
+                "SELECT COALESCE(SUM(quantidade), 0) FROM movimentacoes_estoque WHERE venda_id = ? AND produto_id = ? AND tipo = 'DEVOLUCAO'",
+                (venda_id, item['produto_id'])).fetchone()[0]
+            if not 0 < item['quantidade'] <= vendido - devolvido:
+                raise ValueError(f"Produto #{item['produto_id']}: só {vendido - devolvido} unidade(s) da venda #{venda_id} podem ser devolvidas.")
+            _ajustar_estoque(conn, item['produto_id'], item['quantidade'], "DEVOLUCAO", observacao, venda_id)
+
+def preencher_movimentacoes(produto_inicio=0, produto_fim=None):
+    """
+    Cria o histórico dos produtos que ainda não têm movimentações (bancos
+    anteriores à migração 13 ou gerados direto no SQL): um saldo inicial na
+    data da primeira venda e uma movimentação por venda, com o saldo
+    reconstituído a partir do estoque atual.
+    """
+    faixa = (produto_inicio, produto_fim if produto_fim is not None else 2 ** 63 - 1)
+    with transacao() as conn:
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS produtos_sem_historico (id INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM temp.produtos_sem_historico")
+        conn.execute('''
+            INSERT INTO temp.produtos_sem_historico
+            SELECT id FROM produtos p
+            WHERE id BETWEEN ? AND ?
+              AND NOT EXISTS (SELECT 1 FROM movimentacoes_estoque m WHERE m.produto_id = p.id)
+        ''', faixa)
+        # Saldo inicial: estoque atual + tudo o que foi vendido desde a primeira venda
+        conn.execute('''
+            INSERT INTO movimentacoes_estoque (produto_id, data, tipo, quantidade, saldo, observacao)
+            SELECT p.id, COALESCE(MIN(v.data), CURRENT_TIMESTAMP), 'SALDO_INICIAL',
+                   p.quantidade + COALESCE(SUM(iv.quantidade), 0), p.quantidade + COALESCE(SUM(iv.quantidade), 0),
+                   'Reconstituído do histórico de vendas'
+            FROM temp.produtos_sem_historico s
+            JOIN produtos p ON p.id = s.id
+            LEFT JOIN itens_venda iv ON iv.produto_id = p.id
+            LEFT JOIN vendas v ON v.id = iv.venda_id
+            GROUP BY p.id
+            HAVING p.quantidade + COALESCE(SUM(iv.quantidade), 0) != 0
+        ''')
+        # Saldo depois de cada venda = estoque atual + o que foi vendido depois dela
+        conn.execute('''
+            INSERT INTO movimentacoes_estoque (produto_id, data, tipo, quantidade, saldo, venda_id)
+            SELECT iv.produto_id, v.data, 'VENDA', -SUM(iv.quantidade),
+                   p.quantidade + COALESCE(SUM(SUM(iv.quantidade)) OVER (
+                       PARTITION BY iv.produto_id ORDER BY v.data DESC, v.id DESC
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING), 0),
+                   v.id
+            FROM temp.produtos_sem_historico s
+            JOIN itens_venda iv ON iv.produto_id = s.id
+            JOIN vendas v ON v.id = iv.venda_id
+            JOIN produtos p ON p.id = iv.produto_id
+            GROUP BY iv.produto_id, v.id
+            ORDER BY v.data, v.id
+        ''')
+        conn.execute("DELETE FROM temp.produtos_sem_historico")
+
+@instrumentado
+def verificar_movimentacoes():
+    """Produtos cujo estoque difere da soma das movimentações: {produto_id: (quantidade, soma)}."""
+    rows = get_db_connection().execute('''
+        SELECT p.id, p.quantidade, COALESCE(SUM(m.quantidade), 0) AS soma
+        FROM produtos p
+        LEFT JOIN movimentacoes_estoque m ON m.produto_id = p.id
+        GROUP BY p.id
+        HAVING p.quantidade != soma
+    ''').fetchall()
+    return {r['id']: (r['quantidade'], r['soma']) for r in rows}
+
+def corrigir_movimentacoes():
+    """Grava um ajuste em cada produto divergente, igualando a soma das movimentações ao estoque."""
+    divergencias = verificar_movimentacoes()
+    with transacao() as conn:
+        _registrar_movimentos(conn, [(produto_id, "AJUSTE", quantidade - soma, None, "Correção de divergência")
+                                     for produto_id, (quantidade, soma) in divergencias.items()])
+    return len(divergencias)
+
+@instrumentado
+def delete_produto(id):
+    with transacao() as conn:
+        conn.execute('DELETE FROM produtos WHERE id = ?', (id,))
+    invalidar_cache("categorias", "fornecedores")
+    _atualizar_codigos_barras([id])
+
+# Leitor de código de barras: mapa código -> produto ativo em memória.
+# Carregado na abertura do app (carregar_codigos_barras) e ajustado produto a
+# produto pelas funções de escrita; a busca é uma consulta a um dicionário.
+CAMPOS_CODIGO_BARRAS = "id, nome, preco_venda, codigo_barras"
+
+@instrumentado
+def carregar_codigos_barras():
+    """(Re)carrega o mapa de códigos de barras dos produtos ativos."""
+    with _cache_lock:
+        geracao = _cache_geracao
+    rows = get_db_connection().execute(
+        f"SELECT {CAMPOS_CODIGO_BARRAS} FROM produtos WHERE ativo = 1 AND codigo_barras IS NOT NULL").fetchall()
+    por_codigo = {r['codigo_barras']: r for r in rows}
+    por_id = {r['id']: r['codigo_barras'] for r in rows}
+    with _cache_lock:
+        if geracao == _cache_geracao:
+            _cache["codigos_barras"] = (por_codigo, por_id)
+    return por_codigo, por_id
+
+def _atualizar_codigos_barras(ids):
+    # Relê só os produtos alterados (depois do commit) em vez de recarregar o mapa inteiro
+    global _cache_geracao
+    with _cache_lock:
+        # Uma carga completa iniciada antes desta escrita não pode mais ser gravada
+        _cache_geracao += 1
+        if "codigos_barras" not in _cache:
+            return
+    marcadores = ", ".join("?" * len(ids))
+    rows = get_db_connection().execute(
+        f"SELECT {CAMPOS_CODIGO_BARRAS} FROM produtos WHERE id IN ({marcadores}) AND ativo = 1 AND codigo_barras IS NOT NULL", ids).fetchall()
+    with _cache_lock:
+        if "codigos_barras" not in _cache:
+            return
+        por_codigo, por_id = _cache["codigos_barras"]
+        for produto_id in ids:
+            codigo = por_id.pop(produto_id, None)
+            if codigo is not None:
+                por_codigo.pop(codigo, None)
+        for r in rows:
+            por_codigo[r['codigo_barras']] = r
+            por_id[r['id']] = r['codigo_barras']
+
+@instrumentado
+def buscar_por_codigo_barras(codigo_barras):
+    """Produto ativo (id, nome, preco_venda, codigo_barras) com o código lido, ou None."""
+    codigo_barras = _normalizar_codigo(codigo_barras)
+    if codigo_barras is None:
+        return None
+    with _cache_lock:
+        mapa = _cache.get("codigos_barras")
+    produto = (mapa or carregar_codigos_barras())[0].get(codigo_barras)
+    with _cache_lock:
+        _leitor_contadores["acertos" if produto is not None else "faltas"] += 1
+    if produto is not None:
+        return produto
+    # Fora do mapa (ex.: gravado por outro processo): consulta pelo índice único
+    return get_db_connection().execute(
+        f"SELECT {CAMPOS_CODIGO_BARRAS} FROM produtos WHERE codigo_barras = ? AND ativo = 1", (codigo_barras,)).fetchone()
 
 # Funções CRUD para Clientes
+
+# Busca de clientes: início do nome sem acentos/maiúsculas (clientes.busca_nome)
+# ou dígitos do CPF/telefone (cpf_digitos, telefone_digitos), todos indexados
+# (migração 11) e preenchidos aqui a cada gravação.
+CLIENTES_POR_BUSCA = 20
+MIN_DIGITOS_BUSCA = 3
+
+def normalizar_busca(texto):
+    """Minúsculas, sem acentos e com espaços simples (chave de busca por nome)."""
+    texto = unicodedata.normalize("NFKD", texto or "")
+    return " ".join("".join(c for c in texto if not unicodedata.combining(c)).casefold().split())
+
+def somente_digitos(texto):
+    return re.sub(r"\D", "", texto or "")
+
+def chaves_busca_cliente(nome, telefone, cpf):
+    """(busca_nome, cpf_digitos, telefone_digitos) de um cliente."""
+    return normalizar_busca(nome), somente_digitos(cpf) or None, somente_digitos(telefone) or None
+
+def _faixa_prefixo(prefixo):
+    # coluna >= prefixo AND coluna < fim: busca por prefixo que usa o índice
+    return prefixo, prefixo[:-1] + chr(ord(prefixo[-1]) + 1)
+
+@instrumentado
 def add_cliente(nome, telefone, cpf, email):
+    with transacao() as conn:
+        conn.execute('''
+            INSERT INTO clientes (nome, telefone, cpf, email, busca_nome, cpf_digitos, telefone_digitos)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (nome, telefone, cpf, email, *chaves_busca_cliente(nome, telefone, cpf)))
+    invalidar_cache("clientes")
+
+@instrumentado
+def buscar_clientes(termo="", limite=CLIENTES_POR_BUSCA, cursor=None):
+    """
+    Clientes cujo nome começa com `termo` (ignorando acentos e maiúsculas) ou,
+    se o termo for numérico, cujo CPF/telefone começa com esses dígitos; CPF ou
+    telefone idêntico ao digitado vem primeiro, o resto em ordem de nome.
+    Sem termo, lista todos por nome. Retorna no máximo `limite` linhas; para a
+    página seguinte passe cursor=proximo_cursor(pagina_anterior).
+    """
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO clientes (nome, telefone, cpf, email) VALUES (?, ?, ?, ?)',
-                   (nome, telefone, cpf, email))
-    conn.commit()
-    conn.close()
+    nome = normalizar_busca(termo)
+    digitos = somente_digitos(termo)
+    conditions, params = [], []
+    ordem = "busca_nome"
+    if len(digitos) >= MIN_DIGITOS_BUSCA and not any(c.isalpha() for c in nome):
+        # Duas buscas por faixa de índice (CPF e telefone) combinadas pelo OR
+        conditions.append("((cpf_digitos >= ? AND cpf_digitos < ?) OR (telefone_digitos >= ? AND telefone_digitos < ?))")
+        params.extend(_faixa_prefixo(digitos) * 2)
+        ordem = "(CASE WHEN cpf_digitos = ? OR telefone_digitos = ? THEN '0' ELSE '1' END) || busca_nome"
+    elif nome:
+        conditions.append("busca_nome >= ? AND busca_nome < ?")
+        params.extend(_faixa_prefixo(nome))
 
+    query = f"SELECT *, {ordem} AS ordem FROM clientes"
+    params_ordem = [digitos, digitos] if ordem != "busca_nome" else []
+    if cursor is not None:
+        conditions.append(f"({ordem}, id) > (?, ?)")
+        params.extend(params_ordem)
+        params.extend(cursor)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY ordem, id"
+    if limite:
+        query += " LIMIT ?"
+        params.append(limite)
+    return conn.execute(query, params_ordem + params).fetchall()
+
+@instrumentado
 def get_clientes(search_term=""):
-    conn = get_db_connection()
-    cursor = conn.cursor()
     if search_term:
-        cursor.execute('SELECT * FROM clientes WHERE nome LIKE ? OR cpf LIKE ?', (f'%{search_term}%', f'%{search_term}%'))
-    else:
-        cursor.execute('SELECT * FROM clientes')
-    clientes = cursor.fetchall()
-    conn.close()
-    return clientes
+        return buscar_clientes(search_term, limite=None)
+    # A lista completa vem do cache
+    conn = get_db_connection()
+    return _referencia("clientes", lambda: conn.execute('SELECT * FROM clientes ORDER BY busca_nome, id').fetchall())
 
+@instrumentado
+def importar_clientes_lote(clientes):
+    """
+    Insere ou atualiza (pelo CPF, quando informado) um lote de clientes numa transação.
+    Retorna (inseridos, atualizados).
+    """
+    inseridos = atualizados = 0
+    with transacao() as conn:
+        for cliente in clientes:
+            chaves = chaves_busca_cliente(cliente['nome'], cliente.get('telefone', ''), cliente.get('cpf', ''))
+            row = conn.execute("SELECT id FROM clientes WHERE cpf = ?", (cliente['cpf'],)).fetchone() if cliente.get('cpf') else None
+            if row:
+                conn.execute('''
+                    UPDATE clientes SET nome = ?, telefone = ?, email = ?, busca_nome = ?, cpf_digitos = ?, telefone_digitos = ?
+                    WHERE id = ?
+                ''', (cliente['nome'], cliente.get('telefone', ''), cliente.get('email', ''), *chaves, row['id']))
+                atualizados += 1
+            else:
+                conn.execute('''
+                    INSERT INTO clientes (nome, telefone, cpf, email, busca_nome, cpf_digitos, telefone_digitos)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (cliente['nome'], cliente.get('telefone', ''), cliente.get('cpf', ''), cliente.get('email', ''), *chaves))
+                inseridos += 1
+    invalidar_cache("clientes")
+    return inseridos, atualizados
+
+@instrumentado
+def iter_clientes(tamanho_lote=500):
+    yield from _iterar("SELECT * FROM clientes ORDER BY id", (), tamanho_lote)
+
+@instrumentado
 def delete_cliente(id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM clientes WHERE id = ?', (id,))
-    conn.commit()
-    conn.close()
+    with transacao() as conn:
+        conn.execute('DELETE FROM clientes WHERE id = ?', (id,))
+    invalidar_cache("clientes")
 
 # Funções para Vendas
+class EstoqueInsuficienteError(Exception):
+    """Venda rejeitada por falta de estoque. `faltas` detalha cada produto em falta."""
+
+    def __init__(self, faltas):
+        # faltas: lista de {'produto_id', 'nome', 'solicitado', 'disponivel'}
+        self.faltas = faltas
+        self.indice_venda = None  # posição da venda rejeitada em registrar_vendas_em_lote
+        detalhes = ", ".join(f"{f['nome']} (pedido {f['solicitado']}, disponível {f['disponivel']})" for f in faltas)
+        super().__init__(f"Estoque insuficiente: {detalhes}")
+
+def _faltas_estoque(conn, baixas):
+    """Relatório dos produtos cujo estoque não cobre as baixas {produto_id: quantidade}."""
+    ids = list(baixas)
+    disponiveis = {
+        row['id']: row for row in conn.execute(
+            f"SELECT id, nome, quantidade FROM produtos WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+    }
+    faltas = []
+    for produto_id, solicitado in baixas.items():
+        row = disponiveis.get(produto_id)
+        disponivel = row['quantidade'] if row else 0
+        if disponivel < solicitado:
+            faltas.append({
+                'produto_id': produto_id,
+                'nome': row['nome'] if row else f"Produto #{produto_id}",
+                'solicitado': solicitado,
+                'disponivel': disponivel,
+            })
+    return faltas
+
+def _baixar_estoque(conn, baixas):
+    """
+    Baixa o estoque de todos os produtos da venda num único UPDATE, que também
+    soma a quantidade ao contador total_vendido (mais vendidos).
+    A condição quantidade >= baixa impede estoque negativo: se algum produto
+    não for atualizado, levanta EstoqueInsuficienteError (e a transação é desfeita).
+    """
+    valores = ", ".join("(?, ?)" for _ in baixas)
+    params = [v for par in baixas.items() for v in par]
+    conn.execute(f'''
+        WITH baixa (produto_id, quantidade) AS (VALUES {valores})
+        UPDATE produtos
+        SET quantidade = quantidade - (SELECT quantidade FROM baixa WHERE produto_id = produtos.id),
+            total_vendido = total_vendido + (SELECT quantidade FROM baixa WHERE produto_id = produtos.id)
+        WHERE id IN (SELECT produto_id FROM baixa)
+          AND quantidade >= (SELECT quantidade FROM baixa WHERE produto_id = produtos.id)
+    ''', params)
+    # cursor.rowcount não é preenchido para comandos iniciados por WITH
+    if conn.execute("SELECT changes()").fetchone()[0] != len(baixas):
+        raise EstoqueInsuficienteError(_faltas_estoque(conn, baixas))
+
+def _inserir_venda(conn, cliente_id, itens, status='PAGO', data=None):
+    # Calcular total
+    total = sum(item['quantidade'] * item['preco_unitario'] for item in itens)
+    
+    # Criar venda (vendas importadas/offline mantêm a data original)
+    if data:
+        cursor = conn.execute('INSERT INTO vendas (cliente_id, total, status, data) VALUES (?, ?, ?, ?)', (cliente_id, total, status, data))
+    else:
+        cursor = conn.execute('INSERT INTO vendas (cliente_id, total, status) VALUES (?, ?, ?)', (cliente_id, total, status))
+    venda_id = cursor.lastrowid
+    
+    # Inserir itens com o custo do produto neste momento (base do lucro; uma
+    # importação pode trazer o custo original em 'custo_unitario')
+    conn.executemany('''
+        INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario, custo_unitario)
+        VALUES (?, ?, ?, ?, COALESCE(?, (SELECT preco_compra FROM produtos WHERE id = ?), 0))
+    ''', [(venda_id, item['produto_id'], item['quantidade'], item['preco_unitario'], item.get('custo_unitario'), item['produto_id'])
+          for item in itens])
+    
+    # Baixar estoque (o mesmo produto pode aparecer em mais de uma linha)
+    baixas = {}
+    for item in itens:
+        baixas[item['produto_id']] = baixas.get(item['produto_id'], 0) + item['quantidade']
+    if baixas:
+        _baixar_estoque(conn, baixas)
+        data_venda = conn.execute("SELECT data FROM vendas WHERE id = ?", (venda_id,)).fetchone()[0]
+        _registrar_movimentos(conn, [(produto_id, "VENDA", -quantidade, venda_id, None)
+                                     for produto_id, quantidade in baixas.items()], data_venda)
+    return venda_id
+
+@instrumentado
 def registrar_venda(cliente_id, itens, status='PAGO'):
     """
     itens: lista de dicionários {'produto_id': int, 'quantidade': int, 'preco_unitario': float}
+           ('custo_unitario' opcional; por padrão, o preco_compra atual do produto)
     status: 'PAGO' ou 'PENDENTE'
+    Retorna o id da venda, ou False em caso de erro.
+    Levanta EstoqueInsuficienteError, sem gravar nada, se faltar estoque de algum item.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        # Calcular total
-        total = sum(item['quantidade'] * item['preco_unitario'] for item in itens)
-        
-        # Criar venda
-        cursor.execute('INSERT INTO vendas (cliente_id, total, status) VALUES (?, ?, ?)', (cliente_id, total, status))
-        venda_id = cursor.lastrowid
-        
-        # Inserir itens e atualizar estoque
-        for item in itens:
-            cursor.execute('''
-                INSERT INTO itens_venda (venda_id, produto_id, quantidade, preco_unitario)
-                VALUES (?, ?, ?, ?)
-            ''', (venda_id, item['produto_id'], item['quantidade'], item['preco_unitario']))
-            
-            # Baixar estoque
-            cursor.execute('''
-                UPDATE produtos SET quantidade = quantidade - ? WHERE id = ?
-            ''', (item['quantidade'], item['produto_id']))
-            
-        conn.commit()
-        return True
+        # BEGIN IMMEDIATE: a conferência e a baixa do estoque acontecem sob o lock de escrita
+        with transacao() as conn:
+            return _inserir_venda(conn, cliente_id, itens, status)
+    except EstoqueInsuficienteError:
+        raise
     except Exception as e:
         print(f"Erro ao registrar venda: {e}")
-        conn.rollback()
         return False
-    finally:
-        conn.close()
 
+@instrumentado
+def registrar_vendas_em_lote(vendas):
+    """
+    Grava várias vendas (ex.: sincronização de fim de dia ou importação) numa única transação.
+    vendas: lista de dicionários {'cliente_id', 'itens', 'status' (opcional), 'data' (opcional)}
+    Retorna a lista de ids das vendas. Se qualquer venda falhar nenhuma é gravada;
+    em falta de estoque, EstoqueInsuficienteError.indice_venda indica qual venda foi rejeitada.
+    """
+    ids = []
+    with transacao() as conn:
+        for indice, venda in enumerate(vendas):
+            try:
+                ids.append(_inserir_venda(conn, venda.get('cliente_id'), venda['itens'], venda.get('status', 'PAGO'), venda.get('data')))
+            except EstoqueInsuficienteError as e:
+                e.indice_venda = indice
+                raise
+    return ids
+
+@instrumentado
+def importar_vendas_lote(vendas):
+    """
+    Como registrar_vendas_em_lote, mas cada venda é isolada num SAVEPOINT:
+    uma venda inválida (ex.: sem estoque) é descartada sem derrubar o lote.
+    Itens podem informar 'codigo_barras' no lugar de 'produto_id'.
+    Retorna (ids_gravados, [(indice, motivo), ...]).
+    """
+    ids, rejeitadas = [], []
+    with transacao() as conn:
+        for indice, venda in enumerate(vendas):
+            conn.execute("SAVEPOINT venda_importada")
+            try:
+                itens = []
+                for item in venda['itens']:
+                    item = dict(item)
+                    if not item.get('produto_id'):
+                        item['produto_id'] = _id_por_codigo_barras(conn, item.get('codigo_barras'))
+                        if not item['produto_id']:
+                            raise ValueError(f"produto com código de barras '{item.get('codigo_barras')}' não encontrado")
+                    itens.append(item)
+                ids.append(_inserir_venda(conn, venda.get('cliente_id'), itens, venda.get('status', 'PAGO'), venda.get('data')))
+                conn.execute("RELEASE venda_importada")
+            except (EstoqueInsuficienteError, ValueError, sqlite3.IntegrityError) as e:
+                conn.execute("ROLLBACK TO venda_importada")
+                conn.execute("RELEASE venda_importada")
+                rejeitadas.append((indice, str(e)))
+    return ids, rejeitadas
+
+@instrumentado
+def iter_vendas_itens(data_inicio=None, data_fim=None, tamanho_lote=500):
+    """Uma linha por item vendido (com os dados da venda), em ordem de venda, lida em blocos."""
+    query = '''
+        SELECT v.id as venda, v.data, v.cliente_id, v.status, iv.produto_id, p.codigo_barras, iv.quantidade, iv.preco_unitario,
+               iv.custo_unitario
+        FROM {esquema}.vendas v
+        JOIN {esquema}.itens_venda iv ON iv.venda_id = v.id
+        LEFT JOIN produtos p ON p.id = iv.produto_id
+    '''
+    conditions, params = [], []
+    if data_inicio:
+        conditions.append("v.data >= ?")
+        params.append(data_inicio)
+    if data_fim:
+        conditions.append("v.data < ?")
+        params.append(data_fim)
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY v.id, iv.id"
+    # Vendas arquivadas do período primeiro (ano a ano), depois as do banco principal
+    from arquivamento import particoes
+    for esquema in particoes(get_db_connection(), data_inicio, data_fim):
+        yield from _iterar(query.format(esquema=esquema), params, tamanho_lote)
+
+@instrumentado
 def get_historico_compras(cliente_id):
+    # Vendas arquivadas só são lidas se o cliente tiver alguma (arquivamento.py)
+    from arquivamento import particoes
+    conn = get_db_connection()
+    linhas, lidas = [], 0
+    for esquema in particoes(conn, cliente_id=cliente_id):
+        lidas += 1
+        linhas.extend(conn.execute(f'''
+            SELECT v.id, v.total, v.data, v.status, GROUP_CONCAT(p.nome || ' x' || iv.quantidade, ', ') as itens, v.valor_pago
+            FROM {esquema}.vendas v
+            JOIN {esquema}.itens_venda iv ON v.id = iv.venda_id
+            JOIN produtos p ON iv.produto_id = p.id
+            WHERE v.cliente_id = ?
+            GROUP BY v.id
+            ORDER BY v.data DESC
+        ''', (cliente_id,)))
+    if lidas > 1:
+        linhas.sort(key=lambda l: l['data'], reverse=True)
+    return linhas
+
+# Faixas de atraso das vendas em aberto (dias desde a venda)
+FAIXAS_ATRASO = (("ate_30", 0, 30), ("de_31_a_60", 31, 60), ("acima_60", 61, None))
+# Diferença abaixo da qual uma venda é considerada quitada (arredondamento)
+TOLERANCIA_CENTAVOS = 0.005
+
+def _soma_atraso(minimo, maximo):
+    # Subconsulta por cliente; usa o índice (cliente_id, status, data)
+    condicoes = ["cliente_id = s.cliente_id", "status = 'PENDENTE'"]
+    if minimo:
+        condicoes.append(f"data < datetime('now', '-{minimo - 1} days')")
+    if maximo:
+        condicoes.append(f"data >= datetime('now', '-{maximo} days')")
+    return f"COALESCE((SELECT SUM(total - valor_pago) FROM vendas WHERE {' AND '.join(condicoes)}), 0)"
+
+@instrumentado
+def get_devedores(cursor=None, page_size=None):
+    """
+    Clientes com saldo devedor, do maior para o menor, lidos de saldos_clientes.
+    Cada linha traz id, nome, telefone, total_divida, as faixas de atraso
+    (ate_30, de_31_a_60, acima_60) e a data da venda em aberto mais antiga.
+    Com page_size, para a página seguinte passe cursor=proximo_cursor(pagina_anterior).
+    """
+    conn = get_db_connection()
+    # CROSS JOIN fixa saldos_clientes como tabela externa: a ordem vem do índice por saldo
+    faixas = ", ".join(f"{_soma_atraso(minimo, maximo)} AS {nome}" for nome, minimo, maximo in FAIXAS_ATRASO)
+    query = f'''
+        SELECT c.id, c.nome, c.telefone, s.saldo AS total_divida, {faixas},
+               s.vendas_abertas, s.venda_mais_antiga, s.saldo AS ordem
+        FROM saldos_clientes s
+        CROSS JOIN clientes c ON c.id = s.cliente_id
+    '''
+    params = []
+    if cursor is not None:
+        query += " WHERE (s.saldo, s.cliente_id) < (?, ?)"
+        params.extend(cursor)
+    query += " ORDER BY s.saldo DESC, s.cliente_id DESC"
+    if page_size:
+        query += " LIMIT ?"
+        params.append(page_size)
+    return conn.execute(query, params).fetchall()
+
+@instrumentado
+def get_resumo_devedores():
+    """Total a receber e quantidade de clientes devedores."""
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT v.id, v.total, v.data, v.status, GROUP_CONCAT(p.nome || ' x' || iv.quantidade, ', ') as itens
-        FROM vendas v
-        JOIN itens_venda iv ON v.id = iv.venda_id
-        JOIN produtos p ON iv.produto_id = p.id
-        WHERE v.cliente_id = ?
-        GROUP BY v.id
-        ORDER BY v.data DESC
-    ''', (cliente_id,))
-    historico = cursor.fetchall()
-    conn.close()
-    return historico
-
-def get_devedores():
+    return conn.execute("SELECT COUNT(*) AS clientes, COALESCE(SUM(saldo), 0) AS total FROM saldos_clientes").fetchone()
+
+@instrumentado
+def get_saldo_cliente(cliente_id):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT c.id, c.nome, c.telefone, SUM(v.total) as total_divida
-        FROM vendas v
-        JOIN clientes c ON v.cliente_id = c.id
-        WHERE v.status = 'PENDENTE'
-        GROUP BY c.id
-    ''')
-    devedores = cursor.fetchall()
-    conn.close()
-    return devedores
+    row = conn.execute("SELECT saldo FROM saldos_clientes WHERE cliente_id = ?", (cliente_id,)).fetchone()
+    return row['saldo'] if row else 0.0
+
+@instrumentado
+def registrar_pagamento(cliente_id, valor, observacao="", data=None):
+    """
+    Registra um pagamento do cliente e abate das vendas em aberto, da mais
+    antiga para a mais nova; vendas quitadas passam a PAGO.
+    Levanta ValueError se o valor não for positivo ou passar do saldo devedor.
+    Retorna o id do pagamento.
+    """
+    valor = round(float(valor), 2)
+    if valor <= 0:
+        raise ValueError("O valor do pagamento deve ser maior que zero.")
+    with transacao() as conn:
+        abertas = conn.execute('''
+            SELECT id, total - valor_pago AS aberto FROM vendas
+            WHERE cliente_id = ? AND status = 'PENDENTE'
+            ORDER BY data, id
+        ''', (cliente_id,)).fetchall()
+        saldo = sum(v['aberto'] for v in abertas)
+        if valor > saldo + TOLERANCIA_CENTAVOS:
+            raise ValueError(f"O valor do pagamento (R$ {valor:.2f}) é maior que o saldo devedor (R$ {saldo:.2f}).")
 
+        if data:
+            cursor = conn.execute("INSERT INTO pagamentos (cliente_id, valor, observacao, data) VALUES (?, ?, ?, ?)", (cliente_id, valor, observacao, data))
+        else:
+            cursor = conn.execute("INSERT INTO pagamentos (cliente_id, valor, observacao) VALUES (?, ?, ?)", (cliente_id, valor, observacao))
+        pagamento_id = cursor.lastrowid
+
+        restante = valor
+        alocacoes = []
+        for venda in abertas:
+            if restante <= TOLERANCIA_CENTAVOS:
+                break
+            parte = min(restante, venda['aberto'])
+            # O que sobrar abaixo de meio centavo é arredondamento: quita a venda
+            quitada = venda['aberto'] - parte <= TOLERANCIA_CENTAVOS
+            conn.execute(
+                "UPDATE vendas SET valor_pago = CASE WHEN ? THEN total ELSE valor_pago + ? END, "
+                "status = CASE WHEN ? THEN 'PAGO' ELSE status END WHERE id = ?",
+                (quitada, parte, quitada, venda['id']))
+            alocacoes.append((pagamento_id, venda['id'], round(parte, 2)))
+            restante -= parte
+        conn.executemany("INSERT INTO alocacoes (pagamento_id, venda_id, valor) VALUES (?, ?, ?)", alocacoes)
+    return pagamento_id
+
+@instrumentado
 def quitar_divida(cliente_id):
+    """Registra um pagamento do saldo devedor inteiro do cliente."""
+    with transacao():
+        saldo = get_saldo_cliente(cliente_id)
+        if saldo > TOLERANCIA_CENTAVOS:
+            return registrar_pagamento(cliente_id, saldo, "Quitação")
+    return None
+
+@instrumentado
+def get_pagamentos(cliente_id):
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("UPDATE vendas SET status = 'PAGO' WHERE cliente_id = ? AND status = 'PENDENTE'", (cliente_id,))
-    conn.commit()
-    conn.close()
+    return conn.execute('''
+        SELECT p.id, p.valor, p.data, p.observacao, COUNT(a.venda_id) AS vendas
+        FROM pagamentos p
+        LEFT JOIN alocacoes a ON a.pagamento_id = p.id
+        WHERE p.cliente_id = ?
+        GROUP BY p.id
+        ORDER BY p.data DESC, p.id DESC
+    ''', (cliente_id,)).fetchall()
+
+@instrumentado
+def verificar_saldos_clientes(tolerancia=0.005):
+    """Clientes cujo saldo em saldos_clientes diverge das vendas em aberto: {cliente_id: (resumo, recalculado)}."""
+    conn = get_db_connection()
+    linhas = conn.execute('''
+        SELECT cliente_id, SUM(resumo) AS resumo, SUM(recalculado) AS recalculado FROM (
+            SELECT cliente_id, saldo AS resumo, 0 AS recalculado FROM saldos_clientes
+            UNION ALL
+            SELECT cliente_id, 0, SUM(total - valor_pago) FROM vendas
+            WHERE status = 'PENDENTE' AND cliente_id IS NOT NULL GROUP BY cliente_id
+        ) GROUP BY cliente_id
+    ''').fetchall()
+    return {l['cliente_id']: (l['resumo'], l['recalculado']) for l in linhas if abs(l['resumo'] - l['recalculado']) > tolerancia}
 
+@instrumentado
+def reconstruir_saldos_clientes():
+    """Recalcula saldos_clientes do zero a partir das vendas em aberto."""
+    with transacao() as conn:
+        conn.execute("DELETE FROM saldos_clientes")
+        conn.execute('''
+            INSERT INTO saldos_clientes (cliente_id, saldo, vendas_abertas, venda_mais_antiga)
+            SELECT cliente_id, SUM(total - valor_pago), COUNT(*), MIN(data)
+            FROM vendas
+            WHERE status = 'PENDENTE' AND cliente_id IS NOT NULL
+            GROUP BY cliente_id
+        ''')
+
+@instrumentado
 def get_total_vendas():
     conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT SUM(total) as total_vendas FROM vendas')
-    result = cursor.fetchone()
+    result = conn.execute('SELECT SUM(total) as total_vendas FROM vendas').fetchone()
     total = result['total_vendas'] if result['total_vendas'] else 0.0
     
-    cursor.execute('SELECT SUM(quantidade) as total_itens FROM itens_venda')
-    result_itens = cursor.fetchone()
+    result_itens = conn.execute('SELECT SUM(quantidade) as total_itens FROM itens_venda').fetchone()
     total_itens = result_itens['total_itens'] if result_itens['total_itens'] else 0
     
-    conn.close()
     return total, total_itens
 
+# Campos do resumo_dashboard (mesma ordem das chaves retornadas pelo dashboard)
+CAMPOS_DASHBOARD = ("total_vendido", "total_itens", "total_investido", "lucro_liquido", "total_pendente")
+
+@instrumentado
 def get_dashboard_stats():
+    # Lê os totais mantidos incrementalmente pelos triggers (migração 5)
+    conn = get_db_connection()
+    row = conn.execute(f"SELECT {', '.join(CAMPOS_DASHBOARD)} FROM resumo_dashboard WHERE id = 1").fetchone()
+    return {campo: row[campo] for campo in CAMPOS_DASHBOARD}
+
+@instrumentado
+def calcular_dashboard_stats():
+    """Recalcula os totais do dashboard do zero, varrendo vendas, itens e produtos."""
     conn = get_db_connection()
-    cursor = conn.cursor()
     
     # Total Vendido (PAGO)
-    cursor.execute("SELECT SUM(total) FROM vendas WHERE status = 'PAGO'")
-    total_vendido = cursor.fetchone()[0] or 0.0
+    total_vendido = conn.execute("SELECT SUM(total) FROM vendas WHERE status = 'PAGO'").fetchone()[0] or 0.0
     
     # Total Itens Vendidos (PAGO)
-    cursor.execute('''
+    total_itens = conn.execute('''
         SELECT SUM(iv.quantidade)
         FROM itens_venda iv
         JOIN vendas v ON iv.venda_id = v.id
         WHERE v.status = 'PAGO'
-    ''')
-    total_itens = cursor.fetchone()[0] or 0
+    ''').fetchone()[0] or 0
     
     # Total Investido (Estoque Atual)
-    cursor.execute("SELECT SUM(preco_compra * quantidade) FROM produtos")
-    total_investido = cursor.fetchone()[0] or 0.0
+    total_investido = conn.execute("SELECT SUM(preco_compra * quantidade) FROM produtos").fetchone()[0] or 0.0
     
-    # Lucro Líquido (PAGO) - Estimado com base no custo atual
-    cursor.execute('''
-        SELECT SUM((iv.preco_unitario - p.preco_compra) * iv.quantidade)
+    # Lucro Líquido (PAGO) - pelo custo gravado no item na hora da venda
+    lucro_liquido = conn.execute('''
+        SELECT SUM((iv.preco_unitario - iv.custo_unitario) * iv.quantidade)
         FROM itens_venda iv
         JOIN vendas v ON iv.venda_id = v.id
-        JOIN produtos p ON iv.produto_id = p.id
         WHERE v.status = 'PAGO'
-    ''')
-    lucro_liquido = cursor.fetchone()[0] or 0.0
+    ''').fetchone()[0] or 0.0
     
-    # Total a Receber (PENDENTE)
-    cursor.execute("SELECT SUM(total) FROM vendas WHERE status = 'PENDENTE'")
-    total_pendente = cursor.fetchone()[0] or 0.0
+    # Total a Receber (PENDENTE, descontados os pagamentos parciais)
+    total_pendente = conn.execute("SELECT SUM(total - valor_pago) FROM vendas WHERE status = 'PENDENTE'").fetchone()[0] or 0.0
+
+    # Vendas arquivadas (todas PAGO): totais gravados ao arquivar (arquivamento.py)
+    arquivado = conn.execute("SELECT SUM(total), SUM(itens), SUM(lucro) FROM arquivos_vendas").fetchone()
+    total_vendido += arquivado[0] or 0.0
+    total_itens += arquivado[1] or 0
+    lucro_liquido += arquivado[2] or 0.0
     
-    conn.close()
     return {
         "total_vendido": total_vendido,
         "total_itens": total_itens,
@@ -349,3 +1272,60 @@ def get_dashboard_stats():
         "lucro_liquido": lucro_liquido,
         "total_pendente": total_pendente
     }
+
+@instrumentado
+def verificar_resumo_dashboard(tolerancia=0.005):
+    """
+    Compara o resumo_dashboard com os totais recalculados do zero.
+    Retorna {campo: (valor_no_resumo, valor_recalculado)} para cada divergência.
+    """
+    with transacao():
+        resumo = get_dashboard_stats()
+        recalculado = calcular_dashboard_stats()
+    return {
+        campo: (resumo[campo], recalculado[campo])
+        for campo in CAMPOS_DASHBOARD
+        if abs(resumo[campo] - recalculado[campo]) > tolerancia
+    }
+
+@instrumentado
+def reconstruir_resumo_dashboard():
+    """Regrava o resumo_dashboard com os totais recalculados do zero."""
+    with transacao() as conn:
+        stats = calcular_dashboard_stats()
+        conn.execute(
+            f"UPDATE resumo_dashboard SET {', '.join(f'{c} = ?' for c in CAMPOS_DASHBOARD)} WHERE id = 1",
+            [stats[c] for c in CAMPOS_DASHBOARD]
+        )
+    return stats
+
+# Total vendido por produto: itens do banco principal mais os totais diários
+# das vendas arquivadas (arquivamento.py)
+_VENDIDO_POR_PRODUTO = '''
+    SELECT produto_id, SUM(quantidade) AS vendido FROM (
+        SELECT produto_id, quantidade FROM itens_venda
+        UNION ALL
+        SELECT produto_id, quantidade FROM arquivos_vendas_dia_produto
+    )
+    GROUP BY produto_id
+'''
+
+@instrumentado
+def verificar_total_vendido():
+    """Produtos cujo contador total_vendido difere das vendas: {produto_id: (contador, recalculado)}."""
+    rows = get_db_connection().execute(f'''
+        SELECT p.id, p.total_vendido, COALESCE(t.vendido, 0) AS vendido
+        FROM produtos p
+        LEFT JOIN ({_VENDIDO_POR_PRODUTO}) t ON t.produto_id = p.id
+        WHERE p.total_vendido != COALESCE(t.vendido, 0)
+    ''').fetchall()
+    return {r['id']: (r['total_vendido'], r['vendido']) for r in rows}
+
+@instrumentado
+def reconstruir_total_vendido():
+    """Recalcula produtos.total_vendido de todos os produtos a partir das vendas."""
+    with transacao() as conn:
+        conn.execute(f'''
+            WITH t AS ({_VENDIDO_POR_PRODUTO})
+            UPDATE produtos SET total_vendido = COALESCE((SELECT vendido FROM t WHERE t.produto_id = produtos.id), 0)
+        ''')
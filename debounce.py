@@ -0,0 +1,76 @@
+import threading
+import time
+
+# Janela padrão (em segundos) sem novas teclas antes de disparar a busca
+DEBOUNCE_PADRAO = 0.3
+
+class Debouncer:
+    """
+    Executa `query` numa thread de trabalho depois de `delay` segundos sem
+    novas chamadas e entrega o resultado para `on_result`.
+
+    Cada chamada invalida as anteriores: consultas que ainda não começaram são
+    canceladas e resultados de consultas já em andamento são descartados, de
+    modo que só o resultado da chamada mais recente chega à interface.
+
+    Uso:
+        busca = Debouncer(lambda termo: get_produtos(termo), self.render, delay=0.3)
+        busca("capa")   # a cada tecla
+    """
+
+    def __init__(self, query, on_result, delay=DEBOUNCE_PADRAO):
+        self.query = query
+        self.on_result = on_result
+        self.delay = delay
+        self._cond = threading.Condition()
+        self._geracao = 0
+        self._pendente = None  # (geração, args, kwargs)
+        self._prazo = 0.0
+        self._thread = None
+
+    def __call__(self, *args, **kwargs):
+        with self._cond:
+            self._geracao += 1
+            self._pendente = (self._geracao, args, kwargs)
+            self._prazo = time.monotonic() + self.delay
+            if self._thread is None:
+                # Uma única thread por Debouncer: reaproveita a conexão do banco da thread
+                self._thread = threading.Thread(target=self._loop, name="debouncer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def cancel(self):
+        """Descarta a consulta pendente e o resultado de qualquer consulta em andamento."""
+        with self._cond:
+            self._geracao += 1
+            self._pendente = None
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._pendente is None:
+                    self._cond.wait()
+                # Espera a digitação "assentar": cada nova chamada adia o prazo
+                while self._pendente is not None:
+                    restante = self._prazo - time.monotonic()
+                    if restante <= 0:
+                        break
+                    self._cond.wait(restante)
+                if self._pendente is None:
+                    continue
+                geracao, args, kwargs = self._pendente
+                self._pendente = None
+
+            try:
+                resultado = self.query(*args, **kwargs)
+            except Exception as e:
+                print(f"Erro na busca: {e}")
+                continue
+
+            # Chegou uma chamada mais nova enquanto a consulta rodava: descarta
+            if geracao != self._geracao:
+                continue
+            try:
+                self.on_result(resultado)
+            except Exception as e:
+                print(f"Erro ao exibir resultado da busca: {e}")
@@ -0,0 +1,256 @@
+import hashlib
+import os
+import shutil
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow é opcional: sem ele, a foto baixada é usada sem reduzir
+    Image = None
+
+# Fotos dos produtos guardadas localmente em assets/imagens/cache.
+# A foto de um produto (URL ou arquivo local, como gravada em produtos.foto) é
+# baixada/copiada uma única vez; as miniaturas de tamanho fixo são geradas por
+# um pool de threads e servidas do disco. O cache tem tamanho máximo: quando
+# passa do limite, os arquivos usados há mais tempo são apagados (LRU, pela
+# data de modificação, atualizada a cada uso).
+#
+# Uso na interface:
+#   img = ft.Image(src=imagens.miniatura(p['foto'], "lista", ao_concluir=trocar_src), ...)
+# miniatura() responde na hora: o caminho da miniatura, se já existe, ou o
+# placeholder enquanto ela é gerada em segundo plano.
+
+PASTA_ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+PASTA_CACHE = os.path.join(PASTA_ASSETS, "imagens", "cache")
+PLACEHOLDER = "/imagens/sem_foto.svg"
+
+TAMANHOS = {"lista": 64, "detalhe": 300}  # lado (px) das miniaturas quadradas
+QUALIDADE_JPEG = 85
+LIMITE_CACHE_BYTES = int(float(os.environ.get("ESTOQUE_IMAGENS_MB", 200)) * 1024 * 1024)
+TIMEOUT_DOWNLOAD = 10           # segundos
+ESPERA_APOS_FALHA = 300         # não tenta baixar de novo a mesma foto antes disso (segundos)
+MAX_BYTES_FOTO = 20 * 1024 * 1024
+TRABALHADORES = 2
+
+_lock = threading.Lock()
+_executor = None
+_em_andamento = {}   # (chave, tamanho) -> Future
+_falhas = {}         # chave -> instante da última falha
+_arquivos = None     # caminho -> bytes, do menos para o mais recente (LRU)
+_total_bytes = 0
+
+def _chave(foto):
+    return hashlib.sha1(foto.strip().encode("utf-8")).hexdigest()
+
+def _caminho_original(chave):
+    return os.path.join(PASTA_CACHE, "originais", chave)
+
+def _caminho_miniatura(chave, tamanho):
+    extensao = "jpg" if Image is not None else "img"
+    return os.path.join(PASTA_CACHE, tamanho, f"{chave}.{extensao}")
+
+def _src(caminho):
+    # Caminho relativo a assets/, como o Flet espera em ft.Image(src=...)
+    return "/" + os.path.relpath(caminho, PASTA_ASSETS).replace(os.sep, "/")
+
+# --- Índice LRU ----------------------------------------------------------------
+
+def _carregar_indice():
+    # Chamado com _lock: lê o cache do disco, do arquivo usado há mais tempo ao mais recente
+    global _arquivos, _total_bytes
+    if _arquivos is not None:
+        return
+    encontrados = []
+    for raiz, _pastas, nomes in os.walk(PASTA_CACHE):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                info = os.stat(caminho)
+            except OSError:
+                continue
+            encontrados.append((info.st_mtime, caminho, info.st_size))
+    encontrados.sort()
+    _arquivos = OrderedDict((caminho, tamanho) for _, caminho, tamanho in encontrados)
+    _total_bytes = sum(_arquivos.values())
+
+def _usar(caminho):
+    """Marca o arquivo como usado agora (vai para o fim da fila de remoção)."""
+    with _lock:
+        _carregar_indice()
+        if caminho in _arquivos:
+            _arquivos.move_to_end(caminho)
+    try:
+        os.utime(caminho)
+    except OSError:
+        pass
+
+def _registrar(caminho):
+    """Inclui um arquivo novo no índice e apaga os mais antigos se o cache passar do limite."""
+    global _total_bytes
+    remover = []
+    with _lock:
+        _carregar_indice()
+        _total_bytes -= _arquivos.pop(caminho, 0)
+        _arquivos[caminho] = os.path.getsize(caminho)
+        _total_bytes += _arquivos[caminho]
+        while _total_bytes > LIMITE_CACHE_BYTES and len(_arquivos) > 1:
+            antigo, tamanho = _arquivos.popitem(last=False)
+            _total_bytes -= tamanho
+            remover.append(antigo)
+    for antigo in remover:
+        try:
+            os.remove(antigo)
+        except OSError:
+            pass
+
+def _descartar(caminho):
+    """Tira o arquivo do índice e do disco (ex.: original que não é uma imagem válida)."""
+    global _total_bytes
+    with _lock:
+        _carregar_indice()
+        _total_bytes -= _arquivos.pop(caminho, 0)
+    try:
+        os.remove(caminho)
+    except OSError:
+        pass
+
+def estatisticas():
+    with _lock:
+        _carregar_indice()
+        return {"arquivos": len(_arquivos), "bytes": _total_bytes, "limite_bytes": LIMITE_CACHE_BYTES,
+                "em_andamento": len(_em_andamento)}
+
+# --- Obtenção e miniaturas ---------------------------------------------------------
+
+def _gravar_atomico(destino, escrever):
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f"{destino}.{threading.get_ident()}.tmp"
+    try:
+        escrever(temporario)
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    _registrar(destino)
+
+def _baixar(foto, destino):
+    def escrever(temporario):
+        if foto.startswith(("http://", "https://")):
+            requisicao = urllib.request.Request(foto, headers={"User-Agent": "app-estoque-vendas"})
+            with urllib.request.urlopen(requisicao, timeout=TIMEOUT_DOWNLOAD) as resposta, open(temporario, "wb") as f:
+                dados = resposta.read(MAX_BYTES_FOTO + 1)
+                if len(dados) > MAX_BYTES_FOTO:
+                    raise ValueError("foto maior que o limite")
+                f.write(dados)
+        else:
+            shutil.copyfile(os.path.expanduser(foto), temporario)
+        if Image is not None:
+            # Página de erro/portal ou arquivo corrompido não entra no cache
+            with Image.open(temporario) as imagem:
+                imagem.verify()
+    _gravar_atomico(destino, escrever)
+
+def _original(foto, chave):
+    """Foto original no cache local, baixando/copiando se preciso."""
+    caminho = _caminho_original(chave)
+    if os.path.exists(caminho):
+        _usar(caminho)
+    else:
+        _baixar(foto.strip(), caminho)
+    return caminho
+
+def _gerar(foto, chave, tamanho):
+    destino = _caminho_miniatura(chave, tamanho)
+    if os.path.exists(destino):
+        return destino
+    original = _original(foto, chave)
+    lado = TAMANHOS[tamanho]
+
+    def escrever(temporario):
+        if Image is None:
+            shutil.copyfile(original, temporario)
+            return
+        with Image.open(original) as imagem:
+            imagem = ImageOps.exif_transpose(imagem)
+            if imagem.mode in ("RGBA", "LA", "P"):
+                imagem = imagem.convert("RGBA")
+                fundo = Image.new("RGB", imagem.size, "white")
+                fundo.paste(imagem, mask=imagem.split()[-1])
+                imagem = fundo
+            # Recorte central quadrado, como ImageFit.COVER
+            ImageOps.fit(imagem.convert("RGB"), (lado, lado), Image.LANCZOS).save(
+                temporario, "JPEG", quality=QUALIDADE_JPEG, optimize=True)
+    try:
+        _gravar_atomico(destino, escrever)
+    except Exception:
+        # Original ilegível (ex.: gravado antes da verificação no download):
+        # apagado para ser obtido de novo na próxima tentativa
+        _descartar(original)
+        raise
+    return destino
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=TRABALHADORES, thread_name_prefix="imagens")
+    return _executor
+
+def _concluir(futuro, chave, tamanho, ao_concluir):
+    with _lock:
+        _em_andamento.pop((chave, tamanho), None)
+    try:
+        src = _src(futuro.result())
+    except Exception as e:
+        print(f"Erro ao obter foto: {e}")
+        with _lock:
+            _falhas[chave] = time.monotonic()
+        src = PLACEHOLDER
+    if ao_concluir:
+        try:
+            ao_concluir(src)
+        except Exception as e:
+            print(f"Erro ao exibir foto: {e}")
+
+def miniatura(foto, tamanho="lista", ao_concluir=None):
+    """
+    src (relativo a assets/) da miniatura da foto no tamanho pedido.
+    Se ela ainda não existe, retorna o placeholder, gera a miniatura em
+    segundo plano e chama ao_concluir(src) quando estiver pronta.
+    """
+    if not foto or not foto.strip():
+        return PLACEHOLDER
+    chave = _chave(foto)
+    destino = _caminho_miniatura(chave, tamanho)
+    if os.path.exists(destino):
+        _usar(destino)
+        return _src(destino)
+
+    with _lock:
+        falha = _falhas.get(chave)
+        if falha is not None and time.monotonic() - falha < ESPERA_APOS_FALHA:
+            return PLACEHOLDER
+        futuro = _em_andamento.get((chave, tamanho))
+        if futuro is None:
+            futuro = _pool().submit(_gerar, foto, chave, tamanho)
+            _em_andamento[(chave, tamanho)] = futuro
+    futuro.add_done_callback(lambda f: _concluir(f, chave, tamanho, ao_concluir))
+    return PLACEHOLDER
+
+def preparar(fotos, tamanhos=("lista",)):
+    """Agenda as miniaturas de várias fotos (ex.: depois de importar produtos)."""
+    for foto in fotos:
+        for tamanho in tamanhos:
+            miniatura(foto, tamanho)
+
+def limpar():
+    """Apaga todo o cache de fotos e miniaturas."""
+    global _arquivos, _total_bytes
+    with _lock:
+        shutil.rmtree(PASTA_CACHE, ignore_errors=True)
+        _arquivos = OrderedDict()
+        _total_bytes = 0
+        _falhas.clear()
@@ -0,0 +1,326 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import os
+
+import database as db
+
+# Importação e exportação em fluxo (CSV ou JSONL).
+# Os arquivos são lidos linha a linha por geradores e gravados no banco em
+# lotes, então o uso de memória não depende do tamanho do arquivo.
+
+TAMANHO_LOTE_PADRAO = 1000
+
+# Colunas exportadas / aceitas na importação
+CAMPOS_PRODUTO = ["codigo_barras", "nome", "categoria", "preco_venda", "preco_compra", "quantidade", "ativo", "fornecedor", "descricao", "foto"]
+CAMPOS_CLIENTE = ["nome", "telefone", "cpf", "email"]
+CAMPOS_VENDA = ["venda", "data", "cliente_id", "status", "produto_id", "codigo_barras", "quantidade", "preco_unitario", "custo_unitario"]
+
+# Leitura ---------------------------------------------------------------------
+
+def _formato(caminho):
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    raise ValueError(f"Formato não suportado: {ext} (use .csv ou .jsonl)")
+
+def ler_registros(caminho):
+    """Gera (número da linha, dicionário) para cada registro do arquivo."""
+    if _formato(caminho) == "jsonl":
+        with open(caminho, encoding="utf-8") as f:
+            for numero, linha in enumerate(f, start=1):
+                if linha.strip():
+                    try:
+                        yield numero, json.loads(linha)
+                    except json.JSONDecodeError as e:
+                        yield numero, e
+    else:
+        with open(caminho, encoding="utf-8-sig", newline="") as f:
+            # Planilhas em português costumam exportar CSV separado por ';'
+            amostra = f.readline()
+            f.seek(0)
+            delimitador = ";" if amostra.count(";") > amostra.count(",") else ","
+            for numero, registro in enumerate(csv.DictReader(f, delimiter=delimitador), start=2):
+                yield numero, registro
+
+def em_lotes(iteravel, tamanho):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(itertools.islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+# Validação -------------------------------------------------------------------
+
+def _texto(valor):
+    return str(valor).strip() if valor is not None else ""
+
+def _numero(valor, campo, tipo=float, obrigatorio=False):
+    texto = _texto(valor)
+    if not texto:
+        if obrigatorio:
+            raise ValueError(f"campo '{campo}' é obrigatório")
+        return None
+    try:
+        # Aceita vírgula decimal ("10,50")
+        numero = float(texto.replace(",", "."))
+        if not math.isfinite(numero):
+            raise ValueError
+        return int(numero) if tipo is int else numero
+    except (ValueError, OverflowError):
+        raise ValueError(f"campo '{campo}' inválido: {texto!r}")
+
+def validar_produto(registro):
+    """
+    Normaliza um registro de produto; só inclui as colunas preenchidas no
+    arquivo (célula vazia é o mesmo que coluna ausente: não altera o produto).
+    """
+    if not _texto(registro.get("nome")) and not _texto(registro.get("codigo_barras")):
+        raise ValueError("informe 'nome' ou 'codigo_barras'")
+    produto = {}
+    for campo in ("codigo_barras", "nome", "categoria", "fornecedor", "descricao", "foto"):
+        if _texto(registro.get(campo)):
+            produto[campo] = _texto(registro[campo])
+    for campo, tipo in (("preco_venda", float), ("preco_compra", float), ("quantidade", int)):
+        numero = _numero(registro.get(campo), campo, tipo)
+        if numero is not None:
+            produto[campo] = numero
+    if _texto(registro.get("ativo")):
+        produto["ativo"] = 0 if _texto(registro["ativo"]).lower() in ("0", "false", "nao", "não", "inativo") else 1
+    return produto
+
+def validar_cliente(registro):
+    nome = _texto(registro.get("nome"))
+    if not nome:
+        raise ValueError("campo 'nome' é obrigatório")
+    return {campo: _texto(registro.get(campo)) for campo in CAMPOS_CLIENTE} | {"nome": nome}
+
+def validar_venda(linhas):
+    """Monta uma venda a partir das linhas (uma por item) que compartilham o mesmo 'venda'."""
+    if not linhas:
+        raise ValueError("venda sem itens")
+    primeira = linhas[0]
+    status = _texto(primeira.get("status")).upper() or "PAGO"
+    if status not in ("PAGO", "PENDENTE"):
+        raise ValueError(f"status inválido: {status!r}")
+    itens = []
+    for linha in linhas:
+        item = {
+            "produto_id": _numero(linha.get("produto_id"), "produto_id", int),
+            "codigo_barras": _texto(linha.get("codigo_barras")),
+            "quantidade": _numero(linha.get("quantidade"), "quantidade", int, obrigatorio=True),
+            "preco_unitario": _numero(linha.get("preco_unitario"), "preco_unitario", obrigatorio=True),
+            # Sem custo no arquivo, vale o preco_compra atual do produto
+            "custo_unitario": _numero(linha.get("custo_unitario"), "custo_unitario"),
+        }
+        if not item["produto_id"] and not item["codigo_barras"]:
+            raise ValueError("informe 'produto_id' ou 'codigo_barras' do item")
+        if item["quantidade"] <= 0:
+            raise ValueError("quantidade deve ser maior que zero")
+        itens.append(item)
+    return {
+        "cliente_id": _numero(primeira.get("cliente_id"), "cliente_id", int),
+        "status": status,
+        "data": _texto(primeira.get("data")) or None,
+        "itens": itens,
+    }
+
+def _agrupar_vendas(registros, formato):
+    """
+    Gera (número da linha, linhas da venda). JSONL: cada linha é uma venda com
+    a lista 'itens'. CSV: linhas consecutivas com o mesmo valor na coluna
+    'venda' formam uma venda (uma linha por item).
+    """
+    if formato == "jsonl":
+        for numero, registro in registros:
+            if isinstance(registro, dict):
+                itens = registro.get("itens") or []
+                # Itens que não são objetos ficam para a validação rejeitar a linha
+                if isinstance(itens, list) and all(isinstance(item, dict) for item in itens):
+                    registro = [dict(registro, **item) for item in itens]
+            yield numero, registro
+    else:
+        for _, grupo in itertools.groupby(registros, key=lambda r: _texto(r[1].get("venda"))):
+            grupo = list(grupo)
+            yield grupo[0][0], [registro for _, registro in grupo]
+
+# Importação ------------------------------------------------------------------
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.lidos = 0
+        self.inseridos = 0
+        self.atualizados = 0
+        self.rejeitados = 0
+        self.arquivo_rejeitados = None
+
+    def __str__(self):
+        texto = f"{self.lidos} lidos, {self.inseridos} inseridos, {self.atualizados} atualizados, {self.rejeitados} rejeitados"
+        if self.arquivo_rejeitados:
+            texto += f" (detalhes em {self.arquivo_rejeitados})"
+        return texto
+
+class _RegistroRejeitados:
+    # Grava os registros rejeitados num arquivo ao lado do importado, sob demanda
+    def __init__(self, caminho):
+        self.caminho = os.path.splitext(caminho)[0] + ".rejeitados.jsonl"
+        self.arquivo = None
+
+    def registrar(self, numero, registro, motivo):
+        if self.arquivo is None:
+            self.arquivo = open(self.caminho, "w", encoding="utf-8")
+        if not isinstance(registro, (dict, list)):
+            registro = str(registro)
+        self.arquivo.write(json.dumps({"linha": numero, "motivo": motivo, "registro": registro}, ensure_ascii=False, default=str) + "\n")
+
+    def fechar(self):
+        if self.arquivo:
+            self.arquivo.close()
+            return self.caminho
+        return None
+
+def importar(entidade, caminho, tamanho_lote=TAMANHO_LOTE_PADRAO, progresso=None):
+    """
+    Importa 'produtos', 'clientes' ou 'vendas' de um arquivo CSV/JSONL.
+    Cada lote de tamanho_lote registros válidos é gravado numa transação.
+    progresso(resultado) é chamado após cada lote. Retorna ResultadoImportacao.
+    """
+    if entidade not in ("produtos", "clientes", "vendas"):
+        raise ValueError(f"Entidade desconhecida: {entidade}")
+
+    resultado = ResultadoImportacao()
+    rejeitados = _RegistroRejeitados(caminho)
+
+    registros = ler_registros(caminho)
+    if entidade == "vendas":
+        registros = _agrupar_vendas(registros, _formato(caminho))
+
+    def validos():
+        for numero, registro in registros:
+            resultado.lidos += 1
+            try:
+                if isinstance(registro, Exception):
+                    raise ValueError(f"linha inválida: {registro}")
+                # JSON válido mas de outro tipo (ex.: [1, 2]) é rejeitado como qualquer linha inválida
+                if entidade == "vendas":
+                    if not isinstance(registro, list) or not all(isinstance(linha, dict) for linha in registro):
+                        raise ValueError("venda inválida: esperado um objeto com a lista 'itens' de objetos")
+                elif not isinstance(registro, dict):
+                    raise ValueError("linha inválida: esperado um objeto JSON")
+                if entidade == "produtos":
+                    yield numero, validar_produto(registro)
+                elif entidade == "clientes":
+                    yield numero, validar_cliente(registro)
+                else:
+                    yield numero, validar_venda(registro)
+            except ValueError as e:
+                resultado.rejeitados += 1
+                rejeitados.registrar(numero, registro, str(e))
+
+    try:
+        for lote in em_lotes(validos(), tamanho_lote):
+            if entidade == "produtos":
+                _gravar_produtos(lote, resultado, rejeitados)
+            elif entidade == "clientes":
+                inseridos, atualizados = db.importar_clientes_lote([c for _, c in lote])
+                resultado.inseridos += inseridos
+                resultado.atualizados += atualizados
+            else:
+                ids, falhas = db.importar_vendas_lote([v for _, v in lote])
+                resultado.inseridos += len(ids)
+                resultado.rejeitados += len(falhas)
+                for indice, motivo in falhas:
+                    numero, venda = lote[indice]
+                    rejeitados.registrar(numero, venda, motivo)
+            if progresso:
+                progresso(resultado)
+    finally:
+        resultado.arquivo_rejeitados = rejeitados.fechar()
+    return resultado
+
+def _gravar_produtos(lote, resultado, rejeitados):
+    inseridos, atualizados, falhas = db.importar_produtos_lote([p for _, p in lote])
+    resultado.inseridos += inseridos
+    resultado.atualizados += atualizados
+    resultado.rejeitados += len(falhas)
+    for indice, motivo in falhas:
+        numero, produto = lote[indice]
+        rejeitados.registrar(numero, produto, motivo)
+
+# Exportação ------------------------------------------------------------------
+
+def exportar(entidade, caminho, progresso=None, **filtros):
+    """
+    Exporta 'produtos' (aceita os mesmos filtros de get_produtos), 'clientes'
+    ou 'vendas' (data_inicio/data_fim) para CSV ou JSONL, em fluxo.
+    Retorna o número de linhas gravadas.
+    """
+    if entidade == "produtos":
+        campos, linhas = CAMPOS_PRODUTO, db.iter_produtos(**filtros)
+    elif entidade == "clientes":
+        campos, linhas = CAMPOS_CLIENTE, db.iter_clientes()
+    elif entidade == "vendas":
+        campos, linhas = CAMPOS_VENDA, db.iter_vendas_itens(**filtros)
+    else:
+        raise ValueError(f"Entidade desconhecida: {entidade}")
+
+    total = 0
+    with open(caminho, "w", encoding="utf-8", newline="") as f:
+        if _formato(caminho) == "csv":
+            escritor = csv.writer(f)
+            escritor.writerow(campos)
+            gravar = lambda valores: escritor.writerow(valores)
+        else:
+            gravar = lambda valores: f.write(json.dumps(dict(zip(campos, valores)), ensure_ascii=False) + "\n")
+
+        for linha in linhas:
+            gravar([linha[c] for c in campos])
+            total += 1
+            if progresso and total % TAMANHO_LOTE_PADRAO == 0:
+                progresso(total)
+    if progresso:
+        progresso(total)
+    return total
+
+# CLI -------------------------------------------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa/exporta produtos, clientes e vendas (CSV ou JSONL).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    imp = sub.add_parser("importar", help="importa registros de um arquivo")
+    imp.add_argument("entidade", choices=["produtos", "clientes", "vendas"])
+    imp.add_argument("arquivo")
+    imp.add_argument("--lote", type=int, default=TAMANHO_LOTE_PADRAO, help="registros por transação")
+
+    exp = sub.add_parser("exportar", help="exporta registros para um arquivo")
+    exp.add_argument("entidade", choices=["produtos", "clientes", "vendas"])
+    exp.add_argument("arquivo")
+    exp.add_argument("--inativos", action="store_true", help="produtos: exporta também os inativos")
+    exp.add_argument("--inicio", help="vendas: data inicial (AAAA-MM-DD)")
+    exp.add_argument("--fim", help="vendas: data final, exclusiva (AAAA-MM-DD)")
+
+    args = parser.parse_args(argv)
+    db.init_db()
+
+    if args.comando == "importar":
+        resultado = importar(args.entidade, args.arquivo, args.lote,
+                             progresso=lambda r: print(f"  {r.lidos} registros processados...", end="\r"))
+        print(f"\nImportação concluída: {resultado}")
+    else:
+        filtros = {}
+        if args.entidade == "produtos":
+            filtros["show_inactive"] = args.inativos
+        elif args.entidade == "vendas":
+            filtros = {"data_inicio": args.inicio, "data_fim": args.fim}
+        total = exportar(args.entidade, args.arquivo,
+                         progresso=lambda n: print(f"  {n} linhas gravadas...", end="\r"), **filtros)
+        print(f"\nExportação concluída: {total} linhas em {args.arquivo}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from dados import geracao_escrita
+
+# Abertura do app: tempos de cada etapa e pré-carga das telas.
+#
+# main.py marca as etapas (imports, início do Flet, init_db, primeiro quadro);
+# o resumo é impresso no console, aparece no painel de diagnóstico e, com
+# ESTOQUE_INICIO_LOG=arquivo, é acrescentado como uma linha JSON para comparar
+# aberturas ao longo do tempo.
+#
+# Depois do primeiro quadro, Precarga busca numa thread os dados iniciais das
+# telas ainda não abertas; a tela usa o resultado na primeira visita, desde que
+# nada tenha sido gravado no banco nesse meio-tempo.
+
+ARQUIVO_LOG = os.environ.get("ESTOQUE_INICIO_LOG")
+
+_inicio = None
+_ultima = None
+_etapas = []  # (etapa, ms desde a etapa anterior)
+
+def comecar(instante=None):
+    """Marca o início da contagem (use o perf_counter() tomado antes dos imports)."""
+    global _inicio, _ultima
+    _inicio = _ultima = instante if instante is not None else time.perf_counter()
+    _etapas.clear()
+
+def marcar(etapa):
+    global _ultima
+    if _inicio is None:
+        comecar()
+    agora = time.perf_counter()
+    _etapas.append((etapa, (agora - _ultima) * 1000))
+    _ultima = agora
+
+def etapas():
+    return list(_etapas)
+
+def total_ms():
+    return sum(ms for _, ms in _etapas)
+
+def relatorio():
+    if not _etapas:
+        return "Abertura: não medida"
+    partes = " | ".join(f"{etapa} {ms:.0f} ms" for etapa, ms in _etapas)
+    return f"Abertura: {partes} | total {total_ms():.0f} ms"
+
+def concluir():
+    """Imprime o resumo da abertura e, se configurado, grava no log."""
+    print(relatorio())
+    if ARQUIVO_LOG:
+        registro = {"data": datetime.now().isoformat(timespec="seconds"), "total_ms": round(total_ms(), 1),
+                    "etapas": {etapa: round(ms, 1) for etapa, ms in _etapas}}
+        try:
+            with open(ARQUIVO_LOG, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Erro ao gravar tempos de abertura: {e}")
+
+class Precarga:
+    """
+    Uso:
+        precarga = Precarga()
+        precarga.iniciar({"produtos": ProductView.prefetch, ...})   # depois do primeiro quadro
+        product_view.load_products(prefetched=precarga.obter("produtos"))
+    """
+
+    def __init__(self):
+        self._resultados = {}  # nome -> (geração de escrita, resultado)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def iniciar(self, tarefas):
+        self._thread = threading.Thread(target=self._executar, args=(dict(tarefas),), name="precarga", daemon=True)
+        self._thread.start()
+
+    def _executar(self, tarefas):
+        for nome, tarefa in tarefas.items():
+            geracao = geracao_escrita()
+            inicio = time.perf_counter()
+            try:
+                resultado = tarefa()
+            except Exception as e:
+                print(f"Erro na pré-carga de {nome}: {e}")
+                continue
+            with self._lock:
+                self._resultados[nome] = (geracao, resultado)
+            print(f"Pré-carga de {nome}: {(time.perf_counter() - inicio) * 1000:.0f} ms")
+
+    def obter(self, nome):
+        """Resultado da pré-carga (uma única vez), ou None se não existe, ainda não terminou ou ficou velho."""
+        with self._lock:
+            geracao, resultado = self._resultados.pop(nome, (None, None))
+        if geracao is None or geracao != geracao_escrita():
+            return None
+        return resultado
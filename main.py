@@ -1,11 +1,34 @@
+import time
+_inicio = time.perf_counter()  # antes dos demais imports: o tempo de importação entra na abertura
+
 import flet as ft
-from database import init_db
+import threading
+import inicializacao
+from dados import init_db, carregar_codigos_barras
 from ui_components import get_theme, NEON_BLUE, NEON_RED, DARK_BG, TEXT_COLOR, with_opacity
-from views import ProductView, ClientView, SalesView, DashboardView, DebtorsView
+from views import ProductView, ClientView, SalesView, DashboardView, DebtorsView, DiagnosticsView
+
+inicializacao.comecar(_inicio)
+inicializacao.marcar("imports")
+
+# Telas criadas na primeira visita (só o Dashboard é montado na abertura)
+VIEWS = {
+    "dashboard": DashboardView,
+    "produtos": ProductView,
+    "clientes": ClientView,
+    "vendas": SalesView,
+    "devedores": DebtorsView,
+}
+# Telas cujos dados iniciais são buscados em segundo plano após o primeiro quadro
+PREFETCH = ("produtos", "clientes", "devedores")
 
 def main(page: ft.Page):
+    inicializacao.marcar("flet")
     # Inicializar Banco de Dados
     init_db()
+    inicializacao.marcar("init_db")
+    # Mapa de códigos de barras do Caixa carregado em segundo plano
+    threading.Thread(target=carregar_codigos_barras, daemon=True).start()
 
     # Configuração da Página
     page.title = "Sistema de Estoque e Vendas Futurista"
@@ -15,11 +38,17 @@ def main(page: ft.Page):
     page.window_icon = "icon.jpg"
     
     # Views
-    product_view = ProductView()
-    client_view = ClientView()
-    sales_view = SalesView()
-    dashboard_view = DashboardView()
-    debtors_view = DebtorsView()
+    views = {}
+    precarga = inicializacao.Precarga()
+
+    def get_view(view_name):
+        if view_name not in views:
+            views[view_name] = VIEWS[view_name]()
+        return views[view_name]
+
+    dashboard_view = get_view("dashboard")
+    dashboard_view.load_data()
+    inicializacao.marcar("dashboard")
 
     # Container principal que mudará de conteúdo
     main_content = ft.Container(
@@ -30,25 +59,34 @@ def main(page: ft.Page):
 
     def change_view(e, view_name):
         print(f"Navegando para: {view_name}")
+        view = get_view(view_name)
+        main_content.content = view
+        # Atualiza os dados ao entrar (na primeira visita, com a pré-carga se ainda valer)
         if view_name == "dashboard":
-            main_content.content = dashboard_view
-            dashboard_view.load_data() # Atualiza dados ao entrar
+            view.load_data()
         elif view_name == "produtos":
-            main_content.content = product_view
-            product_view.load_products()
+            view.load_products(prefetched=precarga.obter(view_name))
         elif view_name == "clientes":
-            main_content.content = client_view
-            client_view.load_clients()
-        elif view_name == "vendas":
-            main_content.content = sales_view
-            sales_view.load_clients() # Recarrega clientes no dropdown
+            view.load_clients(prefetched=precarga.obter(view_name))
         elif view_name == "devedores":
-            main_content.content = debtors_view
-            debtors_view.load_debtors()
-        
+            view.load_debtors(prefetched=precarga.obter(view_name))
+        # vendas: clientes são buscados conforme a digitação
+
         page.update()
         print("Page updated")
 
+    # Painel de diagnóstico oculto: Ctrl+Shift+D
+    def on_keyboard(e: ft.KeyboardEvent):
+        if e.ctrl and e.shift and e.key.upper() == "D":
+            dialog = ft.AlertDialog(
+                title=ft.Text("Diagnóstico do Banco de Dados"),
+                content=DiagnosticsView(),
+                actions=[ft.TextButton("Fechar", on_click=lambda e: page.close(dialog))],
+            )
+            page.open(dialog)
+
+    page.on_keyboard_event = on_keyboard
+
     # Sidebar de Navegação
     sidebar = ft.Container(
         width=250,
@@ -77,6 +115,9 @@ def main(page: ft.Page):
             expand=True
         )
     )
+    inicializacao.marcar("primeiro quadro")
+    inicializacao.concluir()
+    precarga.iniciar({nome: VIEWS[nome].prefetch for nome in PREFETCH})
 
 if __name__ == "__main__":
     ft.app(target=main, assets_dir="assets")
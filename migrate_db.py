@@ -1,51 +1,758 @@
-import sqlite3
+from database import get_db_connection, transacao
 
-DB_NAME = "estoque_vendas.db"
+# Migrações versionadas do esquema.
+# A versão aplicada fica gravada em PRAGMA user_version; cada passo roda em
+# sua própria transação (ou em várias, se marcado com @em_lotes) e só é
+# executado uma vez, em ordem crescente.
+# Passos que precisam recalcular tabelas de resumo pedem isso com
+# _reconstruir(...): o recálculo usa o código atual, que pode depender de
+# colunas criadas por migrações posteriores, então roda uma única vez depois
+# do último passo pendente, na mesma transação que grava a versão final.
+# Os pedidos ficam gravados em resumos_pendentes, na transação do passo que
+# os fez: se a atualização parar no meio, a próxima execução ainda recalcula
+# o que os passos já aplicados pediram.
 
-def migrate_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    
-    try:
-        # Tenta adicionar a coluna status
-        cursor.execute("ALTER TABLE vendas ADD COLUMN status TEXT DEFAULT 'PAGO'")
-        print("Coluna 'status' adicionada com sucesso.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("Coluna 'status' já existe.")
-        else:
-            print(f"Erro ao migrar banco de dados: {e}")
-
-    try:
-        # Tenta adicionar a coluna ativo na tabela produtos
-        cursor.execute("ALTER TABLE produtos ADD COLUMN ativo INTEGER DEFAULT 1")
-        print("Coluna 'ativo' adicionada com sucesso.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("Coluna 'ativo' já existe.")
+# Resumos recalculáveis, na ordem em que são reconstruídos
+RESUMOS = ("resumo_dashboard", "vendas_dia", "saldos_clientes", "total_vendido")
+
+def _reconstruir(*resumos):
+    get_db_connection().executemany("INSERT OR IGNORE INTO resumos_pendentes (resumo) VALUES (?)", [(r,) for r in resumos])
+
+def _resumos_pendentes(conn):
+    return {r[0] for r in conn.execute("SELECT resumo FROM resumos_pendentes")}
+
+def _reconstruir_resumos():
+    from database import reconstruir_resumo_dashboard, reconstruir_saldos_clientes, reconstruir_total_vendido
+    from relatorios import reconstruir_vendas_dia
+    funcoes = {
+        "resumo_dashboard": reconstruir_resumo_dashboard,
+        "vendas_dia": reconstruir_vendas_dia,
+        "saldos_clientes": reconstruir_saldos_clientes,
+        "total_vendido": reconstruir_total_vendido,
+    }
+    conn = get_db_connection()
+    pendentes = _resumos_pendentes(conn)
+    for resumo in RESUMOS:
+        if resumo in pendentes:
+            funcoes[resumo]()
+    conn.execute("DELETE FROM resumos_pendentes")
+
+def _colunas(conn, tabela):
+    return {row['name'] for row in conn.execute(f"PRAGMA table_info({tabela})")}
+
+def _adicionar_coluna(conn, tabela, coluna, tipo):
+    if coluna not in _colunas(conn, tabela):
+        conn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+
+def em_lotes(passo):
+    """
+    Marca um passo que controla as próprias transações (ex.: preencher uma
+    coluna de uma tabela grande em lotes, sem segurar o lock de escrita).
+    O passo precisa poder ser repetido: se for interrompido, roda de novo.
+    """
+    passo.em_lotes = True
+    return passo
+
+def m001_esquema_inicial(conn):
+    # Tabela Produtos
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS produtos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            categoria TEXT,
+            preco_venda REAL NOT NULL,
+            preco_compra REAL,
+            quantidade INTEGER NOT NULL,
+            ativo INTEGER DEFAULT 1,
+            foto TEXT,
+            codigo_barras TEXT,
+            descricao TEXT,
+            fornecedor TEXT
+        )
+    ''')
+
+    # Tabela Clientes
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS clientes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome TEXT NOT NULL,
+            telefone TEXT,
+            cpf TEXT,
+            email TEXT
+        )
+    ''')
+
+    # Tabela Vendas
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER,
+            total REAL NOT NULL,
+            status TEXT DEFAULT 'PAGO', -- 'PAGO' ou 'PENDENTE'
+            data DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id)
+        )
+    ''')
+
+    # Tabela Itens da Venda
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS itens_venda (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            venda_id INTEGER,
+            produto_id INTEGER,
+            quantidade INTEGER NOT NULL,
+            preco_unitario REAL NOT NULL,
+            FOREIGN KEY (venda_id) REFERENCES vendas (id),
+            FOREIGN KEY (produto_id) REFERENCES produtos (id)
+        )
+    ''')
+
+    # Bancos criados pela versão 1.0 podem não ter as colunas mais novas
+    _adicionar_coluna(conn, "vendas", "status", "TEXT DEFAULT 'PAGO'")
+    _adicionar_coluna(conn, "produtos", "ativo", "INTEGER DEFAULT 1")
+    for col_name in ("foto", "codigo_barras", "descricao", "fornecedor"):
+        _adicionar_coluna(conn, "produtos", col_name, "TEXT")
+
+def m002_indices_secundarios(conn):
+    # Movimentações do produto e join dos mais vendidos
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_itens_venda_produto ON itens_venda (produto_id)")
+    # Itens de uma venda (histórico de compras)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_itens_venda_venda ON itens_venda (venda_id)")
+    # Histórico do cliente e dívidas por cliente
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_cliente_status ON vendas (cliente_id, status)")
+    # Devedores e totais do dashboard filtram só por status
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_status_cliente ON vendas (status, cliente_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_data ON vendas (data)")
+    # Listagem padrão (ativos por nome) e filtro por categoria
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_ativo_nome ON produtos (ativo, nome)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_categoria ON produtos (categoria)")
+    conn.execute("ANALYZE")
+
+def m003_busca_textual_produtos(conn):
+    # Índice FTS5 sobre os campos textuais do produto (conteúdo externo: a
+    # tabela produtos continua sendo a fonte dos dados). remove_diacritics
+    # permite buscar "protecao" e achar "Proteção"; prefix acelera buscas por prefixo.
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS produtos_fts USING fts5(
+            nome, categoria, codigo_barras, descricao, fornecedor,
+            content='produtos', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+
+    # Triggers mantêm o índice sincronizado com a tabela produtos
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS produtos_fts_ai AFTER INSERT ON produtos BEGIN
+            INSERT INTO produtos_fts (rowid, nome, categoria, codigo_barras, descricao, fornecedor)
+            VALUES (new.id, new.nome, new.categoria, new.codigo_barras, new.descricao, new.fornecedor);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS produtos_fts_ad AFTER DELETE ON produtos BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, nome, categoria, codigo_barras, descricao, fornecedor)
+            VALUES ('delete', old.id, old.nome, old.categoria, old.codigo_barras, old.descricao, old.fornecedor);
+        END
+    ''')
+    # Só dispara quando um campo indexado muda (baixas de estoque não tocam o índice)
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS produtos_fts_au
+        AFTER UPDATE OF nome, categoria, codigo_barras, descricao, fornecedor ON produtos BEGIN
+            INSERT INTO produtos_fts (produtos_fts, rowid, nome, categoria, codigo_barras, descricao, fornecedor)
+            VALUES ('delete', old.id, old.nome, old.categoria, old.codigo_barras, old.descricao, old.fornecedor);
+            INSERT INTO produtos_fts (rowid, nome, categoria, codigo_barras, descricao, fornecedor)
+            VALUES (new.id, new.nome, new.categoria, new.codigo_barras, new.descricao, new.fornecedor);
+        END
+    ''')
+
+    # Indexa os produtos já cadastrados
+    conn.execute("INSERT INTO produtos_fts (produtos_fts) VALUES ('rebuild')")
+
+def m004_indices_ordenacao_produtos(conn):
+    # Ordenações por preço e estoque da listagem paginada (ativo, chave, id)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_ativo_preco ON produtos (ativo, preco_venda)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_ativo_quantidade ON produtos (ativo, quantidade)")
+
+def m005_resumo_dashboard(conn):
+    # Totais do dashboard numa única linha, mantida pelos triggers abaixo
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS resumo_dashboard (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            total_vendido REAL NOT NULL DEFAULT 0,
+            total_itens INTEGER NOT NULL DEFAULT 0,
+            total_investido REAL NOT NULL DEFAULT 0,
+            lucro_liquido REAL NOT NULL DEFAULT 0,
+            total_pendente REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO resumo_dashboard (id) VALUES (1)")
+
+    # Vendas: faturamento (PAGO) e a receber (PENDENTE).
+    # Vendas não são excluídas pelo app, então não há trigger de DELETE.
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS resumo_vendas_ai AFTER INSERT ON vendas BEGIN
+            UPDATE resumo_dashboard SET
+                total_vendido = total_vendido + (CASE WHEN new.status = 'PAGO' THEN new.total ELSE 0 END),
+                total_pendente = total_pendente + (CASE WHEN new.status = 'PENDENTE' THEN new.total ELSE 0 END)
+            WHERE id = 1;
+        END
+    ''')
+    # Mudança de status (ex.: quitar_divida): move o valor entre os totais e
+    # passa a contar (ou deixa de contar) os itens e o lucro da venda
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS resumo_vendas_au AFTER UPDATE OF status, total ON vendas BEGIN
+            UPDATE resumo_dashboard SET
+                total_vendido = total_vendido
+                    + (CASE WHEN new.status = 'PAGO' THEN new.total ELSE 0 END)
+                    - (CASE WHEN old.status = 'PAGO' THEN old.total ELSE 0 END),
+                total_pendente = total_pendente
+                    + (CASE WHEN new.status = 'PENDENTE' THEN new.total ELSE 0 END)
+                    - (CASE WHEN old.status = 'PENDENTE' THEN old.total ELSE 0 END),
+                total_itens = total_itens
+                    + ((new.status = 'PAGO') - (old.status = 'PAGO'))
+                    * COALESCE((SELECT SUM(quantidade) FROM itens_venda WHERE venda_id = new.id), 0),
+                lucro_liquido = lucro_liquido
+                    + ((new.status = 'PAGO') - (old.status = 'PAGO'))
+                    * COALESCE((SELECT SUM((iv.preco_unitario - p.preco_compra) * iv.quantidade)
+                                FROM itens_venda iv JOIN produtos p ON iv.produto_id = p.id
+                                WHERE iv.venda_id = new.id), 0)
+            WHERE id = 1;
+        END
+    ''')
+    # Itens de venda paga: quantidade vendida e lucro pelo custo vigente na venda
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS resumo_itens_venda_ai AFTER INSERT ON itens_venda
+        WHEN (SELECT status FROM vendas WHERE id = new.venda_id) = 'PAGO' BEGIN
+            UPDATE resumo_dashboard SET
+                total_itens = total_itens + new.quantidade,
+                lucro_liquido = lucro_liquido + COALESCE(
+                    (SELECT (new.preco_unitario - preco_compra) * new.quantidade FROM produtos WHERE id = new.produto_id), 0)
+            WHERE id = 1;
+        END
+    ''')
+
+    # Produtos: valor investido no estoque atual
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS resumo_produtos_ai AFTER INSERT ON produtos BEGIN
+            UPDATE resumo_dashboard SET total_investido = total_investido + COALESCE(new.preco_compra * new.quantidade, 0)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS resumo_produtos_au AFTER UPDATE OF preco_compra, quantidade ON produtos BEGIN
+            UPDATE resumo_dashboard SET total_investido = total_investido
+                + COALESCE(new.preco_compra * new.quantidade, 0)
+                - COALESCE(old.preco_compra * old.quantidade, 0)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS resumo_produtos_ad AFTER DELETE ON produtos BEGIN
+            UPDATE resumo_dashboard SET total_investido = total_investido - COALESCE(old.preco_compra * old.quantidade, 0)
+            WHERE id = 1;
+        END
+    ''')
+
+    # Preenche com os totais atuais
+    _reconstruir("resumo_dashboard")
+
+def m006_indices_importacao(conn):
+    # Importação: produtos localizados pelo código de barras e clientes pelo CPF
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_codigo_barras ON produtos (codigo_barras)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clientes_cpf ON clientes (cpf)")
+
+def m007_codigo_barras_unico(conn):
+    # Leitor de código de barras: cada código identifica um único produto.
+    # Códigos vazios viram NULL (um índice UNIQUE aceita vários NULL).
+    conn.execute("UPDATE produtos SET codigo_barras = NULL WHERE TRIM(codigo_barras) = ''")
+    conn.execute("UPDATE produtos SET codigo_barras = TRIM(codigo_barras) WHERE codigo_barras != TRIM(codigo_barras)")
+    duplicados = conn.execute('''
+        SELECT codigo_barras, GROUP_CONCAT(id) AS ids FROM produtos
+        WHERE codigo_barras IS NOT NULL
+        GROUP BY codigo_barras HAVING COUNT(*) > 1
+    ''').fetchall()
+    if duplicados:
+        # Não dá para escolher sozinho qual produto fica com o código: mantém o
+        # índice comum (a busca continua indexada) e avisa para corrigir o cadastro.
+        print("AVISO: códigos de barras repetidos; o índice único não foi criado:")
+        for d in duplicados:
+            print(f"  - {d['codigo_barras']}: produtos {d['ids']}")
+        return
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_produtos_codigo_barras_unico ON produtos (codigo_barras)")
+    conn.execute("DROP INDEX IF EXISTS idx_produtos_codigo_barras")
+
+def m008_resumo_vendas_dia(conn):
+    # Resumo diário para os relatórios (relatorios.py): totais do dia, por
+    # produto e por categoria. Conta todas as vendas (pagas e fiado) pela data
+    # da venda; a categoria é a do produto no momento da venda.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS vendas_dia (
+            dia TEXT PRIMARY KEY,
+            vendas INTEGER NOT NULL DEFAULT 0,
+            faturamento REAL NOT NULL DEFAULT 0,
+            itens INTEGER NOT NULL DEFAULT 0,
+            custo REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    for tabela, chave in (("vendas_dia_produto", "produto_id INTEGER NOT NULL"), ("vendas_dia_categoria", "categoria TEXT NOT NULL")):
+        conn.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tabela} (
+                dia TEXT NOT NULL,
+                {chave},
+                quantidade INTEGER NOT NULL DEFAULT 0,
+                faturamento REAL NOT NULL DEFAULT 0,
+                custo REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (dia, {chave.split()[0]})
+            ) WITHOUT ROWID
+        ''')
+
+    # Vendas não são alteradas nem excluídas pelo app: basta somar nas inserções
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS vendas_dia_ai AFTER INSERT ON vendas BEGIN
+            INSERT INTO vendas_dia (dia, vendas, faturamento) VALUES (date(new.data), 1, new.total)
+            ON CONFLICT (dia) DO UPDATE SET vendas = vendas + 1, faturamento = faturamento + excluded.faturamento;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS vendas_dia_itens_ai AFTER INSERT ON itens_venda BEGIN
+            UPDATE vendas_dia SET
+                itens = itens + new.quantidade,
+                custo = custo + new.quantidade * COALESCE((SELECT preco_compra FROM produtos WHERE id = new.produto_id), 0)
+            WHERE dia = (SELECT date(data) FROM vendas WHERE id = new.venda_id);
+            INSERT INTO vendas_dia_produto (dia, produto_id, quantidade, faturamento, custo)
+            VALUES (
+                (SELECT date(data) FROM vendas WHERE id = new.venda_id),
+                new.produto_id,
+                new.quantidade,
+                new.quantidade * new.preco_unitario,
+                new.quantidade * COALESCE((SELECT preco_compra FROM produtos WHERE id = new.produto_id), 0)
+            )
+            ON CONFLICT (dia, produto_id) DO UPDATE SET
+                quantidade = quantidade + excluded.quantidade,
+                faturamento = faturamento + excluded.faturamento,
+                custo = custo + excluded.custo;
+            INSERT INTO vendas_dia_categoria (dia, categoria, quantidade, faturamento, custo)
+            VALUES (
+                (SELECT date(data) FROM vendas WHERE id = new.venda_id),
+                COALESCE((SELECT NULLIF(categoria, '') FROM produtos WHERE id = new.produto_id), 'Sem categoria'),
+                new.quantidade,
+                new.quantidade * new.preco_unitario,
+                new.quantidade * COALESCE((SELECT preco_compra FROM produtos WHERE id = new.produto_id), 0)
+            )
+            ON CONFLICT (dia, categoria) DO UPDATE SET
+                quantidade = quantidade + excluded.quantidade,
+                faturamento = faturamento + excluded.faturamento,
+                custo = custo + excluded.custo;
+        END
+    ''')
+
+    _reconstruir("vendas_dia")
+
+LOTE_PREENCHIMENTO = 20000
+
+@em_lotes
+def m009_custo_unitario_itens(conn):
+    # Custo do item gravado na venda: o lucro deixa de depender do preco_compra
+    # atual do produto (que muda a cada edição) e não precisa mais de JOIN.
+    with transacao() as conn:
+        _adicionar_coluna(conn, "itens_venda", "custo_unitario", "REAL")
+
+    # Itens antigos recebem o custo atual do produto (melhor estimativa disponível),
+    # em lotes por faixa de id, cada um na sua transação
+    maximo = conn.execute("SELECT MAX(id) FROM itens_venda").fetchone()[0] or 0
+    for inicio in range(0, maximo, LOTE_PREENCHIMENTO):
+        with transacao() as conn:
+            conn.execute('''
+                UPDATE itens_venda
+                SET custo_unitario = COALESCE((SELECT preco_compra FROM produtos WHERE id = itens_venda.produto_id), 0)
+                WHERE id > ? AND id <= ? AND custo_unitario IS NULL
+            ''', (inicio, inicio + LOTE_PREENCHIMENTO))
+
+    with transacao() as conn:
+        # Triggers de resumo passam a usar o custo gravado no item
+        conn.execute("DROP TRIGGER IF EXISTS resumo_vendas_au")
+        conn.execute('''
+            CREATE TRIGGER resumo_vendas_au AFTER UPDATE OF status, total ON vendas BEGIN
+                UPDATE resumo_dashboard SET
+                    total_vendido = total_vendido
+                        + (CASE WHEN new.status = 'PAGO' THEN new.total ELSE 0 END)
+                        - (CASE WHEN old.status = 'PAGO' THEN old.total ELSE 0 END),
+                    total_pendente = total_pendente
+                        + (CASE WHEN new.status = 'PENDENTE' THEN new.total ELSE 0 END)
+                        - (CASE WHEN old.status = 'PENDENTE' THEN old.total ELSE 0 END),
+                    total_itens = total_itens
+                        + ((new.status = 'PAGO') - (old.status = 'PAGO'))
+                        * COALESCE((SELECT SUM(quantidade) FROM itens_venda WHERE venda_id = new.id), 0),
+                    lucro_liquido = lucro_liquido
+                        + ((new.status = 'PAGO') - (old.status = 'PAGO'))
+                        * COALESCE((SELECT SUM((preco_unitario - custo_unitario) * quantidade)
+                                    FROM itens_venda WHERE venda_id = new.id), 0)
+                WHERE id = 1;
+            END
+        ''')
+        conn.execute("DROP TRIGGER IF EXISTS resumo_itens_venda_ai")
+        conn.execute('''
+            CREATE TRIGGER resumo_itens_venda_ai AFTER INSERT ON itens_venda
+            WHEN (SELECT status FROM vendas WHERE id = new.venda_id) = 'PAGO' BEGIN
+                UPDATE resumo_dashboard SET
+                    total_itens = total_itens + new.quantidade,
+                    lucro_liquido = lucro_liquido + (new.preco_unitario - COALESCE(new.custo_unitario, 0)) * new.quantidade
+                WHERE id = 1;
+            END
+        ''')
+        conn.execute("DROP TRIGGER IF EXISTS vendas_dia_itens_ai")
+        conn.execute('''
+            CREATE TRIGGER vendas_dia_itens_ai AFTER INSERT ON itens_venda BEGIN
+                UPDATE vendas_dia SET
+                    itens = itens + new.quantidade,
+                    custo = custo + new.quantidade * COALESCE(new.custo_unitario, 0)
+                WHERE dia = (SELECT date(data) FROM vendas WHERE id = new.venda_id);
+                INSERT INTO vendas_dia_produto (dia, produto_id, quantidade, faturamento, custo)
+                VALUES (
+                    (SELECT date(data) FROM vendas WHERE id = new.venda_id),
+                    new.produto_id,
+                    new.quantidade,
+                    new.quantidade * new.preco_unitario,
+                    new.quantidade * COALESCE(new.custo_unitario, 0)
+                )
+                ON CONFLICT (dia, produto_id) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    faturamento = faturamento + excluded.faturamento,
+                    custo = custo + excluded.custo;
+                INSERT INTO vendas_dia_categoria (dia, categoria, quantidade, faturamento, custo)
+                VALUES (
+                    (SELECT date(data) FROM vendas WHERE id = new.venda_id),
+                    COALESCE((SELECT NULLIF(categoria, '') FROM produtos WHERE id = new.produto_id), 'Sem categoria'),
+                    new.quantidade,
+                    new.quantidade * new.preco_unitario,
+                    new.quantidade * COALESCE(new.custo_unitario, 0)
+                )
+                ON CONFLICT (dia, categoria) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    faturamento = faturamento + excluded.faturamento,
+                    custo = custo + excluded.custo;
+            END
+        ''')
+
+    # Lucro e custos recalculados a partir do custo gravado nos itens
+    _reconstruir("resumo_dashboard", "vendas_dia")
+
+def m010_contas_receber(conn):
+    # Fiado com pagamentos parciais: cada pagamento é abatido das vendas em
+    # aberto do cliente, da mais antiga para a mais nova (alocacoes), e
+    # vendas.valor_pago acumula o que já foi pago de cada venda.
+    _adicionar_coluna(conn, "vendas", "valor_pago", "REAL NOT NULL DEFAULT 0")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pagamentos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER NOT NULL,
+            valor REAL NOT NULL,
+            data TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            observacao TEXT,
+            FOREIGN KEY (cliente_id) REFERENCES clientes (id)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_pagamentos_cliente ON pagamentos (cliente_id, data)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS alocacoes (
+            pagamento_id INTEGER NOT NULL,
+            venda_id INTEGER NOT NULL,
+            valor REAL NOT NULL,
+            PRIMARY KEY (pagamento_id, venda_id),
+            FOREIGN KEY (pagamento_id) REFERENCES pagamentos (id),
+            FOREIGN KEY (venda_id) REFERENCES vendas (id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_alocacoes_venda ON alocacoes (venda_id)")
+    # Vendas em aberto de um cliente em ordem de data (FIFO e faixas de atraso)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_vendas_cliente_status_data ON vendas (cliente_id, status, data)")
+    conn.execute("DROP INDEX IF EXISTS idx_vendas_cliente_status")
+
+    # Saldo devedor por cliente, mantido pelos triggers abaixo. Só clientes com
+    # vendas em aberto têm linha; o índice por saldo serve a lista de devedores.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS saldos_clientes (
+            cliente_id INTEGER PRIMARY KEY,
+            saldo REAL NOT NULL DEFAULT 0,
+            vendas_abertas INTEGER NOT NULL DEFAULT 0,
+            venda_mais_antiga TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_saldos_clientes_saldo ON saldos_clientes (saldo, cliente_id)")
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS saldos_vendas_ai AFTER INSERT ON vendas
+        WHEN new.status = 'PENDENTE' AND new.cliente_id IS NOT NULL BEGIN
+            INSERT INTO saldos_clientes (cliente_id, saldo, vendas_abertas, venda_mais_antiga)
+            VALUES (new.cliente_id, new.total - new.valor_pago, 1, new.data)
+            ON CONFLICT (cliente_id) DO UPDATE SET
+                saldo = saldo + excluded.saldo,
+                vendas_abertas = vendas_abertas + 1,
+                venda_mais_antiga = MIN(venda_mais_antiga, excluded.venda_mais_antiga);
+        END
+    ''')
+    # Pagamento (parcial ou total) ou mudança de status: tira o saldo antigo
+    # da venda e soma o novo
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS saldos_vendas_au AFTER UPDATE OF status, total, valor_pago, cliente_id ON vendas
+        WHEN old.status = 'PENDENTE' OR new.status = 'PENDENTE' BEGIN
+            UPDATE saldos_clientes SET
+                saldo = saldo - (old.total - old.valor_pago),
+                vendas_abertas = vendas_abertas - 1
+            WHERE cliente_id = old.cliente_id AND old.status = 'PENDENTE';
+            INSERT INTO saldos_clientes (cliente_id, saldo, vendas_abertas, venda_mais_antiga)
+            SELECT new.cliente_id, new.total - new.valor_pago, 1, new.data
+            WHERE new.status = 'PENDENTE' AND new.cliente_id IS NOT NULL
+            ON CONFLICT (cliente_id) DO UPDATE SET
+                saldo = saldo + excluded.saldo,
+                vendas_abertas = vendas_abertas + 1;
+            DELETE FROM saldos_clientes WHERE cliente_id IN (old.cliente_id, new.cliente_id) AND vendas_abertas <= 0;
+            UPDATE saldos_clientes SET venda_mais_antiga = (
+                SELECT MIN(data) FROM vendas WHERE cliente_id = saldos_clientes.cliente_id AND status = 'PENDENTE')
+            WHERE cliente_id IN (old.cliente_id, new.cliente_id);
+        END
+    ''')
+
+    # Total a receber do dashboard passa a descontar os pagamentos parciais
+    conn.execute("DROP TRIGGER IF EXISTS resumo_vendas_ai")
+    conn.execute('''
+        CREATE TRIGGER resumo_vendas_ai AFTER INSERT ON vendas BEGIN
+            UPDATE resumo_dashboard SET
+                total_vendido = total_vendido + (CASE WHEN new.status = 'PAGO' THEN new.total ELSE 0 END),
+                total_pendente = total_pendente + (CASE WHEN new.status = 'PENDENTE' THEN new.total - new.valor_pago ELSE 0 END)
+            WHERE id = 1;
+        END
+    ''')
+    conn.execute("DROP TRIGGER IF EXISTS resumo_vendas_au")
+    conn.execute('''
+        CREATE TRIGGER resumo_vendas_au AFTER UPDATE OF status, total, valor_pago ON vendas BEGIN
+            UPDATE resumo_dashboard SET
+                total_vendido = total_vendido
+                    + (CASE WHEN new.status = 'PAGO' THEN new.total ELSE 0 END)
+                    - (CASE WHEN old.status = 'PAGO' THEN old.total ELSE 0 END),
+                total_pendente = total_pendente
+                    + (CASE WHEN new.status = 'PENDENTE' THEN new.total - new.valor_pago ELSE 0 END)
+                    - (CASE WHEN old.status = 'PENDENTE' THEN old.total - old.valor_pago ELSE 0 END),
+                total_itens = total_itens
+                    + ((new.status = 'PAGO') - (old.status = 'PAGO'))
+                    * COALESCE((SELECT SUM(quantidade) FROM itens_venda WHERE venda_id = new.id), 0),
+                lucro_liquido = lucro_liquido
+                    + ((new.status = 'PAGO') - (old.status = 'PAGO'))
+                    * COALESCE((SELECT SUM((preco_unitario - custo_unitario) * quantidade)
+                                FROM itens_venda WHERE venda_id = new.id), 0)
+            WHERE id = 1;
+        END
+    ''')
+
+    _reconstruir("resumo_dashboard", "saldos_clientes")
+
+def m011_busca_clientes(conn):
+    # Chaves de busca normalizadas (ver database.chaves_busca_cliente): a busca
+    # por nome, CPF ou telefone vira uma faixa de índice em vez de LIKE '%x%'
+    from database import chaves_busca_cliente
+    for coluna in ("busca_nome", "cpf_digitos", "telefone_digitos"):
+        _adicionar_coluna(conn, "clientes", coluna, "TEXT")
+    clientes = conn.execute("SELECT id, nome, telefone, cpf FROM clientes").fetchall()
+    conn.executemany(
+        "UPDATE clientes SET busca_nome = ?, cpf_digitos = ?, telefone_digitos = ? WHERE id = ?",
+        [(*chaves_busca_cliente(c['nome'], c['telefone'], c['cpf']), c['id']) for c in clientes])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clientes_busca_nome ON clientes (busca_nome)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clientes_cpf_digitos ON clientes (cpf_digitos)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_clientes_telefone_digitos ON clientes (telefone_digitos)")
+
+def m012_versao_produtos(conn):
+    # Versão da linha para a edição concorrente (compare-and-swap em database.update_produto)
+    _adicionar_coluna(conn, "produtos", "versao", "INTEGER NOT NULL DEFAULT 1")
+
+LOTE_PRODUTOS_HISTORICO = 2000
+
+@em_lotes
+def m013_movimentacoes_estoque(conn):
+    # Registro de movimentações de estoque (ver database.TIPOS_MOVIMENTO),
+    # lido por produto e data com paginação por chave
+    with transacao() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS movimentacoes_estoque (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                produto_id INTEGER NOT NULL,
+                data DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                tipo TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                saldo INTEGER NOT NULL,
+                venda_id INTEGER,
+                observacao TEXT
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_produto_data ON movimentacoes_estoque (produto_id, data)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_movimentacoes_venda ON movimentacoes_estoque (venda_id) WHERE venda_id IS NOT NULL")
+
+    # Histórico dos produtos existentes a partir das vendas, uma faixa de ids por transação
+    from database import preencher_movimentacoes
+    maximo = conn.execute("SELECT MAX(id) FROM produtos").fetchone()[0] or 0
+    for inicio in range(0, maximo + 1, LOTE_PRODUTOS_HISTORICO):
+        preencher_movimentacoes(inicio, inicio + LOTE_PRODUTOS_HISTORICO - 1)
+
+def m014_arquivos_vendas(conn):
+    # Vendas antigas movidas para arquivos anuais (arquivamento.py): período e
+    # totais de cada arquivo, para o dashboard e para anexar só os necessários
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arquivos_vendas (
+            ano INTEGER PRIMARY KEY,
+            vendas INTEGER NOT NULL DEFAULT 0,
+            itens INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            lucro REAL NOT NULL DEFAULT 0,
+            data_inicio DATETIME,
+            data_fim DATETIME,
+            atualizado_em DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_arquivos_vendas_periodo ON arquivos_vendas (data_fim, data_inicio)")
+    # Totais diários das vendas arquivadas (reconstrução do resumo diário)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arquivos_vendas_dia (
+            dia TEXT PRIMARY KEY,
+            vendas INTEGER NOT NULL DEFAULT 0,
+            faturamento REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arquivos_vendas_dia_produto (
+            dia TEXT NOT NULL,
+            produto_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            faturamento REAL NOT NULL DEFAULT 0,
+            custo REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (dia, produto_id)
+        ) WITHOUT ROWID
+    ''')
+    # Anos com vendas arquivadas de cada cliente (histórico de compras)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS arquivos_vendas_clientes (
+            cliente_id INTEGER NOT NULL,
+            ano INTEGER NOT NULL,
+            vendas INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (cliente_id, ano)
+        ) WITHOUT ROWID
+    ''')
+
+def m015_total_vendido_produtos(conn):
+    # Contador de unidades vendidas por produto, somado pela venda
+    # (database._baixar_estoque): "Mais vendidos" vira leitura de índice
+    _adicionar_coluna(conn, "produtos", "total_vendido", "INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_ativo_vendido ON produtos (ativo, total_vendido)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_produtos_categoria_vendido ON produtos (categoria, ativo, total_vendido)")
+    _reconstruir("total_vendido")
+
+@em_lotes
+def m016_dia_local_vendas(conn):
+    # vendas.data é gravada em UTC (CURRENT_TIMESTAMP), mas "hoje" e os
+    # períodos dos relatórios são dias locais: os resumos diários passam a
+    # agrupar por date(data, 'localtime'), como as leituras diretas
+    with transacao() as conn:
+        conn.execute("DROP TRIGGER IF EXISTS vendas_dia_ai")
+        conn.execute('''
+            CREATE TRIGGER vendas_dia_ai AFTER INSERT ON vendas BEGIN
+                INSERT INTO vendas_dia (dia, vendas, faturamento) VALUES (date(new.data, 'localtime'), 1, new.total)
+                ON CONFLICT (dia) DO UPDATE SET vendas = vendas + 1, faturamento = faturamento + excluded.faturamento;
+            END
+        ''')
+        conn.execute("DROP TRIGGER IF EXISTS vendas_dia_itens_ai")
+        conn.execute('''
+            CREATE TRIGGER vendas_dia_itens_ai AFTER INSERT ON itens_venda BEGIN
+                UPDATE vendas_dia SET
+                    itens = itens + new.quantidade,
+                    custo = custo + new.quantidade * COALESCE(new.custo_unitario, 0)
+                WHERE dia = (SELECT date(data, 'localtime') FROM vendas WHERE id = new.venda_id);
+                INSERT INTO vendas_dia_produto (dia, produto_id, quantidade, faturamento, custo)
+                VALUES (
+                    (SELECT date(data, 'localtime') FROM vendas WHERE id = new.venda_id),
+                    new.produto_id,
+                    new.quantidade,
+                    new.quantidade * new.preco_unitario,
+                    new.quantidade * COALESCE(new.custo_unitario, 0)
+                )
+                ON CONFLICT (dia, produto_id) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    faturamento = faturamento + excluded.faturamento,
+                    custo = custo + excluded.custo;
+                INSERT INTO vendas_dia_categoria (dia, categoria, quantidade, faturamento, custo)
+                VALUES (
+                    (SELECT date(data, 'localtime') FROM vendas WHERE id = new.venda_id),
+                    COALESCE((SELECT NULLIF(categoria, '') FROM produtos WHERE id = new.produto_id), 'Sem categoria'),
+                    new.quantidade,
+                    new.quantidade * new.preco_unitario,
+                    new.quantidade * COALESCE(new.custo_unitario, 0)
+                )
+                ON CONFLICT (dia, categoria) DO UPDATE SET
+                    quantidade = quantidade + excluded.quantidade,
+                    faturamento = faturamento + excluded.faturamento,
+                    custo = custo + excluded.custo;
+            END
+        ''')
+        _reconstruir("vendas_dia")
+
+    # Totais diários das vendas arquivadas, relidos dos arquivos anuais
+    # (anexados fora de transação); sem algum arquivo, ficam como estavam
+    from arquivamento import recalcular_totais_diarios
+    recalcular_totais_diarios()
+
+# (versão, descrição, função) — nunca altere um passo já publicado, crie um novo.
+MIGRACOES = [
+    (1, "Esquema inicial", m001_esquema_inicial),
+    (2, "Índices secundários", m002_indices_secundarios),
+    (3, "Busca textual (FTS5) de produtos", m003_busca_textual_produtos),
+    (4, "Índices de ordenação de produtos", m004_indices_ordenacao_produtos),
+    (5, "Resumo do dashboard mantido por triggers", m005_resumo_dashboard),
+    (6, "Índices de código de barras e CPF", m006_indices_importacao),
+    (7, "Código de barras único", m007_codigo_barras_unico),
+    (8, "Resumo diário de vendas", m008_resumo_vendas_dia),
+    (9, "Custo unitário gravado nos itens de venda", m009_custo_unitario_itens),
+    (10, "Contas a receber com pagamentos parciais", m010_contas_receber),
+    (11, "Busca de clientes normalizada", m011_busca_clientes),
+    (12, "Versão dos produtos para edição concorrente", m012_versao_produtos),
+    (13, "Movimentações de estoque", m013_movimentacoes_estoque),
+    (14, "Arquivos anuais de vendas antigas", m014_arquivos_vendas),
+    (15, "Contador de vendas dos produtos", m015_total_vendido_produtos),
+    (16, "Dia local das vendas nos resumos diários", m016_dia_local_vendas),
+]
+
+def get_versao_esquema():
+    return get_db_connection().execute("PRAGMA user_version").fetchone()[0]
+
+def aplicar_migracoes(verbose=False):
+    """Aplica as migrações pendentes e retorna a lista de versões aplicadas."""
+    aplicadas = []
+    versao_atual = get_versao_esquema()
+    pendentes = [m for m in MIGRACOES if m[0] > versao_atual]
+    with transacao() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS resumos_pendentes (resumo TEXT PRIMARY KEY)")
+        if not pendentes and _resumos_pendentes(conn):
+            # Recálculo pedido por passos já gravados que não chegou a rodar
+            _reconstruir_resumos()
+    for versao, descricao, passo in pendentes:
+        ultima = versao == pendentes[-1][0]
+        if getattr(passo, "em_lotes", False):
+            passo(get_db_connection())
+            with transacao() as conn:
+                _gravar_versao(conn, versao, ultima)
         else:
-            print(f"Erro ao migrar banco de dados (produtos): {e}")
-
-    # Novas colunas para Quick View
-    new_columns = [
-        ("foto", "TEXT"),
-        ("codigo_barras", "TEXT"),
-        ("descricao", "TEXT"),
-        ("fornecedor", "TEXT")
-    ]
-
-    for col_name, col_type in new_columns:
-        try:
-            cursor.execute(f"ALTER TABLE produtos ADD COLUMN {col_name} {col_type}")
-            print(f"Coluna '{col_name}' adicionada com sucesso.")
-        except sqlite3.OperationalError as e:
-            if "duplicate column name" in str(e):
-                print(f"Coluna '{col_name}' já existe.")
-            else:
-                print(f"Erro ao adicionar coluna '{col_name}': {e}")
-            
-    conn.commit()
-    conn.close()
+            with transacao() as conn:
+                passo(conn)
+                _gravar_versao(conn, versao, ultima)
+        aplicadas.append(versao)
+        if verbose:
+            print(f"Migração {versao} aplicada: {descricao}")
+    return aplicadas
+
+def _gravar_versao(conn, versao, ultima):
+    if ultima:
+        _reconstruir_resumos()
+    conn.execute(f"PRAGMA user_version = {versao}")
+
+def migrate_db():
+    aplicadas = aplicar_migracoes(verbose=True)
+    if not aplicadas:
+        print(f"Banco de dados já está atualizado (versão {get_versao_esquema()}).")
 
 if __name__ == "__main__":
     migrate_db()
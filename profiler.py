@@ -0,0 +1,353 @@
+import argparse
+import atexit
+import collections
+import functools
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+# Instrumentação opcional da camada de dados.
+# Desligada por padrão (custo de um teste de flag por chamada). Para ligar:
+#   ESTOQUE_PROFILER=1 python main.py        (ou profiler.ativar() em tempo de execução)
+# Cada chamada de uma função @instrumentado registra tempo, linhas retornadas,
+# SQL e parâmetros executados e o local de chamada (arquivo:linha fora do
+# database.py). Chamadas acima do limite vão para um log rotativo de consultas
+# lentas; os histogramas ficam em memória e aparecem no painel de diagnóstico
+# (Ctrl+Shift+D no app) ou em relatorio().
+
+LIMITE_LENTO_MS = float(os.environ.get("ESTOQUE_PROFILER_LENTO_MS", 100))
+ARQUIVO_LOG = os.environ.get("ESTOQUE_PROFILER_LOG", "consultas_lentas.log")
+PLANO_NO_LOG = os.environ.get("ESTOQUE_PROFILER_PLANO") == "1"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+
+FAIXAS_MS = (1, 5, 10, 50, 100, 500, 1000)  # limites superiores do histograma
+AMOSTRAS_POR_FUNCAO = 1000                  # janela usada para p50/p95
+MAX_PARAMS_LOG = 20
+IGNORAR_LOCAL = ("database.py", "profiler.py", "contextlib.py")
+
+_ativo = os.environ.get("ESTOQUE_PROFILER") == "1"
+_lock = threading.Lock()
+_pilha = threading.local()  # chamadas instrumentadas em andamento na thread
+_estatisticas = {}
+_locais = collections.Counter()
+_tempo_locais = collections.Counter()
+_lentas = collections.deque(maxlen=50)
+_log = None
+_inicio = time.time()
+
+class _Estatistica:
+    __slots__ = ("chamadas", "total_ms", "max_ms", "linhas", "faixas", "amostras")
+
+    def __init__(self):
+        self.chamadas = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.linhas = 0
+        self.faixas = [0] * (len(FAIXAS_MS) + 1)
+        self.amostras = collections.deque(maxlen=AMOSTRAS_POR_FUNCAO)
+
+    def registrar(self, ms, linhas):
+        self.chamadas += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.linhas += linhas or 0
+        self.amostras.append(ms)
+        for i, limite in enumerate(FAIXAS_MS):
+            if ms <= limite:
+                self.faixas[i] += 1
+                break
+        else:
+            self.faixas[-1] += 1
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    """Conexão que repassa o SQL executado para a chamada instrumentada em andamento."""
+
+    def execute(self, sql, parameters=(), /):
+        if _ativo:
+            _anotar_sql(sql, parameters)
+        return super().execute(sql, parameters)
+
+    def executemany(self, sql, parameters, /):
+        if _ativo:
+            parameters = list(parameters)
+            _anotar_sql(sql, parameters, lote=True)
+        return super().executemany(sql, parameters)
+
+def _anotar_sql(sql, params, lote=False):
+    chamadas = getattr(_pilha, "chamadas", None)
+    if chamadas:
+        chamadas[-1]["sql"].append((" ".join(sql.split()), params, lote))
+
+def _local_chamada():
+    quadro = sys._getframe(2)
+    while quadro and os.path.basename(quadro.f_code.co_filename) in IGNORAR_LOCAL:
+        quadro = quadro.f_back
+    if quadro is None:
+        return "?"
+    return f"{os.path.basename(quadro.f_code.co_filename)}:{quadro.f_lineno} ({quadro.f_code.co_name})"
+
+def _contar_linhas(resultado):
+    if isinstance(resultado, (list, tuple)):
+        return len(resultado)
+    if resultado is None or isinstance(resultado, bool):
+        return 0
+    return 1
+
+def _iniciar(nome):
+    chamadas = getattr(_pilha, "chamadas", None)
+    if chamadas is None:
+        chamadas = _pilha.chamadas = []
+    chamada = {"funcao": nome, "local": _local_chamada(), "sql": []}
+    chamadas.append(chamada)
+    return chamada, time.perf_counter()
+
+def _finalizar(chamada, inicio, linhas):
+    ms = (time.perf_counter() - inicio) * 1000
+    _pilha.chamadas.pop()
+    nome, local = chamada["funcao"], chamada["local"]
+    with _lock:
+        estatistica = _estatisticas.get(nome)
+        if estatistica is None:
+            estatistica = _estatisticas[nome] = _Estatistica()
+        estatistica.registrar(ms, linhas)
+        _locais[(nome, local)] += 1
+        _tempo_locais[(nome, local)] += ms
+    if ms >= LIMITE_LENTO_MS:
+        _registrar_lenta(chamada, ms, linhas)
+
+def instrumentado(funcao):
+    """Decorador das funções do database.py; sem efeito enquanto o profiler estiver desligado."""
+    nome = funcao.__name__
+
+    if inspect.isgeneratorfunction(funcao):
+        # Geradores: mede da primeira à última linha entregue
+        @functools.wraps(funcao)
+        def gerador(*args, **kwargs):
+            if not _ativo:
+                yield from funcao(*args, **kwargs)
+                return
+            chamada, inicio = _iniciar(nome)
+            linhas = 0
+            try:
+                for linha in funcao(*args, **kwargs):
+                    linhas += 1
+                    yield linha
+            finally:
+                _finalizar(chamada, inicio, linhas)
+        return gerador
+
+    @functools.wraps(funcao)
+    def wrapper(*args, **kwargs):
+        if not _ativo:
+            return funcao(*args, **kwargs)
+        chamada, inicio = _iniciar(nome)
+        resultado = None
+        try:
+            resultado = funcao(*args, **kwargs)
+            return resultado
+        finally:
+            _finalizar(chamada, inicio, _contar_linhas(resultado))
+    return wrapper
+
+# --- Log de consultas lentas -------------------------------------------------
+
+def _logger():
+    global _log
+    if _log is None:
+        _log = logging.getLogger("estoque.consultas_lentas")
+        _log.setLevel(logging.INFO)
+        _log.propagate = False
+        if not _log.handlers:
+            handler = RotatingFileHandler(ARQUIVO_LOG, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _log.addHandler(handler)
+    return _log
+
+def _params_serializaveis(params, lote):
+    if lote:
+        return {"lote": len(params), "primeiro": _params_serializaveis(params[0], False) if params else None}
+    if isinstance(params, dict):
+        return {k: str(v) for k, v in list(params.items())[:MAX_PARAMS_LOG]}
+    params = list(params)
+    resumo = [v if isinstance(v, (int, float, str, type(None))) else str(v) for v in params[:MAX_PARAMS_LOG]]
+    if len(params) > MAX_PARAMS_LOG:
+        resumo.append(f"... +{len(params) - MAX_PARAMS_LOG}")
+    return resumo
+
+def _registrar_lenta(chamada, ms, linhas):
+    registro = {
+        "data": datetime.now().isoformat(timespec="milliseconds"),
+        "funcao": chamada["funcao"],
+        "ms": round(ms, 2),
+        "linhas": linhas,
+        "local": chamada["local"],
+        "sql": [],
+    }
+    for sql, params, lote in chamada["sql"]:
+        item = {"sql": sql, "params": _params_serializaveis(params, lote)}
+        if PLANO_NO_LOG:
+            item["plano"] = explicar(sql, params[0] if lote and params else params)
+        registro["sql"].append(item)
+    # Guarda os parâmetros originais em memória para o EXPLAIN sob demanda no painel
+    _lentas.append({**registro, "_sql": chamada["sql"]})
+    try:
+        _logger().info(json.dumps(registro, ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"Erro ao gravar log de consultas lentas: {e}")
+
+def explicar(sql, params=()):
+    """Retorna as linhas do EXPLAIN QUERY PLAN de um comando (vazio para BEGIN/COMMIT/PRAGMA etc.)."""
+    if sql.split(None, 1)[0].upper() not in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE"):
+        return []
+    from database import get_db_connection
+    try:
+        # Chama o execute da classe base para o EXPLAIN não ser anotado numa chamada em andamento
+        plano = sqlite3.Connection.execute(get_db_connection(), "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except sqlite3.Error as e:
+        return [f"(erro: {e})"]
+    # Recuo pela profundidade do nó (id -> pai)
+    profundidade = {0: -1}
+    linhas = []
+    for no, pai, _, detalhe in plano:
+        profundidade[no] = profundidade.get(pai, -1) + 1
+        linhas.append("  " * profundidade[no] + detalhe)
+    return linhas
+
+# --- Controle e relatórios ---------------------------------------------------
+
+def ativar(limite_ms=None):
+    global _ativo, LIMITE_LENTO_MS
+    if limite_ms is not None:
+        LIMITE_LENTO_MS = limite_ms
+    _ativo = True
+
+def desativar():
+    global _ativo
+    _ativo = False
+
+def ativo():
+    return _ativo
+
+def zerar():
+    global _inicio
+    with _lock:
+        _estatisticas.clear()
+        _locais.clear()
+        _tempo_locais.clear()
+        _lentas.clear()
+        _inicio = time.time()
+
+def _percentil(amostras, p):
+    ordenadas = sorted(amostras)
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * p))] if ordenadas else 0.0
+
+def estatisticas():
+    """Uma linha por função instrumentada, da que consumiu mais tempo para a que consumiu menos."""
+    with _lock:
+        linhas = [{
+            "funcao": nome,
+            "chamadas": e.chamadas,
+            "total_ms": round(e.total_ms, 2),
+            "media_ms": round(e.total_ms / e.chamadas, 3),
+            "p50_ms": round(statistics.median(e.amostras), 3),
+            "p95_ms": round(_percentil(e.amostras, 0.95), 3),
+            "max_ms": round(e.max_ms, 2),
+            "linhas": e.linhas,
+            "histograma": dict(zip([f"<={l}ms" for l in FAIXAS_MS] + [f">{FAIXAS_MS[-1]}ms"], e.faixas)),
+        } for nome, e in _estatisticas.items()]
+    return sorted(linhas, key=lambda l: l["total_ms"], reverse=True)
+
+def locais_quentes(n=10):
+    """Locais de chamada (função, arquivo:linha) que mais consumiram tempo."""
+    with _lock:
+        mais = sorted(_tempo_locais.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [{"funcao": f, "local": l, "chamadas": _locais[(f, l)], "total_ms": round(ms, 2)} for (f, l), ms in mais]
+
+def consultas_lentas():
+    """Últimas chamadas acima do limite, da mais recente para a mais antiga."""
+    return list(reversed(_lentas))
+
+def relatorio(n=15):
+    linhas = [f"Perfil da camada de dados desde {datetime.fromtimestamp(_inicio):%d/%m %H:%M:%S}"
+              f" (profiler {'ativo' if _ativo else 'desligado'}, lenta >= {LIMITE_LENTO_MS:.0f} ms)", ""]
+    linhas.append(f"{'função':<32}{'chamadas':>9}{'total ms':>11}{'p50':>9}{'p95':>9}{'máx':>9}{'linhas':>9}")
+    for e in estatisticas()[:n]:
+        linhas.append(f"{e['funcao']:<32}{e['chamadas']:>9}{e['total_ms']:>11.1f}{e['p50_ms']:>9.2f}"
+                      f"{e['p95_ms']:>9.2f}{e['max_ms']:>9.1f}{e['linhas']:>9}")
+    linhas += ["", "Locais de chamada mais custosos:"]
+    for l in locais_quentes(n):
+        linhas.append(f"  {l['total_ms']:>10.1f} ms  {l['chamadas']:>6}x  {l['funcao']} <- {l['local']}")
+    return "\n".join(linhas)
+
+@atexit.register
+def _despejar_ao_sair():
+    if _ativo and _estatisticas:
+        print(relatorio())
+
+# --- Linha de comando: resumo do log de consultas lentas ---------------------
+
+def ler_log(caminho=ARQUIVO_LOG):
+    """Lê o log atual e os arquivos rotacionados (.1, .2, ...), do mais antigo para o mais novo."""
+    arquivos = [f"{caminho}.{i}" for i in range(LOG_BACKUPS, 0, -1)] + [caminho]
+    for arquivo in arquivos:
+        if not os.path.exists(arquivo):
+            continue
+        with open(arquivo, encoding="utf-8") as f:
+            for linha in f:
+                if linha.strip():
+                    yield json.loads(linha)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resume o log de consultas lentas.")
+    parser.add_argument("--log", default=ARQUIVO_LOG)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--plano", action="store_true", help="mostra o EXPLAIN QUERY PLAN da chamada mais lenta de cada função")
+    parser.add_argument("--banco", help="banco usado no --plano (padrão: o do app)")
+    args = parser.parse_args(argv)
+
+    por_funcao = {}
+    por_local = collections.Counter()
+    for registro in ler_log(args.log):
+        atual = por_funcao.setdefault(registro["funcao"], {"n": 0, "total": 0.0, "pior": registro})
+        atual["n"] += 1
+        atual["total"] += registro["ms"]
+        if registro["ms"] > atual["pior"]["ms"]:
+            atual["pior"] = registro
+        por_local[(registro["funcao"], registro["local"])] += registro["ms"]
+
+    if not por_funcao:
+        print(f"Nenhuma consulta lenta em {args.log}.")
+        return
+    print(f"{'função':<32}{'lentas':>8}{'total ms':>11}{'pior ms':>10}")
+    mais = sorted(por_funcao.items(), key=lambda item: item[1]["total"], reverse=True)[:args.top]
+    for nome, r in mais:
+        print(f"{nome:<32}{r['n']:>8}{r['total']:>11.1f}{r['pior']['ms']:>10.1f}")
+    print("\nLocais de chamada:")
+    for (nome, local), ms in por_local.most_common(args.top):
+        print(f"  {ms:>10.1f} ms  {nome} <- {local}")
+
+    if args.plano:
+        import database
+        if args.banco:
+            database.DB_NAME = args.banco
+        for nome, r in mais:
+            print(f"\n== {nome} ({r['pior']['ms']} ms, {r['pior']['data']})")
+            for item in r["pior"]["sql"]:
+                print(f"  {item['sql']}")
+                params = item["params"]
+                if isinstance(params, dict) and "lote" in params:
+                    params = params["primeiro"] or []
+                for linha in item.get("plano") or explicar(item["sql"], params):
+                    print(f"    {linha}")
+
+if __name__ == "__main__":
+    main()
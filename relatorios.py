@@ -0,0 +1,307 @@
+from collections import Counter
+from datetime import date, datetime, timedelta, timezone
+
+from arquivamento import particoes
+from database import get_db_connection, transacao
+from profiler import instrumentado
+
+# Séries de vendas por período (dia/semana/mês), no total ou por categoria/produto.
+# Intervalos curtos são lidos direto de vendas/itens_venda (varredura pelo
+# índice de vendas.data); intervalos maiores usam as tabelas de resumo diário
+# vendas_dia e vendas_dia_produto, mantidas por triggers (migração 8), para que
+# anos de histórico custem algumas centenas de linhas por consulta.
+# Os relatórios consideram todas as vendas do período, pagas ou fiado.
+# vendas.data é gravada em UTC (CURRENT_TIMESTAMP); o dia de uma venda é o
+# dia local, date(data, 'localtime'), nos resumos e nas leituras diretas.
+
+AGRUPAMENTOS = {
+    "dia": "{dia}",
+    "semana": "date({dia}, '-6 days', 'weekday 1')",  # segunda-feira da semana
+    "mes": "strftime('%Y-%m', {dia})",
+}
+# Rótulo de cada série; as séries por produto são agrupadas por produto_id
+# (produtos com o mesmo nome não se misturam) e o nome é só o rótulo
+DETALHAMENTOS = {
+    "categoria": "COALESCE(NULLIF(p.categoria, ''), 'Sem categoria')",
+    "produto": "COALESCE(p.nome, 'Produto #' || {produto_id})",
+}
+LIMITE_DIAS_CONSULTA_DIRETA = 7
+OUTROS = "Outros"
+
+def _data(valor):
+    return valor if isinstance(valor, date) else date.fromisoformat(str(valor)[:10])
+
+def _instante_utc(dia):
+    """Meia-noite local do dia, no formato UTC de vendas.data (limite das leituras diretas pelo índice)."""
+    return datetime.combine(dia, datetime.min.time()).astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def _periodos(inicio, fim, agrupamento):
+    """Todas as chaves de período entre inicio e fim (para preencher dias sem venda)."""
+    chaves = []
+    dia = inicio
+    while dia <= fim:
+        if agrupamento == "dia":
+            chave = dia.isoformat()
+        elif agrupamento == "semana":
+            chave = (dia - timedelta(days=dia.weekday())).isoformat()
+        else:
+            chave = dia.strftime("%Y-%m")
+        if not chaves or chaves[-1] != chave:
+            chaves.append(chave)
+        dia += timedelta(days=1)
+    return chaves
+
+def _linha(periodo, chave=None, vendas=None, itens=0, faturamento=0.0, custo=0.0):
+    faturamento = round(faturamento or 0.0, 2)
+    custo = round(custo or 0.0, 2)
+    margem = round(faturamento - custo, 2)
+    return {
+        "periodo": periodo,
+        "chave": chave,
+        "vendas": vendas,
+        "itens": itens or 0,
+        "faturamento": faturamento,
+        "custo": custo,
+        "margem": margem,
+        "margem_pct": round(100 * margem / faturamento, 1) if faturamento else 0.0,
+        "ticket_medio": round(faturamento / vendas, 2) if vendas else None,
+    }
+
+def _consultas_diretas(agrupamento, detalhamento):
+    # Leitura direta: faixa de vendas.data pelo índice idx_vendas_data
+    periodo = AGRUPAMENTOS[agrupamento].format(dia="date(v.data, 'localtime')")
+    itens = f'''
+        SELECT {periodo} AS periodo, {{grupo}} AS grupo, {{chave}} AS chave, SUM(iv.quantidade) AS itens,
+               SUM(iv.quantidade * iv.preco_unitario) AS faturamento,
+               SUM(iv.quantidade * iv.custo_unitario) AS custo
+        FROM {{esquema}}.vendas v
+        JOIN {{esquema}}.itens_venda iv ON iv.venda_id = v.id
+        {{juncao}}
+        WHERE v.data >= ? AND v.data < ?
+        GROUP BY periodo, grupo
+    '''
+    if detalhamento:
+        # produtos só entra para dar nome/categoria à chave; o custo vem do item
+        chave = DETALHAMENTOS[detalhamento].format(produto_id="iv.produto_id")
+        return [itens.format(grupo="iv.produto_id" if detalhamento == "produto" else chave, chave=chave,
+                             juncao="LEFT JOIN produtos p ON p.id = iv.produto_id", esquema="{esquema}")]
+    vendas = f'''
+        SELECT {periodo} AS periodo, COUNT(*) AS vendas, SUM(v.total) AS faturamento
+        FROM {{esquema}}.vendas v WHERE v.data >= ? AND v.data < ?
+        GROUP BY periodo
+    '''
+    return [vendas, itens.format(grupo="NULL", chave="NULL", juncao="", esquema="{esquema}")]
+
+def _consultas_resumo(agrupamento, detalhamento):
+    if detalhamento == "categoria":
+        return [f'''
+            SELECT {AGRUPAMENTOS[agrupamento].format(dia="x.dia")} AS periodo, x.categoria AS grupo, x.categoria AS chave,
+                   SUM(x.quantidade) AS itens, SUM(x.faturamento) AS faturamento, SUM(x.custo) AS custo
+            FROM vendas_dia_categoria x WHERE x.dia >= ? AND x.dia < ?
+            GROUP BY periodo, grupo
+        ''']
+    if detalhamento == "produto":
+        return [f'''
+            SELECT {AGRUPAMENTOS[agrupamento].format(dia="x.dia")} AS periodo, x.produto_id AS grupo,
+                   {DETALHAMENTOS["produto"].format(produto_id="x.produto_id")} AS chave,
+                   SUM(x.quantidade) AS itens, SUM(x.faturamento) AS faturamento, SUM(x.custo) AS custo
+            FROM vendas_dia_produto x
+            LEFT JOIN produtos p ON p.id = x.produto_id
+            WHERE x.dia >= ? AND x.dia < ?
+            GROUP BY periodo, grupo
+        ''']
+    return [f'''
+        SELECT {AGRUPAMENTOS[agrupamento].format(dia="d.dia")} AS periodo, SUM(d.vendas) AS vendas,
+               SUM(d.faturamento) AS faturamento, SUM(d.itens) AS itens, SUM(d.custo) AS custo
+        FROM vendas_dia d WHERE d.dia >= ? AND d.dia < ?
+        GROUP BY periodo
+    ''']
+
+@instrumentado
+def serie_vendas(inicio, fim, agrupamento="dia", detalhamento=None, limite=8, fonte=None):
+    """
+    Faturamento, itens, custo, margem e ticket médio por período, de inicio a fim (inclusive).
+    agrupamento: 'dia', 'semana' ou 'mes'.
+    detalhamento: None (total), 'categoria' ou 'produto'; mantém as `limite` chaves de
+    maior faturamento e soma as demais em "Outros". Ticket médio só no total.
+    fonte: None (automático), 'direta' ou 'resumo'. Por categoria a fonte é sempre o
+    resumo, que guarda a categoria do produto na data da venda.
+    """
+    if agrupamento not in AGRUPAMENTOS:
+        raise ValueError(f"agrupamento inválido: {agrupamento}")
+    if detalhamento and detalhamento not in DETALHAMENTOS:
+        raise ValueError(f"detalhamento inválido: {detalhamento}")
+    inicio, fim = _data(inicio), _data(fim)
+    if fonte is None:
+        fonte = "direta" if (fim - inicio).days < LIMITE_DIAS_CONSULTA_DIRETA else "resumo"
+    if detalhamento == "categoria":
+        fonte = "resumo"
+    consultas = (_consultas_diretas if fonte == "direta" else _consultas_resumo)(agrupamento, detalhamento)
+    if fonte == "direta":
+        params = (_instante_utc(inicio), _instante_utc(fim + timedelta(days=1)))
+    else:
+        params = (inicio.isoformat(), (fim + timedelta(days=1)).isoformat())
+    conn = get_db_connection()
+    # O resumo diário guarda também os dias arquivados; a leitura direta
+    # consulta cada arquivo anual que cobre o período (arquivamento.py)
+    def executar(consulta):
+        for esquema in particoes(conn, *params) if fonte == "direta" else ["main"]:
+            yield from conn.execute(consulta.format(esquema=esquema), params)
+
+    if detalhamento:
+        linhas = list(executar(consultas[0]))
+        totais, nomes = {}, {}
+        for l in linhas:
+            totais[l['grupo']] = totais.get(l['grupo'], 0.0) + (l['faturamento'] or 0.0)
+            nomes[l['grupo']] = l['chave']
+        principais = sorted(totais, key=totais.get, reverse=True)[:limite]
+        # Produtos homônimos entre os principais ganham o id no rótulo
+        repeticoes = Counter(nomes[g] for g in principais)
+        rotulos = {g: f"{nomes[g]} (#{g})" if repeticoes[nomes[g]] > 1 else nomes[g] for g in principais}
+        agregado = {}
+        for l in linhas:
+            chave = rotulos.get(l['grupo'], OUTROS)
+            atual = agregado.setdefault((l['periodo'], chave), [0, 0.0, 0.0])
+            atual[0] += l['itens'] or 0
+            atual[1] += l['faturamento'] or 0.0
+            atual[2] += l['custo'] or 0.0
+        return [_linha(periodo, chave, None, *valores) for (periodo, chave), valores in sorted(agregado.items())]
+
+    # Total: vendas e faturamento vêm de vendas; itens e custo, dos itens
+    por_periodo = {}
+    for consulta in consultas:
+        parcial = {}  # soma das partições; entre as consultas vale a primeira
+        for l in executar(consulta):
+            atual = parcial.setdefault(l['periodo'], {})
+            for k in l.keys():
+                if k not in ("periodo", "grupo", "chave"):
+                    atual[k] = atual.get(k, 0) + (l[k] or 0)
+        for periodo, valores in parcial.items():
+            destino = por_periodo.setdefault(periodo, {})
+            for k, valor in valores.items():
+                destino.setdefault(k, valor)
+    serie = []
+    for periodo in _periodos(inicio, fim, agrupamento):
+        v = por_periodo.get(periodo, {})
+        serie.append(_linha(periodo, None, v.get('vendas', 0), v.get('itens', 0), v.get('faturamento', 0.0), v.get('custo', 0.0)))
+    return serie
+
+def totais_periodo(inicio, fim):
+    """Totais de inicio a fim (inclusive): vendas, itens, faturamento, custo, margem e ticket médio."""
+    serie = serie_vendas(inicio, fim, "mes")
+    return _linha(f"{_data(inicio)}..{_data(fim)}", None,
+                  sum(l['vendas'] for l in serie), sum(l['itens'] for l in serie),
+                  sum(l['faturamento'] for l in serie), sum(l['custo'] for l in serie))
+
+def primeira_venda():
+    """Data da venda mais antiga (ou None), para o período "todo o histórico"."""
+    dia = get_db_connection().execute("SELECT MIN(dia) FROM vendas_dia").fetchone()[0]
+    return _data(dia) if dia else None
+
+def intervalo_rapido(nome, hoje=None):
+    """(inicio, fim) dos atalhos de período: hoje, 7d, 30d, 90d, mes, mes_anterior, 12m, tudo."""
+    hoje = hoje or date.today()
+    if nome == "hoje":
+        return hoje, hoje
+    if nome in ("7d", "30d", "90d"):
+        return hoje - timedelta(days=int(nome[:-1]) - 1), hoje
+    if nome == "mes":
+        return hoje.replace(day=1), hoje
+    if nome == "mes_anterior":
+        fim = hoje.replace(day=1) - timedelta(days=1)
+        return fim.replace(day=1), fim
+    if nome == "12m":
+        return (hoje.replace(day=1) - timedelta(days=335)).replace(day=1), hoje
+    if nome == "tudo":
+        return primeira_venda() or hoje, hoje
+    raise ValueError(f"período inválido: {nome}")
+
+def agrupamento_sugerido(inicio, fim):
+    dias = (_data(fim) - _data(inicio)).days + 1
+    return "dia" if dias <= 31 else "semana" if dias <= 120 else "mes"
+
+# --- Resumo diário -----------------------------------------------------------
+
+def reconstruir_vendas_dia():
+    """Recalcula o resumo diário (vendas_dia, vendas_dia_produto e vendas_dia_categoria) do zero."""
+    # Soma as vendas arquivadas pelos totais diários gravados ao arquivar (arquivamento.py)
+    with transacao() as conn:
+        for tabela in ("vendas_dia", "vendas_dia_produto", "vendas_dia_categoria"):
+            conn.execute(f"DELETE FROM {tabela}")
+        conn.execute('''
+            INSERT INTO vendas_dia_produto (dia, produto_id, quantidade, faturamento, custo)
+            SELECT dia, produto_id, SUM(quantidade), SUM(faturamento), SUM(custo) FROM (
+                SELECT date(v.data, 'localtime') AS dia, iv.produto_id, SUM(iv.quantidade) AS quantidade,
+                       SUM(iv.quantidade * iv.preco_unitario) AS faturamento, SUM(iv.quantidade * iv.custo_unitario) AS custo
+                FROM vendas v
+                JOIN itens_venda iv ON iv.venda_id = v.id
+                GROUP BY dia, iv.produto_id
+                UNION ALL
+                SELECT dia, produto_id, quantidade, faturamento, custo FROM arquivos_vendas_dia_produto
+            )
+            GROUP BY dia, produto_id
+        ''')
+        conn.execute('''
+            INSERT INTO vendas_dia_categoria (dia, categoria, quantidade, faturamento, custo)
+            SELECT x.dia, COALESCE(NULLIF(p.categoria, ''), 'Sem categoria') AS cat,
+                   SUM(x.quantidade), SUM(x.faturamento), SUM(x.custo)
+            FROM vendas_dia_produto x
+            LEFT JOIN produtos p ON p.id = x.produto_id
+            GROUP BY x.dia, cat
+        ''')
+        conn.execute('''
+            INSERT INTO vendas_dia (dia, vendas, faturamento, itens, custo)
+            SELECT v.dia, SUM(v.vendas), SUM(v.faturamento), COALESCE(x.itens, 0), COALESCE(x.custo, 0)
+            FROM (
+                SELECT date(data, 'localtime') AS dia, COUNT(*) AS vendas, SUM(total) AS faturamento FROM vendas GROUP BY dia
+                UNION ALL
+                SELECT dia, vendas, faturamento FROM arquivos_vendas_dia
+            ) v
+            LEFT JOIN (SELECT dia, SUM(quantidade) AS itens, SUM(custo) AS custo FROM vendas_dia_produto GROUP BY dia) x
+                ON x.dia = v.dia
+            GROUP BY v.dia
+        ''')
+
+def verificar_vendas_dia(tolerancia=0.005):
+    """
+    Dias em que o resumo diário diverge da leitura direta: {dia: (resumo, recalculado)}.
+    Os totais gerais (dias com venda, vendas, itens e faturamento) também são
+    conferidos com vendas/itens_venda e os totais arquivados, na chave "total".
+    """
+    # O período vem das vendas, não do próprio resumo: um resumo vazio ou perdido também diverge
+    conn = get_db_connection()
+    divergencias = _conferir_totais_vendas_dia(conn, tolerancia)
+    primeira, ultima = conn.execute('''
+        SELECT date(MIN(primeira), 'localtime'), date(MAX(ultima), 'localtime') FROM (
+            SELECT MIN(data) AS primeira, MAX(data) AS ultima FROM vendas
+            UNION ALL
+            SELECT MIN(data_inicio), MAX(data_fim) FROM arquivos_vendas
+        )
+    ''').fetchone()
+    if primeira is None:
+        return divergencias
+    inicio, fim = _data(primeira), max(date.today(), _data(ultima))
+    campos = ("vendas", "itens", "faturamento", "custo")
+    resumo = serie_vendas(inicio, fim, "dia", fonte="resumo")
+    direta = serie_vendas(inicio, fim, "dia", fonte="direta")
+    for r, d in zip(resumo, direta):
+        if any(abs(r[c] - d[c]) > tolerancia for c in campos):
+            divergencias[r['periodo']] = ({c: r[c] for c in campos}, {c: d[c] for c in campos})
+    return divergencias
+
+def _conferir_totais_vendas_dia(conn, tolerancia):
+    resumo = conn.execute('''
+        SELECT COUNT(*) AS dias, COALESCE(SUM(vendas), 0) AS vendas, COALESCE(SUM(itens), 0) AS itens,
+               COALESCE(SUM(faturamento), 0) AS faturamento
+        FROM vendas_dia WHERE vendas > 0
+    ''').fetchone()
+    origem = conn.execute('''
+        SELECT (SELECT COUNT(*) FROM (SELECT date(data, 'localtime') FROM vendas UNION SELECT dia FROM arquivos_vendas_dia)) AS dias,
+               (SELECT COUNT(*) FROM vendas) + (SELECT COALESCE(SUM(vendas), 0) FROM arquivos_vendas) AS vendas,
+               (SELECT COALESCE(SUM(quantidade), 0) FROM itens_venda) + (SELECT COALESCE(SUM(itens), 0) FROM arquivos_vendas) AS itens,
+               (SELECT COALESCE(SUM(total), 0) FROM vendas) + (SELECT COALESCE(SUM(total), 0) FROM arquivos_vendas) AS faturamento
+    ''').fetchone()
+    campos = ("dias", "vendas", "itens", "faturamento")
+    if any(abs(resumo[c] - origem[c]) > tolerancia for c in campos):
+        return {"total": ({c: resumo[c] for c in campos}, {c: origem[c] for c in campos})}
+    return {}
@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import functools
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from http import HTTPStatus
+
+import analise
+import database as db
+import relatorios
+
+# Servidor local (HTTP/JSON, só biblioteca padrão) para vários caixas usarem
+# o mesmo banco: cada terminal roda main.py com ESTOQUE_SERVIDOR=http://host:porta
+# e a interface chama as funções do database.py por aqui (cliente_api.py).
+#
+#   python servidor.py --banco estoque_vendas.db --host 0.0.0.0 --porta 8765
+#
+# Protocolo: POST /api/<função> com {"args": [...], "kwargs": {...}} responde
+# {"resultado": ...}; erros vêm como {"erro": {"tipo", "mensagem", "dados"}}.
+# GET /api/saude informa versão do esquema e escritas na fila.
+#
+# Leituras rodam em paralelo num pool de threads (cada uma com sua conexão,
+# em WAL não bloqueiam a gravação). Escritas entram numa fila única e são
+# executadas uma de cada vez pela thread escritora: nunca há duas transações
+# de escrita disputando o banco, e a ordem de chegada é respeitada.
+
+HOST = "127.0.0.1"
+PORTA = 8765
+LEITORES = 4
+MAX_CORPO = 4 * 1024 * 1024
+
+LEITURAS = {
+    "get_produtos": db.get_produtos,
+    "get_produto": db.get_produto,
+    "contar_produtos": db.contar_produtos,
+    "get_unique_categories": db.get_unique_categories,
+    "get_fornecedores": db.get_fornecedores,
+    "get_produto_movimentacoes": db.get_produto_movimentacoes,
+    "buscar_por_codigo_barras": db.buscar_por_codigo_barras,
+    "buscar_clientes": db.buscar_clientes,
+    "get_clientes": db.get_clientes,
+    "get_historico_compras": db.get_historico_compras,
+    "get_devedores": db.get_devedores,
+    "get_resumo_devedores": db.get_resumo_devedores,
+    "get_saldo_cliente": db.get_saldo_cliente,
+    "get_pagamentos": db.get_pagamentos,
+    "get_dashboard_stats": db.get_dashboard_stats,
+    "get_mais_vendidos": db.get_mais_vendidos,
+    "get_mais_vendidos_por_categoria": db.get_mais_vendidos_por_categoria,
+    "estatisticas_cache": db.estatisticas_cache,
+    "serie_vendas": relatorios.serie_vendas,
+    "totais_periodo": relatorios.totais_periodo,
+    "primeira_venda": relatorios.primeira_venda,
+    "resumo_analitico": analise.resumo_analitico,
+}
+ESCRITAS = {
+    "add_produto": db.add_produto,
+    "update_produto": db.update_produto,
+    "ajustar_estoque": db.ajustar_estoque,
+    "registrar_devolucao": db.registrar_devolucao,
+    "delete_produto": db.delete_produto,
+    "add_cliente": db.add_cliente,
+    "delete_cliente": db.delete_cliente,
+    "registrar_venda": db.registrar_venda,
+    "registrar_vendas_em_lote": db.registrar_vendas_em_lote,
+    "registrar_pagamento": db.registrar_pagamento,
+    "quitar_divida": db.quitar_divida,
+}
+
+class ErroPedido(Exception):
+    """Pedido HTTP inválido (rota, método ou corpo)."""
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+
+def codificar(valor):
+    """Converte o retorno das funções do database.py para JSON (linhas viram colunas + valores)."""
+    if isinstance(valor, sqlite3.Row):
+        return {"__linha__": [list(valor.keys()), list(valor)]}
+    if isinstance(valor, (list, tuple)):
+        if valor and all(isinstance(v, sqlite3.Row) for v in valor):
+            # Listas de linhas (o caso comum): nomes das colunas uma vez só
+            return {"__linhas__": [list(valor[0].keys()), [list(v) for v in valor]]}
+        return [codificar(v) for v in valor]
+    if isinstance(valor, dict):
+        return {chave: codificar(v) for chave, v in valor.items()}
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+def _erro(status, excecao, dados=None):
+    return status, {"erro": {"tipo": type(excecao).__name__, "mensagem": str(excecao), "dados": dados}}
+
+class Servidor:
+    def __init__(self, leitores=LEITORES):
+        self.leitores = ThreadPoolExecutor(max_workers=leitores, thread_name_prefix="leitor")
+        self.escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="escritor")
+        self.fila = None  # asyncio.Queue, criada dentro do loop
+        self.contadores = {"leituras": 0, "escritas": 0, "erros": 0}
+        self.inicio = time.time()
+
+    async def iniciar(self, host=HOST, porta=PORTA):
+        self.fila = asyncio.Queue()
+        self._tarefa_escritor = asyncio.create_task(self._escrever())
+        return await asyncio.start_server(self._atender, host, porta)
+
+    async def _escrever(self):
+        # Único consumidor da fila: uma escrita por vez, sempre na mesma thread/conexão
+        loop = asyncio.get_running_loop()
+        while True:
+            funcao, args, kwargs, futuro = await self.fila.get()
+            try:
+                resultado = await loop.run_in_executor(self.escritor, functools.partial(funcao, *args, **kwargs))
+            except Exception as e:
+                if not futuro.cancelled():
+                    futuro.set_exception(e)
+            else:
+                if not futuro.cancelled():
+                    futuro.set_result(resultado)
+            finally:
+                self.fila.task_done()
+
+    def saude(self):
+        conn = db.get_db_connection()
+        return {
+            "ok": True,
+            "banco": db.DB_NAME,
+            "versao_esquema": conn.execute("PRAGMA user_version").fetchone()[0],
+            "escritas_na_fila": self.fila.qsize(),
+            "ativo_ha_s": round(time.time() - self.inicio),
+            **self.contadores,
+        }
+
+    async def executar(self, nome, args, kwargs):
+        loop = asyncio.get_running_loop()
+        if nome in ESCRITAS:
+            futuro = loop.create_future()
+            await self.fila.put((ESCRITAS[nome], args, kwargs, futuro))
+            self.contadores["escritas"] += 1
+            return await futuro
+        self.contadores["leituras"] += 1
+        return await loop.run_in_executor(self.leitores, functools.partial(LEITURAS[nome], *args, **kwargs))
+
+    async def despachar(self, metodo, caminho, corpo):
+        caminho = caminho.split("?", 1)[0]
+        if not caminho.startswith("/api/"):
+            raise ErroPedido(HTTPStatus.NOT_FOUND, f"rota inválida: {caminho}")
+        nome = caminho[len("/api/"):]
+        if nome == "saude" and metodo == "GET":
+            return HTTPStatus.OK, self.saude()
+        if nome not in LEITURAS and nome not in ESCRITAS:
+            raise ErroPedido(HTTPStatus.NOT_FOUND, f"operação desconhecida: {nome}")
+        if metodo != "POST":
+            raise ErroPedido(HTTPStatus.METHOD_NOT_ALLOWED, "use POST")
+        try:
+            pedido = json.loads(corpo or b"{}")
+            args, kwargs = list(pedido.get("args", [])), dict(pedido.get("kwargs", {}))
+        except (ValueError, TypeError, AttributeError):
+            raise ErroPedido(HTTPStatus.BAD_REQUEST, "corpo deve ser JSON {\"args\": [...], \"kwargs\": {...}}")
+
+        try:
+            resultado = await self.executar(nome, args, kwargs)
+        except db.EstoqueInsuficienteError as e:
+            return _erro(HTTPStatus.CONFLICT, e, {"faltas": e.faltas, "indice_venda": e.indice_venda})
+        except db.ConflitoVersao as e:
+            return _erro(HTTPStatus.CONFLICT, e, {"produto_id": e.produto_id, "produto": codificar(e.produto)})
+        except db.CodigoBarrasDuplicadoError as e:
+            return _erro(HTTPStatus.CONFLICT, e, {"codigo_barras": e.codigo_barras})
+        except TypeError as e:
+            # Argumentos que a função não aceita
+            return _erro(HTTPStatus.BAD_REQUEST, e)
+        except ValueError as e:
+            return _erro(HTTPStatus.UNPROCESSABLE_ENTITY, e)
+        except Exception as e:
+            self.contadores["erros"] += 1
+            print(f"Erro em {nome}: {e}")
+            return _erro(HTTPStatus.INTERNAL_SERVER_ERROR, e)
+        return HTTPStatus.OK, {"resultado": codificar(resultado)}
+
+    async def _atender(self, reader, writer):
+        # HTTP/1.1 mínimo com keep-alive: cada caixa mantém uma conexão aberta
+        try:
+            while True:
+                linha = await reader.readline()
+                if not linha:
+                    break
+                metodo, caminho, versao = linha.decode("latin-1").split()
+                cabecalhos = {}
+                while True:
+                    cabecalho = await reader.readline()
+                    if cabecalho in (b"\r\n", b"\n", b""):
+                        break
+                    chave, _, valor = cabecalho.decode("latin-1").partition(":")
+                    cabecalhos[chave.strip().lower()] = valor.strip()
+                manter = versao == "HTTP/1.1" and cabecalhos.get("connection", "").lower() != "close"
+
+                tamanho = int(cabecalhos.get("content-length") or 0)
+                try:
+                    if tamanho > MAX_CORPO:
+                        manter = False
+                        raise ErroPedido(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "corpo grande demais")
+                    corpo = await reader.readexactly(tamanho) if tamanho else b""
+                    status, resposta = await self.despachar(metodo, caminho, corpo)
+                except ErroPedido as e:
+                    status, resposta = _erro(e.status, e)
+
+                dados = json.dumps(resposta, ensure_ascii=False, default=str).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(dados)}\r\n"
+                    f"Connection: {'keep-alive' if manter else 'close'}\r\n\r\n".encode("latin-1") + dados)
+                await writer.drain()
+                if not manter:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def encerrar(self):
+        self._tarefa_escritor.cancel()
+        self.leitores.shutdown(wait=False)
+        self.escritor.shutdown(wait=True)
+
+async def servir(host=HOST, porta=PORTA, leitores=LEITORES, pronto=None):
+    """Roda o servidor até ser cancelado; pronto(servidor) é chamado quando já aceita conexões."""
+    servidor = Servidor(leitores)
+    tcp = await servidor.iniciar(host, porta)
+    print(f"Servidor de estoque em http://{host}:{porta} (banco {db.DB_NAME}, {leitores} leitores)")
+    if pronto:
+        pronto(servidor)
+    try:
+        async with tcp:
+            await tcp.serve_forever()
+    finally:
+        servidor.encerrar()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor local para vários caixas compartilharem o mesmo banco.")
+    parser.add_argument("--banco", default=db.DB_NAME)
+    parser.add_argument("--host", default=HOST, help="0.0.0.0 para aceitar conexões da rede local")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--leitores", type=int, default=LEITORES, help="threads de leitura")
+    args = parser.parse_args(argv)
+
+    db.DB_NAME = args.banco
+    db.init_db()
+    db.carregar_codigos_barras()
+    try:
+        asyncio.run(servir(args.host, args.porta, args.leitores))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.close_db_connections()
+
+if __name__ == "__main__":
+    main()
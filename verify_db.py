@@ -8,24 +8,220 @@ def verify_tables():
         # Tenta inicializar o banco se não existir
         from database import init_db
         init_db()
-        
+
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
-    
+
     tables = ['produtos', 'clientes', 'vendas', 'itens_venda']
     missing_tables = []
-    
+
     for table in tables:
         cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}'")
         if not cursor.fetchone():
             missing_tables.append(table)
-            
+
     conn.close()
-    
+
     if missing_tables:
         print(f"FALHA: Tabelas faltando: {', '.join(missing_tables)}")
     else:
         print("SUCESSO: Todas as tabelas foram criadas corretamente.")
+    return not missing_tables
+
+# Consultas críticas: (descrição, função, argumentos nomeados)
+def _consultas_criticas():
+    import database as db
+    import relatorios
+    return [
+        ("Movimentações do produto", db.get_produto_movimentacoes, {"produto_id": 1}),
+        ("Movimentações do produto (página seguinte)", db.get_produto_movimentacoes, {"produto_id": 1, "cursor": ("2025-01-01 00:00:00", 1000)}),
+        ("Histórico de compras", db.get_historico_compras, {"cliente_id": 1}),
+        ("Devedores", db.get_devedores, {"page_size": 50}),
+        ("Devedores (página seguinte)", db.get_devedores, {"cursor": (100.0, 1), "page_size": 50}),
+        ("Busca de clientes por nome", db.buscar_clientes, {"termo": "José"}),
+        ("Busca de clientes por CPF/telefone", db.buscar_clientes, {"termo": "123.456"}),
+        ("Mais vendidos", db.get_produtos, {"best_sellers": True}),
+        ("Mais vendidos por categoria", db.get_mais_vendidos, {"categoria": "Capinhas"}),
+        ("Produtos (listagem padrão)", db.get_produtos, {}),
+        ("Produtos por categoria", db.get_produtos, {"category": "Capinhas"}),
+        ("Dashboard", db.get_dashboard_stats, {}),
+        ("Código de barras", db.buscar_por_codigo_barras, {"codigo_barras": "0000000000000"}),
+        ("Relatório de poucos dias (direto)", relatorios.serie_vendas, {"inicio": "2025-01-01", "fim": "2025-01-03"}),
+        ("Relatório por produto (resumo diário)", relatorios.serie_vendas, {"inicio": "2024-01-01", "fim": "2024-12-31", "detalhamento": "produto"}),
+    ]
+
+
+def verify_query_plans():
+    """
+    Executa as consultas críticas do database.py, captura o SQL gerado e
+    confere no EXPLAIN QUERY PLAN que nenhuma delas varre uma tabela inteira.
+    """
+    import database as db
+    db.init_db()
+    conn = db.get_db_connection()
+
+    falhas = []
+    for descricao, funcao, kwargs in _consultas_criticas():
+        capturadas = []
+        conn.set_trace_callback(capturadas.append)
+        try:
+            funcao(**kwargs)
+        finally:
+            conn.set_trace_callback(None)
+
+        for sql in capturadas:
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            plano = conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()
+            for linha in plano:
+                detalhe = linha['detail']
+                # Varredura completa só é aceitável em consultas sem filtro (ex.: SUM do estoque)
+                if detalhe.startswith("SCAN ") and "USING" not in detalhe and "WHERE" in sql.upper():
+                    falhas.append(f"{descricao}: {detalhe}")
+
+    if falhas:
+        print("FALHA: Consultas sem índice:")
+        for falha in falhas:
+            print(f"  - {falha}")
+    else:
+        print("SUCESSO: Todas as consultas críticas usam índices.")
+    return not falhas
+
+def verify_dashboard_summary(rebuild=False):
+    """Confere o resumo do dashboard contra os totais recalculados; com rebuild=True, corrige."""
+    import database as db
+    db.init_db()
+
+    divergencias = db.verificar_resumo_dashboard()
+    if not divergencias:
+        print("SUCESSO: Resumo do dashboard confere com os dados.")
+        return True
+
+    print("FALHA: Resumo do dashboard divergente:")
+    for campo, (resumo, recalculado) in divergencias.items():
+        print(f"  - {campo}: resumo={resumo:.2f} recalculado={recalculado:.2f} (diferença {resumo - recalculado:+.2f})")
+    if rebuild:
+        db.reconstruir_resumo_dashboard()
+        print("Resumo do dashboard reconstruído.")
+    else:
+        print("Execute 'python verify_db.py --reconstruir' para corrigir.")
+    return False
+
+def verify_sales_rollup(rebuild=False):
+    """Confere o resumo diário dos relatórios (vendas_dia) contra as vendas; --reconstruir recalcula."""
+    import relatorios
+    divergencias = relatorios.verificar_vendas_dia()
+    if not divergencias:
+        print("SUCESSO: Resumo diário de vendas confere com os dados.")
+        return True
+    print(f"FALHA: Resumo diário diverge em {len(divergencias)} dia(s):")
+    for dia, (resumo, recalculado) in list(divergencias.items())[:10]:
+        print(f"  - {dia}: resumo={resumo} recalculado={recalculado}")
+    if rebuild:
+        relatorios.reconstruir_vendas_dia()
+        print("Resumo diário reconstruído.")
+    return False
+
+def verify_receivables(rebuild=False):
+    """Confere os saldos dos devedores (saldos_clientes) contra as vendas em aberto; --reconstruir recalcula."""
+    import database as db
+    divergencias = db.verificar_saldos_clientes()
+    if not divergencias:
+        print("SUCESSO: Saldos dos devedores conferem com as vendas em aberto.")
+        return True
+    print(f"FALHA: Saldo divergente para {len(divergencias)} cliente(s):")
+    for cliente_id, (resumo, recalculado) in list(divergencias.items())[:10]:
+        print(f"  - cliente {cliente_id}: resumo={resumo:.2f} recalculado={recalculado:.2f}")
+    if rebuild:
+        db.reconstruir_saldos_clientes()
+        print("Saldos dos devedores reconstruídos.")
+    return False
+
+def verify_stock_ledger(rebuild=False):
+    """Confere se a soma das movimentações de estoque bate com o estoque de cada produto; --reconstruir grava ajustes."""
+    import database as db
+    divergencias = db.verificar_movimentacoes()
+    if not divergencias:
+        print("SUCESSO: Movimentações de estoque conferem com o estoque dos produtos.")
+        return True
+    print(f"FALHA: Estoque diverge das movimentações em {len(divergencias)} produto(s):")
+    for produto_id, (quantidade, soma) in list(divergencias.items())[:10]:
+        print(f"  - produto {produto_id}: estoque={quantidade} movimentações={soma}")
+    if rebuild:
+        db.corrigir_movimentacoes()
+        print("Ajustes de correção gravados nas movimentações.")
+    return False
+
+def verify_best_seller_counters(rebuild=False):
+    """Confere o contador de vendas dos produtos (total_vendido) contra os itens vendidos; --reconstruir recalcula."""
+    import database as db
+    divergencias = db.verificar_total_vendido()
+    if not divergencias:
+        print("SUCESSO: Contadores de mais vendidos conferem com os itens vendidos.")
+        return True
+    print(f"FALHA: Contador de vendas divergente em {len(divergencias)} produto(s):")
+    for produto_id, (contador, recalculado) in list(divergencias.items())[:10]:
+        print(f"  - produto {produto_id}: contador={contador} recalculado={recalculado}")
+    if rebuild:
+        db.reconstruir_total_vendido()
+        print("Contadores de mais vendidos reconstruídos.")
+    return False
+
+def verify_sales_archives():
+    """Confere os arquivos anuais de vendas (arquivamento.py) com os totais gravados no banco principal."""
+    import arquivamento
+    problemas = arquivamento.verificar_arquivos()
+    if not problemas:
+        print("SUCESSO: Arquivos de vendas conferem com o banco principal.")
+        return True
+    print(f"FALHA: Problemas em {len(problemas)} arquivo(s) de vendas:")
+    for ano, erros in problemas.items():
+        for erro in erros:
+            print(f"  - {ano}: {erro}")
+    return False
+
+def verify_analytics_cache():
+    """Confere o cache de itens vendidos da análise (analise.py) com o resumo diário por produto."""
+    import analise
+    if not analise.disponivel():
+        print("AVISO: numpy não instalado; análise de vendas (curva ABC) indisponível.")
+        return True
+    divergencias = analise.verificar_cache()
+    if not divergencias:
+        print("SUCESSO: Cache da análise de vendas confere com o resumo diário.")
+        return True
+    print(f"FALHA: Cache da análise diverge em {len(divergencias)} produto(s):")
+    for produto_id, (cache, banco) in list(divergencias.items())[:10]:
+        print(f"  - produto {produto_id}: cache={cache} banco={banco}")
+    print("  Apague a pasta do cache para recarregá-lo: " + analise.pasta_cache())
+    return False
+
+def verify_barcodes():
+    """Confere se o índice único de códigos de barras existe (a migração 7 não o cria se houver repetidos)."""
+    import database as db
+    conn = db.get_db_connection()
+    indices = [r['name'] for r in conn.execute("PRAGMA index_list(produtos)") if r['unique']]
+    if "idx_produtos_codigo_barras_unico" in indices:
+        print("SUCESSO: Códigos de barras são únicos.")
+        return True
+    print("FALHA: Índice único de código de barras ausente. Códigos repetidos:")
+    for d in conn.execute('''
+        SELECT codigo_barras, GROUP_CONCAT(id) AS ids FROM produtos
+        WHERE codigo_barras IS NOT NULL GROUP BY codigo_barras HAVING COUNT(*) > 1
+    '''):
+        print(f"  - {d['codigo_barras']}: produtos {d['ids']}")
+    print("  Corrija o cadastro e crie o índice: CREATE UNIQUE INDEX idx_produtos_codigo_barras_unico ON produtos (codigo_barras)")
+    return False
 
 if __name__ == "__main__":
+    import sys
     verify_tables()
+    verify_query_plans()
+    verify_dashboard_summary(rebuild="--reconstruir" in sys.argv)
+    verify_sales_rollup(rebuild="--reconstruir" in sys.argv)
+    verify_receivables(rebuild="--reconstruir" in sys.argv)
+    verify_stock_ledger(rebuild="--reconstruir" in sys.argv)
+    verify_best_seller_counters(rebuild="--reconstruir" in sys.argv)
+    verify_sales_archives()
+    verify_analytics_cache()
+    verify_barcodes()
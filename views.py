@@ -1,19 +1,52 @@
 import flet as ft
-from database import *
+from dados import *
 from ui_components import *
+from debounce import Debouncer
+from carrinho import Carrinho
+import importar_exportar
+from dados import analise, relatorios, SERVIDOR
+import profiler
+import inicializacao
+import imagens
 
 import datetime
+import threading
+
+# Tempo sem digitação (em segundos) antes de disparar as buscas
+SEARCH_DEBOUNCE = 0.3
+# Produtos carregados por vez na listagem e distância (px) do fim da lista
+# a partir da qual a próxima página é buscada
+PRODUCTS_PAGE_SIZE = 50
+SCROLL_LOAD_THRESHOLD = 300
+# Devedores carregados por vez (ordenados pelo saldo)
+DEBTORS_PAGE_SIZE = 50
+# Clientes por página na tela de Clientes e sugestões por tecla no Caixa
+CLIENTS_PAGE_SIZE = 50
+CLIENT_SUGGESTIONS = 8
+# Movimentações de estoque por página no diálogo do produto
+MOVEMENTS_PAGE_SIZE = 50
+
+# Relatórios do Dashboard
+REPORT_PERIODS = [("7d", "7 dias"), ("30d", "30 dias"), ("90d", "90 dias"), ("12m", "12 meses"), ("tudo", "Todo o período")]
+REPORT_METRICS = [("faturamento", "Faturamento"), ("margem", "Margem"), ("itens", "Itens"), ("ticket_medio", "Ticket médio")]
+ANALYSIS_PERIODS = [("30", "30 dias"), ("90", "90 dias"), ("365", "12 meses"), ("tudo", "Todo o período")]
 
 class ProductView(ft.Column):
+    # Filtros de uma tela recém-criada (usados pela pré-carga)
+    INITIAL_FILTERS = dict(search_term="", category=None, min_price="", max_price="", low_stock=False,
+                           out_of_stock=False, best_sellers=False, show_inactive=False, sort_by=None)
+
     def __init__(self):
         super().__init__()
         self.expand = True
         self.search_field = NeonTextField(label="Buscar Produto", on_change=self.search_products)
+        # Busca em segundo plano: só o resultado da última tecla é exibido
+        self.search_debouncer = Debouncer(self.fetch_products, self.render_products, delay=SEARCH_DEBOUNCE)
         
         # Filter Controls
         self.category_filter = ft.Dropdown(label="Categoria", options=[], width=200, border_color=NEON_BLUE, text_style=ft.TextStyle(color=TEXT_COLOR), bgcolor=with_opacity(0.1, NEON_BLUE), on_change=self.apply_filters)
-        self.min_price = NeonTextField(label="Min R$", width=100, keyboard_type=ft.KeyboardType.NUMBER, on_change=self.apply_filters)
-        self.max_price = NeonTextField(label="Max R$", width=100, keyboard_type=ft.KeyboardType.NUMBER, on_change=self.apply_filters)
+        self.min_price = NeonTextField(label="Min R$", width=100, keyboard_type=ft.KeyboardType.NUMBER, on_change=self.search_products)
+        self.max_price = NeonTextField(label="Max R$", width=100, keyboard_type=ft.KeyboardType.NUMBER, on_change=self.search_products)
         self.low_stock_filter = ft.Checkbox(label="Baixo Estoque", label_style=ft.TextStyle(color=TEXT_COLOR), on_change=self.apply_filters)
         self.out_of_stock_filter = ft.Checkbox(label="Esgotado", label_style=ft.TextStyle(color=TEXT_COLOR), on_change=self.apply_filters)
         self.best_sellers_filter = ft.Checkbox(label="Mais Vendidos", label_style=ft.TextStyle(color=TEXT_COLOR), on_change=self.apply_filters)
@@ -29,10 +62,25 @@ class ProductView(ft.Column):
             NeonButton("Recentes", lambda e: self.set_sort("date_desc"), icon=ft.Icons.NEW_RELEASES, width=120),
         ], scroll=ft.ScrollMode.AUTO)
 
-        self.products_list = ft.ListView(expand=True, spacing=10)
+        # Paginação por cursor: a próxima página é carregada ao rolar até perto do fim
+        self.products_list = ft.ListView(expand=True, spacing=10, on_scroll=self.on_products_scroll, on_scroll_interval=100)
+        self.products_count = ft.Text("", color=NEON_BLUE, size=12)
+        self.current_filters = {}
+        self.next_cursor = None
+        self.page_lock = threading.Lock()
+        # Seletor de arquivos da importação/exportação (adicionado ao overlay em did_mount)
+        self.file_picker = ft.FilePicker(on_result=self.on_file_picked)
+        self.file_action = None
         self.controls = [
             PageHeader("Gerenciar Produtos"),
-            ft.Row([self.search_field, NeonButton("Novo Produto", self.open_add_dialog, icon=ft.Icons.ADD)], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            ft.Row([
+                self.search_field,
+                ft.Row([
+                    # Importação/exportação lê e grava arquivos locais direto no banco: só sem servidor
+                    NeonButton("Importar/Exportar", self.open_import_export_dialog, icon=ft.Icons.IMPORT_EXPORT, color=NEON_PURPLE, visible=not SERVIDOR),
+                    NeonButton("Novo Produto", self.open_add_dialog, icon=ft.Icons.ADD),
+                ])
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             ft.ExpansionTile(
                 title=ft.Text("Filtros Avançados", color=NEON_BLUE),
                 controls=[
@@ -47,9 +95,14 @@ class ProductView(ft.Column):
                 ]
             ),
             ft.Divider(color=NEON_BLUE),
+            self.products_count,
             self.products_list
         ]
-        self.load_products()
+
+    def did_mount(self):
+        if self.file_picker not in self.page.overlay:
+            self.page.overlay.append(self.file_picker)
+            self.page.update()
 
     def set_sort(self, sort_value):
         self.sort_option = sort_value
@@ -71,14 +124,32 @@ class ProductView(ft.Column):
     def apply_filters(self, e):
         self.load_products()
 
-    def load_products(self, search=""):
+    def load_products(self, search="", prefetched=None):
         print("Carregando produtos...")
-        # Update categories dropdown
+        # Carga imediata: descarta qualquer busca digitada ainda pendente
+        self.search_debouncer.cancel()
+        # A pré-carga só vale se foi feita com os filtros atuais da tela
+        if prefetched and prefetched[1] == self.get_filters():
+            self.render_products(prefetched)
+        else:
+            self.render_products(self.fetch_products())
+
+    def fetch_products(self):
+        # Roda na thread de busca (Debouncer) ou direto em load_products
+        return self.query_products(self.get_filters())
+
+    @staticmethod
+    def query_products(filters):
         categories = get_unique_categories()
-        self.category_filter.options = [ft.dropdown.Option(c) for c in categories]
-        
-        self.products_list.controls.clear()
-        
+        produtos = get_produtos(page_size=PRODUCTS_PAGE_SIZE, **filters)
+        total = contar_produtos(**filters)
+        return categories, filters, produtos, total
+
+    @staticmethod
+    def prefetch():
+        return ProductView.query_products(dict(ProductView.INITIAL_FILTERS))
+
+    def get_filters(self):
         # Get filter values
         cat = self.category_filter.value
         min_p = self.min_price.value
@@ -107,7 +178,13 @@ class ProductView(ft.Column):
         
         inactive_mode = "only_inactive" if show_inactive else False
 
-        produtos = get_produtos(
+        try:
+            float(min_p or 0), float(max_p or 0)
+        except ValueError:
+            # Preço ainda sendo digitado (ex.: "10,"): ignora a faixa
+            min_p = max_p = None
+
+        return dict(
             search_term=self.search_field.value,
             category=cat,
             min_price=min_p,
@@ -118,56 +195,101 @@ class ProductView(ft.Column):
             show_inactive=inactive_mode,
             sort_by=self.sort_option
         )
-        
-        print(f"Produtos encontrados: {len(produtos)}")
-        for p in produtos:
-            status_color = TEXT_COLOR
-            if p['quantidade'] == 0:
-                status_color = NEON_RED
-            
-            name_style = ft.TextStyle(size=18, weight=ft.FontWeight.BOLD, color=NEON_BLUE)
-            if p['ativo'] == 0:
-                name_style.decoration = ft.TextDecoration.LINE_THROUGH
-                name_style.color = ft.Colors.GREY
-            
-            # Quick View Trigger (Clickable Card)
-            card_content = ft.Container(
-                content=ft.Row([
-                    ft.Column([
-                        ft.Text(p['nome'], style=name_style),
-                        ft.Text(f"Cat: {p['categoria']} | Qtd: {p['quantidade']}", color=status_color),
-                        ft.Text("INATIVO" if p['ativo'] == 0 else "ATIVO", size=10, color=ft.Colors.GREY if p['ativo'] == 0 else NEON_GREEN)
-                    ], expand=True),
-                    ft.Text(f"R$ {p['preco_venda']:.2f}", size=20, color=NEON_GREEN, weight=ft.FontWeight.BOLD),
-                    # Edit/Delete buttons moved to Quick View or kept here? 
-                    # User said "Ao clicar no card, abrir um popup". 
-                    # Keeping quick actions here is good UX, but let's make the whole card clickable for Quick View.
-                    # But if I click the buttons, it shouldn't open Quick View.
-                    # Flet's Container on_click covers everything unless children handle clicks.
-                    # So buttons will still work.
-                    ft.Row([
-                        ft.IconButton(ft.Icons.EDIT, icon_color=NEON_PURPLE, on_click=lambda e, id=p['id'], p_data=p: self.open_edit_dialog(id, p_data)),
-                        ft.IconButton(ft.Icons.DELETE, icon_color=ft.Colors.RED, on_click=lambda e, id=p['id']: self.delete_product(id)),
-                    ])
-                ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                on_click=lambda e, p_data=p: self.open_quick_view(p_data)
-            )
 
-            self.products_list.controls.append(
-                GlassCard(
-                    card_content
-                )
-            )
+    def render_products(self, result):
+        categories, filters, produtos, total = result
+        # Update categories dropdown
+        self.category_filter.options = [ft.dropdown.Option(c) for c in categories]
+        
+        # Primeira página de uma nova listagem
+        self.current_filters = filters
+        self.next_cursor = proximo_cursor(produtos) if len(produtos) == PRODUCTS_PAGE_SIZE else None
+        self.products_count.value = f"{total} produto(s) encontrado(s)"
+        self.products_list.controls.clear()
+        
+        print(f"Produtos encontrados: {total}")
+        self.products_list.controls.extend(self.build_product_card(p) for p in produtos)
         if self.page:
             self.update()
 
+    def on_products_scroll(self, e):
+        if self.next_cursor is not None and e.pixels >= e.max_scroll_extent - SCROLL_LOAD_THRESHOLD:
+            self.load_next_page()
+
+    def load_next_page(self):
+        # Eventos de rolagem chegam em sequência: ignora se já há uma página carregando
+        if not self.page_lock.acquire(blocking=False):
+            return
+        try:
+            filters, cursor = self.current_filters, self.next_cursor
+            if cursor is None:
+                return
+            produtos = get_produtos(cursor=cursor, page_size=PRODUCTS_PAGE_SIZE, **filters)
+            # Os filtros mudaram enquanto a página carregava: a listagem já foi refeita
+            if filters is not self.current_filters:
+                return
+            self.next_cursor = proximo_cursor(produtos) if len(produtos) == PRODUCTS_PAGE_SIZE else None
+            self.products_list.controls.extend(self.build_product_card(p) for p in produtos)
+            if self.page:
+                self.products_list.update()
+        finally:
+            self.page_lock.release()
+
+    def build_product_card(self, p):
+        status_color = TEXT_COLOR
+        if p['quantidade'] == 0:
+            status_color = NEON_RED
+        
+        name_style = ft.TextStyle(size=18, weight=ft.FontWeight.BOLD, color=NEON_BLUE)
+        if p['ativo'] == 0:
+            name_style.decoration = ft.TextDecoration.LINE_THROUGH
+            name_style.color = ft.Colors.GREY
+        
+        # Miniatura do cache local; se ainda está sendo gerada, troca o placeholder quando ficar pronta
+        thumb = ft.Image(width=48, height=48, fit=ft.ImageFit.COVER, border_radius=8)
+        thumb.src = imagens.miniatura(p['foto'], "lista", ao_concluir=lambda src: self.show_image(thumb, src))
+
+        # Quick View Trigger (Clickable Card)
+        card_content = ft.Container(
+            content=ft.Row([
+                thumb,
+                ft.Column([
+                    ft.Text(p['nome'], style=name_style),
+                    ft.Text(f"Cat: {p['categoria']} | Qtd: {p['quantidade']}", color=status_color),
+                    ft.Text("INATIVO" if p['ativo'] == 0 else "ATIVO", size=10, color=ft.Colors.GREY if p['ativo'] == 0 else NEON_GREEN)
+                ], expand=True),
+                ft.Text(f"R$ {p['preco_venda']:.2f}", size=20, color=NEON_GREEN, weight=ft.FontWeight.BOLD),
+                # Edit/Delete buttons moved to Quick View or kept here? 
+                # User said "Ao clicar no card, abrir um popup". 
+                # Keeping quick actions here is good UX, but let's make the whole card clickable for Quick View.
+                # But if I click the buttons, it shouldn't open Quick View.
+                # Flet's Container on_click covers everything unless children handle clicks.
+                # So buttons will still work.
+                ft.Row([
+                    ft.IconButton(ft.Icons.EDIT, icon_color=NEON_PURPLE, on_click=lambda e, id=p['id'], p_data=p: self.open_edit_dialog(id, p_data)),
+                    ft.IconButton(ft.Icons.DELETE, icon_color=ft.Colors.RED, on_click=lambda e, id=p['id']: self.delete_product(id)),
+                ])
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            on_click=lambda e, p_data=p: self.open_quick_view(p_data)
+        )
+
+        return GlassCard(
+            card_content
+        )
+
+    def show_image(self, img, src):
+        # Chamado pela thread das miniaturas
+        img.src = src
+        if img.page:
+            img.update()
+
     def open_quick_view(self, p):
         # p is a Row object from sqlite3, behaves like dict
         
         # Content for Quick View
-        # Foto (Placeholder if empty)
-        foto_url = p['foto'] if p['foto'] else "https://via.placeholder.com/150"
-        img = ft.Image(src=foto_url, width=150, height=150, fit=ft.ImageFit.COVER, border_radius=10)
+        # Foto do cache local (placeholder enquanto baixa ou se não houver foto)
+        img = ft.Image(width=150, height=150, fit=ft.ImageFit.COVER, border_radius=10)
+        img.src = imagens.miniatura(p['foto'], "detalhe", ao_concluir=lambda src: self.show_image(img, src))
         
         details = ft.Column([
             ft.Text(p['nome'], size=24, weight=ft.FontWeight.BOLD, color=NEON_BLUE),
@@ -196,6 +318,7 @@ class ProductView(ft.Column):
             actions=[
                 NeonButton("Editar", lambda e: [close_dialog(e), self.open_edit_dialog(p['id'], p)], icon=ft.Icons.EDIT),
                 NeonButton("Movimentações", lambda e: self.show_movements(p['id'], p['nome']), icon=ft.Icons.HISTORY),
+                NeonButton("Entrada", lambda e: [close_dialog(e), self.open_stock_entry_dialog(p)], icon=ft.Icons.ADD_BOX, color=NEON_GREEN),
                 ft.TextButton("Fechar", on_click=close_dialog)
             ],
             bgcolor=CARD_BG,
@@ -203,43 +326,160 @@ class ProductView(ft.Column):
         )
         self.page.open(dialog)
 
+    def open_stock_entry_dialog(self, p):
+        # Reposição: soma ao estoque atual e fica registrada nas movimentações
+        quantity = NeonTextField(label="Quantidade recebida", keyboard_type=ft.KeyboardType.NUMBER, autofocus=True)
+        note = NeonTextField(label="Observação (nota fiscal, fornecedor...)")
+
+        def save(e):
+            try:
+                value = int(quantity.value)
+                if value <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                quantity.error_text = "Informe uma quantidade positiva."
+                quantity.update()
+                return
+            ajustar_estoque(p['id'], value, "ENTRADA", note.value.strip() or None)
+            self.page.close(dialog)
+            self.load_products()
+
+        dialog = ft.AlertDialog(
+            title=ft.Text(f"Entrada de estoque: {p['nome']}", color=NEON_BLUE),
+            content=ft.Column([quantity, note], tight=True, width=400),
+            actions=[NeonButton("Registrar", save), ft.TextButton("Cancelar", on_click=lambda e: self.page.close(dialog))],
+            bgcolor=CARD_BG
+        )
+        self.page.open(dialog)
+
     def show_movements(self, product_id, product_name):
-        movements = get_produto_movimentacoes(product_id)
-        
-        list_view = ft.ListView(expand=True, spacing=10)
-        if not movements:
-            list_view.controls.append(ft.Text("Nenhuma movimentação registrada.", color=TEXT_COLOR))
-        else:
-            for m in movements:
-                # m: (data, id, nome_cliente, quantidade, preco_unitario, status)
-                list_view.controls.append(
-                    ft.Container(
-                        content=ft.Row([
-                            ft.Text(f"{m[0]}", color=TEXT_COLOR, size=12),
-                            ft.Text(f"Venda #{m[1]} - {m[2] or 'Cliente não ident.'}", color=NEON_BLUE),
-                            ft.Text(f"Qtd: {m[3]}", color=TEXT_COLOR),
-                            ft.Text(f"R$ {m[4]:.2f}", color=NEON_GREEN),
-                        ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                        padding=10,
-                        border=ft.border.only(bottom=ft.BorderSide(1, with_opacity(0.2, NEON_BLUE)))
-                    )
-                )
+        # Histórico paginado: a próxima página é lida ao rolar até perto do fim
+        list_view = ft.ListView(expand=True, spacing=10, on_scroll_interval=100)
+        state = {"cursor": None, "lock": threading.Lock()}
+
+        def load_page(update=True):
+            if not state["lock"].acquire(blocking=False):
+                return
+            try:
+                movements = get_produto_movimentacoes(product_id, cursor=state["cursor"], page_size=MOVEMENTS_PAGE_SIZE)
+                state["cursor"] = proximo_cursor(movements) if len(movements) == MOVEMENTS_PAGE_SIZE else None
+                list_view.controls.extend(self.build_movement_row(m) for m in movements)
+                if not list_view.controls:
+                    list_view.controls.append(ft.Text("Nenhuma movimentação registrada.", color=TEXT_COLOR))
+                if update and list_view.page:
+                    list_view.update()
+            finally:
+                state["lock"].release()
+
+        def on_scroll(e):
+            if state["cursor"] is not None and e.pixels >= e.max_scroll_extent - SCROLL_LOAD_THRESHOLD:
+                load_page()
+
+        list_view.on_scroll = on_scroll
+        load_page(update=False)
 
         dialog = ft.AlertDialog(
             title=ft.Text(f"Movimentações: {product_name}", color=NEON_BLUE),
-            content=ft.Container(list_view, height=300, width=500),
+            content=ft.Container(list_view, height=400, width=600),
             actions=[ft.TextButton("Fechar", on_click=lambda e: self.page.close(dialog))],
             bgcolor=CARD_BG
         )
         self.page.open(dialog)
 
+    def build_movement_row(self, m):
+        if m['venda_id']:
+            origin = f"Venda #{m['venda_id']} - {m['cliente'] or 'Cliente não ident.'}"
+        else:
+            origin = m['observacao'] or ""
+        return ft.Container(
+            content=ft.Row([
+                ft.Text(f"{m['data']}", color=TEXT_COLOR, size=12, width=130),
+                ft.Column([
+                    ft.Text(TIPOS_MOVIMENTO.get(m['tipo'], m['tipo']), color=NEON_BLUE, weight=ft.FontWeight.BOLD),
+                    ft.Text(origin, color=TEXT_COLOR, size=12),
+                ], spacing=2, expand=True),
+                ft.Text(f"{m['quantidade']:+d}", color=NEON_GREEN if m['quantidade'] > 0 else NEON_RED, weight=ft.FontWeight.BOLD, width=50),
+                ft.Text(f"Saldo: {m['saldo']}", color=TEXT_COLOR, width=90),
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            padding=10,
+            border=ft.border.only(bottom=ft.BorderSide(1, with_opacity(0.2, NEON_BLUE)))
+        )
+
     def search_products(self, e):
-        self.load_products(e.control.value)
+        # Chamado a cada tecla na busca e nos campos de preço
+        self.search_debouncer()
 
     def delete_product(self, id):
         delete_produto(id)
         self.load_products()
 
+    def open_import_export_dialog(self, e):
+        self.transfer_status = ft.Text("Arquivos .csv (separados por vírgula ou ponto e vírgula) ou .jsonl.", color=TEXT_COLOR)
+        self.transfer_progress = ft.ProgressBar(color=NEON_BLUE, visible=False)
+
+        def pick(action, save_name=None):
+            self.file_action = action
+            if save_name:
+                self.file_picker.save_file(file_name=save_name, allowed_extensions=["csv", "jsonl"])
+            else:
+                self.file_picker.pick_files(allowed_extensions=["csv", "jsonl"])
+
+        self.transfer_dialog = ft.AlertDialog(
+            title=ft.Text("Importar / Exportar", color=NEON_BLUE),
+            content=ft.Column([
+                ft.Text("Importar", color=NEON_PURPLE),
+                ft.Row([
+                    NeonButton("Produtos", lambda e: pick(("importar", "produtos")), icon=ft.Icons.UPLOAD_FILE),
+                    NeonButton("Clientes", lambda e: pick(("importar", "clientes")), icon=ft.Icons.UPLOAD_FILE),
+                    NeonButton("Vendas", lambda e: pick(("importar", "vendas")), icon=ft.Icons.UPLOAD_FILE),
+                ], wrap=True),
+                ft.Text("Exportar", color=NEON_PURPLE),
+                ft.Row([
+                    NeonButton("Produtos (filtro atual)", lambda e: pick(("exportar", "produtos"), "produtos.csv"), icon=ft.Icons.DOWNLOAD),
+                    NeonButton("Vendas", lambda e: pick(("exportar", "vendas"), "vendas.csv"), icon=ft.Icons.DOWNLOAD),
+                ], wrap=True),
+                ft.Divider(color=with_opacity(0.5, NEON_BLUE)),
+                self.transfer_progress,
+                self.transfer_status,
+            ], tight=True, width=500),
+            actions=[ft.TextButton("Fechar", on_click=lambda e: self.page.close(self.transfer_dialog))],
+            bgcolor=CARD_BG
+        )
+        self.page.open(self.transfer_dialog)
+
+    def on_file_picked(self, e):
+        if not self.file_action:
+            return
+        action, entity = self.file_action
+        self.file_action = None
+        path = e.path if action == "exportar" else (e.files[0].path if e.files else None)
+        if not path:
+            return
+        # Roda em segundo plano para não travar a interface em arquivos grandes
+        threading.Thread(target=self.run_transfer, args=(action, entity, path), daemon=True).start()
+
+    def run_transfer(self, action, entity, path):
+        def show(message, running=True):
+            self.transfer_status.value = message
+            self.transfer_progress.visible = running
+            self.page.update()
+
+        try:
+            if action == "importar":
+                show(f"Importando {entity}...")
+                result = importar_exportar.importar(entity, path, progresso=lambda r: show(f"Importando {entity}... {r.lidos} registros processados"))
+                show(f"Importação concluída: {result}", running=False)
+                self.load_products()
+            else:
+                filters = self.current_filters if entity == "produtos" else {}
+                # Exporta todos os produtos do filtro atual, não só as páginas carregadas
+                filters = {k: v for k, v in filters.items() if k not in ("cursor", "page_size")}
+                show(f"Exportando {entity}...")
+                total = importar_exportar.exportar(entity, path, progresso=lambda n: show(f"Exportando {entity}... {n} linhas"), **filters)
+                show(f"Exportação concluída: {total} linhas em {path}", running=False)
+        except Exception as err:
+            show(f"Erro: {err}", running=False)
+
     def open_add_dialog(self, e):
         print("Abrindo diálogo de novo produto...")
         self.open_product_dialog()
@@ -249,9 +489,20 @@ class ProductView(ft.Column):
         # Como simplificação, vou assumir que p_data é passado ou recarregar tudo.
         # Mas para editar corretamente, preciso dos dados.
         # Vou modificar a chamada no load_products para passar o objeto produto.
-        self.open_product_dialog(id, p_data)
+        # Relê o produto: a versão e o estoque mostrados no diálogo são os atuais
+        self.open_product_dialog(id, get_produto(id) or p_data)
 
-    def open_product_dialog(self, product_id=None, product_data=None):
+    def build_suggestions_menu(self, field, values):
+        def pick(e, value):
+            field.value = value
+            field.update()
+        return ft.PopupMenuButton(
+            icon=ft.Icons.ARROW_DROP_DOWN,
+            items=[ft.PopupMenuItem(text=v, on_click=lambda e, v=v: pick(e, v)) for v in values],
+            disabled=not values,
+        )
+
+    def open_product_dialog(self, product_id=None, product_data=None, notice=None):
         # Dialog fields
         nome = NeonTextField(label="Nome", value=product_data['nome'] if product_data else "")
         categoria = NeonTextField(label="Categoria", value=product_data['categoria'] if product_data else "", expand=True)
@@ -267,6 +518,10 @@ class ProductView(ft.Column):
         
         ativo_switch = ft.Switch(label="Ativo", value=bool(product_data['ativo']) if product_data else True, active_color=NEON_GREEN)
 
+        # Sugestões a partir dos valores já cadastrados (cache de referência)
+        categoria.suffix = self.build_suggestions_menu(categoria, get_unique_categories())
+        fornecedor.suffix = self.build_suggestions_menu(fornecedor, get_fornecedores())
+
         def save(e):
             print("Tentando salvar produto...")
             try:
@@ -276,18 +531,37 @@ class ProductView(ft.Column):
                 ativo = 1 if ativo_switch.value else 0
                 
                 if product_id:
-                    update_produto(product_id, nome.value, categoria.value, pv, pc, qtd, ativo, foto.value, codigo_barras.value, descricao.value, fornecedor.value)
+                    values = {"nome": nome.value, "categoria": categoria.value, "preco_venda": pv, "preco_compra": pc, "ativo": ativo,
+                              "foto": foto.value, "codigo_barras": codigo_barras.value, "descricao": descricao.value, "fornecedor": fornecedor.value}
+                    # Só os campos alterados; o estoque vai como diferença, sem apagar vendas feitas com o diálogo aberto
+                    changes = {field: value for field, value in values.items() if (value or None) != (product_data[field] or None)}
+                    update_produto(product_id, product_data['versao'], ajuste_estoque=qtd - product_data['quantidade'], **changes)
                 else:
                     add_produto(nome.value, categoria.value, pv, pc, qtd, ativo, foto.value, codigo_barras.value, descricao.value, fornecedor.value)
                 
                 self.page.close(dialog)
                 self.page.update()
                 self.load_products()
+            except ConflitoVersao as err:
+                # Outra pessoa salvou antes: reabre com os dados atuais
+                self.page.close(dialog)
+                if err.produto is not None:
+                    self.open_product_dialog(product_id, err.produto, notice=str(err))
+                else:
+                    self.page.open(ft.SnackBar(ft.Text(str(err), color=ft.Colors.RED)))
+                self.load_products()
+            except CodigoBarrasDuplicadoError as err:
+                codigo_barras.error_text = str(err)
+                codigo_barras.update()
+            except EstoqueInsuficienteError as err:
+                quantidade.error_text = str(err)
+                quantidade.update()
             except ValueError:
                 # Show error (snack bar would be good)
                 pass
 
         content_col = ft.Column([
+            ft.Text(notice or "", color=NEON_RED, visible=bool(notice)),
             nome, 
             ft.Row([categoria, codigo_barras]),
             ft.Row([preco_venda, preco_compra, quantidade]),
@@ -312,37 +586,80 @@ class ClientView(ft.Column):
     def __init__(self):
         super().__init__()
         self.expand = True
-        self.search_field = NeonTextField(label="Buscar Cliente", on_change=self.search_clients)
-        self.clients_list = ft.ListView(expand=True, spacing=10)
+        self.search_field = NeonTextField(label="Buscar Cliente (nome, CPF ou telefone)", on_change=self.search_clients)
+        self.search_debouncer = Debouncer(self.fetch_clients, self.render_clients, delay=SEARCH_DEBOUNCE)
+        # Mesma busca paginada do Caixa: a próxima página é carregada ao rolar
+        self.clients_list = ft.ListView(expand=True, spacing=10, on_scroll=self.on_clients_scroll, on_scroll_interval=100)
+        self.search = ""
+        self.next_cursor = None
+        self.page_lock = threading.Lock()
         self.controls = [
             PageHeader("Gerenciar Clientes"),
             ft.Row([self.search_field, NeonButton("Novo Cliente", self.open_add_dialog, icon=ft.Icons.PERSON_ADD)], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
             ft.Divider(color=NEON_BLUE),
             self.clients_list
         ]
-        self.load_clients()
 
-    def load_clients(self, search=""):
+    def load_clients(self, search=None, prefetched=None):
+        self.search_debouncer.cancel()
+        search = self.search if search is None else search
+        if prefetched and prefetched[0] == search:
+            self.render_clients(prefetched)
+        else:
+            self.render_clients(self.fetch_clients(search))
+
+    @staticmethod
+    def fetch_clients(search):
+        return search, buscar_clientes(search, limite=CLIENTS_PAGE_SIZE)
+
+    @staticmethod
+    def prefetch():
+        return ClientView.fetch_clients("")
+
+    def render_clients(self, result):
+        self.search, clientes = result
+        self.next_cursor = proximo_cursor(clientes) if len(clientes) == CLIENTS_PAGE_SIZE else None
         self.clients_list.controls.clear()
-        clientes = get_clientes(search)
-        for c in clientes:
-            self.clients_list.controls.append(
-                GlassCard(
-                    ft.Row([
-                        ft.Column([
-                            ft.Text(c['nome'], size=18, weight=ft.FontWeight.BOLD, color=NEON_BLUE),
-                            ft.Text(f"Tel: {c['telefone']} | CPF: {c['cpf']}", color=TEXT_COLOR),
-                        ], expand=True),
-                        ft.IconButton(ft.Icons.HISTORY, icon_color=NEON_PURPLE, on_click=lambda e, id=c['id']: self.open_history_dialog(id)),
-                        ft.IconButton(ft.Icons.DELETE, icon_color=ft.Colors.RED, on_click=lambda e, id=c['id']: self.delete_client(id)),
-                    ])
-                )
-            )
+        self.clients_list.controls.extend(self.build_client_card(c) for c in clientes)
         if self.page:
             self.update()
 
+    def on_clients_scroll(self, e):
+        if self.next_cursor is not None and e.pixels >= e.max_scroll_extent - SCROLL_LOAD_THRESHOLD:
+            self.load_next_page()
+
+    def load_next_page(self):
+        if not self.page_lock.acquire(blocking=False):
+            return
+        try:
+            search, cursor = self.search, self.next_cursor
+            if cursor is None:
+                return
+            clientes = buscar_clientes(search, limite=CLIENTS_PAGE_SIZE, cursor=cursor)
+            # A busca mudou enquanto a página carregava
+            if search != self.search or cursor != self.next_cursor:
+                return
+            self.next_cursor = proximo_cursor(clientes) if len(clientes) == CLIENTS_PAGE_SIZE else None
+            self.clients_list.controls.extend(self.build_client_card(c) for c in clientes)
+            if self.page:
+                self.clients_list.update()
+        finally:
+            self.page_lock.release()
+
+    def build_client_card(self, c):
+        return GlassCard(
+            ft.Row([
+                ft.Column([
+                    ft.Text(c['nome'], size=18, weight=ft.FontWeight.BOLD, color=NEON_BLUE),
+                    ft.Text(f"Tel: {c['telefone']} | CPF: {c['cpf']}", color=TEXT_COLOR),
+                ], expand=True),
+                ft.IconButton(ft.Icons.HISTORY, icon_color=NEON_PURPLE, on_click=lambda e, id=c['id']: self.open_history_dialog(id)),
+                ft.IconButton(ft.Icons.DELETE, icon_color=ft.Colors.RED, on_click=lambda e, id=c['id']: self.delete_client(id)),
+            ])
+        )
+
     def search_clients(self, e):
-        self.load_clients(e.control.value)
+        self.search_debouncer(e.control.value)
 
     def delete_client(self, id):
         delete_cliente(id)
@@ -377,13 +694,14 @@ class ClientView(ft.Column):
         
         items_list = ft.ListView(height=300, spacing=10)
         for compra in historico:
-            # compra: (id, total, data, status, itens)
+            # compra: (id, total, data, status, itens, valor_pago)
             items_list.controls.append(
                 GlassCard(
                     ft.Column([
                         ft.Row([
                             ft.Text(f"Data: {compra[2]}", color=TEXT_COLOR),
-                            ft.Text(f"Status: {compra[3]}", color=NEON_RED if compra[3] == 'PENDENTE' else NEON_GREEN)
+                            ft.Text(f"Status: {compra[3]}" + (f" (pago R$ {compra[5]:.2f})" if compra[3] == 'PENDENTE' and compra[5] else ""),
+                                    color=NEON_RED if compra[3] == 'PENDENTE' else NEON_GREEN)
                         ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                         ft.Text(f"Itens: {compra[4]}", color=TEXT_COLOR),
                         ft.Text(f"Total: R$ {compra[1]:.2f}", size=16, weight=ft.FontWeight.BOLD, color=NEON_BLUE)
@@ -403,30 +721,34 @@ class SalesView(ft.Column):
     def __init__(self):
         super().__init__()
         self.expand = True
-        self.cart = []
+        self.cart = Carrinho()
+        self.cart.ouvir(self.on_cart_change)
+        self.cart_rows = {}  # produto_id -> controles da linha no carrinho
         self.client_id = None
         
         # UI Elements
+        # Leitor de código de barras (teclado): cada leitura termina com Enter
+        self.scanner_field = NeonTextField(label="Código de Barras (leitor)", prefix_icon=ft.Icons.QR_CODE_SCANNER, autofocus=True, on_submit=self.scan_barcode)
         self.product_search = NeonTextField(label="Buscar Produto (Nome)", on_change=self.search_product)
         self.product_results = ft.ListView(height=200, spacing=5)
+        self.search_debouncer = Debouncer(self.fetch_products, self.render_product_results, delay=SEARCH_DEBOUNCE)
         self.cart_list = ft.ListView(expand=True, spacing=5)
         self.total_text = ft.Text("Total: R$ 0.00", size=25, weight=ft.FontWeight.BOLD, color=NEON_GREEN)
-        self.client_dropdown = ft.Dropdown(
-            label="Selecione o Cliente",
-            options=[],
-            border_color=NEON_BLUE,
-            text_style=ft.TextStyle(color=TEXT_COLOR),
-            bgcolor=with_opacity(0.1, NEON_BLUE)
-        )
+        # Cliente: sugestões a cada tecla (nome, CPF ou telefone) em vez de carregar todos num Dropdown
+        self.client_field = NeonTextField(label="Cliente (nome, CPF ou telefone)", prefix_icon=ft.Icons.PERSON_SEARCH, on_change=self.search_client, width=500,
+                                          suffix=ft.IconButton(ft.Icons.CLEAR, icon_color=NEON_BLUE, on_click=self.clear_client))
+        self.client_results = ft.ListView(spacing=0, height=0, width=500)
+        self.client_debouncer = Debouncer(self.fetch_clients, self.render_client_results, delay=SEARCH_DEBOUNCE)
         self.fiado_checkbox = ft.Checkbox(label="Venda Fiado (Pendente)", label_style=ft.TextStyle(color=NEON_RED), fill_color=NEON_RED)
         
         self.controls = [
             PageHeader("Caixa / Vendas"),
-            ft.Row([self.client_dropdown], alignment=ft.MainAxisAlignment.CENTER),
+            ft.Row([ft.Column([self.client_field, self.client_results], spacing=0)], alignment=ft.MainAxisAlignment.CENTER),
             ft.Divider(),
             ft.Row([
                 ft.Column([
                     ft.Text("Adicionar Produtos", size=18, color=NEON_PURPLE),
+                    self.scanner_field,
                     self.product_search,
                     self.product_results
                 ], expand=1),
@@ -434,76 +756,163 @@ class SalesView(ft.Column):
                 ft.Column([
                     ft.Text("Carrinho", size=18, color=NEON_PURPLE),
                     self.cart_list,
-                    self.total_text,
+                    ft.Row([
+                        self.total_text,
+                        ft.TextButton("Desfazer", icon=ft.Icons.UNDO, on_click=lambda e: self.cart.desfazer()),
+                    ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
                     self.fiado_checkbox,
                     NeonButton("Finalizar Venda", self.finish_sale, icon=ft.Icons.CHECK)
                 ], expand=1)
             ], expand=True)
         ]
-        self.load_clients()
 
-    def load_clients(self):
-        clients = get_clientes()
-        self.client_dropdown.options = [ft.dropdown.Option(key=c['id'], text=c['nome']) for c in clients]
+    def search_client(self, e):
+        # Texto alterado: o cliente escolhido antes deixa de valer
+        self.client_id = None
+        self.client_debouncer(e.control.value)
+
+    def fetch_clients(self, term):
+        return buscar_clientes(term, limite=CLIENT_SUGGESTIONS) if term.strip() else []
+
+    def render_client_results(self, clients):
+        self.client_results.controls = [
+            ft.ListTile(
+                title=ft.Text(c['nome'], color=TEXT_COLOR),
+                subtitle=ft.Text(f"CPF: {c['cpf'] or '-'} | Tel: {c['telefone'] or '-'}", color=NEON_BLUE),
+                dense=True,
+                on_click=lambda e, c=c: self.select_client(c),
+            )
+            for c in clients
+        ]
+        self.client_results.height = min(len(clients), CLIENT_SUGGESTIONS) * 56
+        if self.page:
+            self.client_results.update()
+
+    def select_client(self, client):
+        self.client_debouncer.cancel()
+        self.client_id = client['id']
+        self.client_field.value = client['nome']
+        self.render_client_results([])
+        self.client_field.update()
+
+    def clear_client(self, e):
+        self.client_debouncer.cancel()
+        self.client_id = None
+        self.client_field.value = ""
+        self.render_client_results([])
+        self.client_field.update()
+
+    def scan_barcode(self, e):
+        code = self.scanner_field.value
+        self.scanner_field.value = ""
+        product = buscar_por_codigo_barras(code)
+        if product:
+            self.add_to_cart(product)
+        elif code and code.strip():
+            self.page.snack_bar = ft.SnackBar(ft.Text(f"Código {code.strip()} não encontrado.", color=ft.Colors.RED))
+            self.page.snack_bar.open = True
+            self.page.update()
+        # O campo continua focado para a próxima leitura
+        self.scanner_field.focus()
 
     def search_product(self, e):
-        term = e.control.value
+        self.search_debouncer(e.control.value)
+
+    def fetch_products(self, term):
+        return get_produtos(term) if term else []
+
+    def render_product_results(self, products):
         self.product_results.controls.clear()
-        if len(term) > 0:
-            products = get_produtos(term)
-            for p in products:
-                self.product_results.controls.append(
-                    ft.ListTile(
-                        title=ft.Text(p['nome'], color=TEXT_COLOR),
-                        subtitle=ft.Text(f"R$ {p['preco_venda']:.2f} | Est: {p['quantidade']}", color=NEON_BLUE),
-                        on_click=lambda e, prod=p: self.add_to_cart(prod)
-                    )
+        for p in products:
+            self.product_results.controls.append(
+                ft.ListTile(
+                    title=ft.Text(p['nome'], color=TEXT_COLOR),
+                    subtitle=ft.Text(f"R$ {p['preco_venda']:.2f} | Est: {p['quantidade']}", color=NEON_BLUE),
+                    on_click=lambda e, prod=p: self.add_to_cart(prod)
                 )
+            )
         if self.page:
             self.update()
 
     def add_to_cart(self, product):
-        # Check if already in cart
-        for item in self.cart:
-            if item['produto_id'] == product['id']:
-                item['quantidade'] += 1
-                self.update_cart_ui()
-                return
-        
-        self.cart.append({
-            'produto_id': product['id'],
-            'nome': product['nome'],
-            'quantidade': 1,
-            'preco_unitario': product['preco_venda']
-        })
-        self.update_cart_ui()
-
-    def update_cart_ui(self):
-        self.cart_list.controls.clear()
-        total = 0
-        for item in self.cart:
-            subtotal = item['quantidade'] * item['preco_unitario']
-            total += subtotal
-            self.cart_list.controls.append(
-                GlassCard(
-                    ft.Row([
-                        ft.Text(f"{item['nome']} x{item['quantidade']}", color=TEXT_COLOR),
-                        ft.Text(f"R$ {subtotal:.2f}", color=NEON_GREEN),
-                        ft.IconButton(ft.Icons.REMOVE, icon_color=ft.Colors.RED, on_click=lambda e, pid=item['produto_id']: self.remove_from_cart(pid))
-                    ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
-                    padding=10
-                )
-            )
-        self.total_text.value = f"Total: R$ {total:.2f}"
+        self.cart.adicionar(product['id'], product['nome'], product['preco_venda'])
+
+    def on_cart_change(self, evento, item):
+        # Só a linha afetada é criada, atualizada ou retirada da lista
+        if evento == "adicionado":
+            row = self.build_cart_row(item)
+            self.cart_rows[item.produto_id] = row
+            self.cart_list.controls.append(row['card'])
+            changed = self.cart_list
+        elif evento == "alterado":
+            row = self.cart_rows[item.produto_id]
+            self.fill_cart_row(row, item)
+            changed = row['card']
+        elif evento == "removido":
+            self.cart_list.controls.remove(self.cart_rows.pop(item.produto_id)['card'])
+            changed = self.cart_list
+        else:
+            self.cart_rows.clear()
+            self.cart_list.controls.clear()
+            changed = self.cart_list
+        self.total_text.value = f"Total: R$ {self.cart.total:.2f}"
         if self.page:
-            self.update()
+            changed.update()
+            self.total_text.update()
+
+    def build_cart_row(self, item):
+        pid = item.produto_id
+        row = {
+            'quantity': ft.TextField(width=70, dense=True, text_align=ft.TextAlign.RIGHT, keyboard_type=ft.KeyboardType.NUMBER,
+                                     label="Qtd", on_submit=lambda e: self.edit_quantity(pid, e.control), on_blur=lambda e: self.edit_quantity(pid, e.control)),
+            'discount': ft.TextField(width=90, dense=True, text_align=ft.TextAlign.RIGHT, keyboard_type=ft.KeyboardType.NUMBER,
+                                     label="Desc. R$", on_submit=lambda e: self.edit_discount(pid, e.control), on_blur=lambda e: self.edit_discount(pid, e.control)),
+            'subtotal': ft.Text(color=NEON_GREEN, width=90, text_align=ft.TextAlign.RIGHT),
+        }
+        row['card'] = GlassCard(
+            ft.Row([
+                ft.Text(item.nome, color=TEXT_COLOR, expand=True),
+                row['quantity'],
+                row['discount'],
+                row['subtotal'],
+                ft.IconButton(ft.Icons.REMOVE, icon_color=ft.Colors.RED, on_click=lambda e: self.remove_from_cart(pid))
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN),
+            padding=10
+        )
+        self.fill_cart_row(row, item)
+        return row
+
+    def fill_cart_row(self, row, item):
+        row['quantity'].value = str(item.quantidade)
+        row['discount'].value = f"{item.desconto:.2f}" if item.desconto else ""
+        row['subtotal'].value = f"R$ {item.subtotal:.2f}"
+
+    def edit_quantity(self, product_id, field):
+        if product_id not in self.cart:
+            return
+        try:
+            self.cart.alterar_quantidade(product_id, int(field.value))
+        except ValueError:
+            # Valor inválido: volta a mostrar a quantidade atual
+            self.fill_cart_row(self.cart_rows[product_id], self.cart.get(product_id))
+            field.update()
+
+    def edit_discount(self, product_id, field):
+        if product_id not in self.cart:
+            return
+        try:
+            self.cart.alterar_desconto(product_id, float((field.value or "0").replace(",", ".")))
+        except ValueError:
+            pass
+        # Mostra o desconto efetivamente aplicado (limitado ao valor da linha)
+        self.fill_cart_row(self.cart_rows[product_id], self.cart.get(product_id))
+        field.update()
 
     def remove_from_cart(self, product_id):
-        self.cart = [item for item in self.cart if item['produto_id'] != product_id]
-        self.update_cart_ui()
+        self.cart.remover(product_id)
 
     def finish_sale(self, e):
-        if not self.client_dropdown.value:
+        if not self.client_id:
             self.page.snack_bar = ft.SnackBar(ft.Text("Selecione um cliente!"))
             self.page.snack_bar.open = True
             self.page.update()
@@ -513,10 +922,16 @@ class SalesView(ft.Column):
             return
 
         status = 'PENDENTE' if self.fiado_checkbox.value else 'PAGO'
-        success = registrar_venda(self.client_dropdown.value, self.cart, status)
+        try:
+            success = registrar_venda(self.client_id, self.cart.itens_venda(), status)
+        except EstoqueInsuficienteError as err:
+            # Nada foi gravado: mostra quais itens não têm estoque suficiente
+            self.page.snack_bar = ft.SnackBar(ft.Text(str(err), color=ft.Colors.RED))
+            self.page.snack_bar.open = True
+            self.page.update()
+            return
         if success:
-            self.cart = []
-            self.update_cart_ui()
+            self.cart.limpar(desfazivel=False)
             self.page.snack_bar = ft.SnackBar(ft.Text("Venda realizada com sucesso!", color=ft.Colors.GREEN))
             self.page.snack_bar.open = True
             self.page.update()
@@ -529,6 +944,7 @@ class DashboardView(ft.Column):
     def __init__(self):
         super().__init__()
         self.expand = True
+        self.scroll = ft.ScrollMode.AUTO
         self.total_sales_text = ft.Text("R$ 0.00", size=30, weight=ft.FontWeight.BOLD, color=NEON_GREEN)
         self.total_items_text = ft.Text("0", size=30, weight=ft.FontWeight.BOLD, color=NEON_BLUE)
         self.total_invested_text = ft.Text("R$ 0.00", size=30, weight=ft.FontWeight.BOLD, color=NEON_PURPLE)
@@ -548,9 +964,14 @@ class DashboardView(ft.Column):
                 self.build_stat_card("Itens Vendidos", self.total_items_text, ft.Icons.SHOPPING_BAG, NEON_BLUE),
             ], alignment=ft.MainAxisAlignment.CENTER, spacing=20),
             ft.Container(height=20),
-            NeonButton("Atualizar Dados", self.load_data, icon=ft.Icons.REFRESH)
+            NeonButton("Atualizar Dados", self.load_data, icon=ft.Icons.REFRESH),
+            ft.Divider(color=NEON_BLUE),
+            self.build_reports_section(),
+            ft.Divider(color=NEON_BLUE),
+            self.build_best_sellers_section(),
+            ft.Divider(color=NEON_BLUE),
+            self.build_analysis_section(),
         ]
-        self.load_data()
 
     def build_stat_card(self, title, value_control, icon, color):
         return GlassCard(
@@ -569,46 +990,419 @@ class DashboardView(ft.Column):
         self.total_invested_text.value = f"R$ {stats['total_investido']:.2f}"
         self.total_profit_text.value = f"R$ {stats['lucro_liquido']:.2f}"
         self.total_pending_text.value = f"R$ {stats['total_pendente']:.2f}"
+        self.load_reports()
+        self.load_best_sellers()
+        self.schedule_analysis()
+        if self.page:
+            self.update()
+
+    # --- Relatórios por período (relatorios.py) ---------------------------
+
+    def build_reports_section(self):
+        self.period_texts = {}
+        period_cards = []
+        for key, title in (("hoje", "Hoje"), ("mes", "Este Mês"), ("mes_anterior", "Mês Anterior")):
+            value = ft.Text("R$ 0.00", size=24, weight=ft.FontWeight.BOLD, color=NEON_GREEN)
+            detail = ft.Text("", size=12, color=TEXT_COLOR)
+            self.period_texts[key] = (value, detail)
+            period_cards.append(self.build_stat_card(title, ft.Column([value, detail], horizontal_alignment=ft.CrossAxisAlignment.CENTER), ft.Icons.CALENDAR_TODAY, NEON_BLUE))
+
+        self.period_selector = ft.Dropdown(
+            label="Período", width=170, value="30d", on_change=lambda e: self.load_reports(update=True),
+            options=[ft.dropdown.Option(key, text) for key, text in REPORT_PERIODS],
+            border_color=NEON_BLUE, text_style=ft.TextStyle(color=TEXT_COLOR),
+        )
+        self.breakdown_selector = ft.Dropdown(
+            label="Detalhar por", width=170, value="total", on_change=lambda e: self.load_reports(update=True),
+            options=[ft.dropdown.Option("total", "Total"), ft.dropdown.Option("categoria", "Categoria")],
+            border_color=NEON_BLUE, text_style=ft.TextStyle(color=TEXT_COLOR),
+        )
+        self.metric_selector = ft.Dropdown(
+            label="Indicador", width=170, value="faturamento", on_change=lambda e: self.load_reports(update=True),
+            options=[ft.dropdown.Option(key, text) for key, text in REPORT_METRICS],
+            border_color=NEON_BLUE, text_style=ft.TextStyle(color=TEXT_COLOR),
+        )
+        self.report_summary = ft.Text("", color=TEXT_COLOR)
+        self.report_legend = ft.Row(wrap=True, spacing=15)
+        self.chart_container = ft.Container(height=320, padding=10)
+        return ft.Column([
+            ft.Text("Vendas por Período (inclui fiado)", size=20, weight=ft.FontWeight.BOLD, color=NEON_PURPLE),
+            ft.Row(period_cards, alignment=ft.MainAxisAlignment.CENTER, spacing=20),
+            ft.Row([self.period_selector, self.breakdown_selector, self.metric_selector], alignment=ft.MainAxisAlignment.CENTER),
+            self.report_summary,
+            GlassCard(ft.Column([self.chart_container, self.report_legend]), padding=10),
+        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
+
+    def load_reports(self, update=False):
+        for key, (value, detail) in self.period_texts.items():
+            totals = relatorios.totais_periodo(*relatorios.intervalo_rapido(key))
+            value.value = f"R$ {totals['faturamento']:.2f}"
+            detail.value = f"{totals['vendas']} vendas | ticket R$ {totals['ticket_medio'] or 0:.2f} | margem {totals['margem_pct']:.1f}%"
+
+        start, end = relatorios.intervalo_rapido(self.period_selector.value)
+        grouping = relatorios.agrupamento_sugerido(start, end)
+        breakdown = None if self.breakdown_selector.value == "total" else self.breakdown_selector.value
+        metric = self.metric_selector.value
+        if breakdown and metric == "ticket_medio":
+            # Ticket médio só existe no total
+            metric = self.metric_selector.value = "faturamento"
+        series = relatorios.serie_vendas(start, end, grouping, breakdown, limite=6)
+
+        totals = relatorios.totais_periodo(start, end)
+        self.report_summary.value = (f"{start:%d/%m/%Y} a {end:%d/%m/%Y}: R$ {totals['faturamento']:.2f} em {totals['vendas']} vendas, "
+                                     f"{totals['itens']} itens, margem R$ {totals['margem']:.2f} ({totals['margem_pct']:.1f}%)")
+        self.chart_container.content = self.build_chart(series, metric, grouping)
+        if update and self.page:
+            self.update()
+
+    def build_chart(self, series, metric, grouping):
+        periods = sorted({row['periodo'] for row in series})
+        if not periods:
+            return ft.Text("Sem vendas no período.", color=TEXT_COLOR)
+        index = {period: i for i, period in enumerate(periods)}
+        lines = {}
+        for row in series:
+            lines.setdefault(row['chave'] or "Total", {})[index[row['periodo']]] = row[metric] or 0
+
+        colors = [NEON_GREEN, NEON_BLUE, NEON_PURPLE, NEON_RED, ft.Colors.AMBER, ft.Colors.ORANGE, ft.Colors.PINK_200]
+        data_series = []
+        self.report_legend.controls.clear()
+        for i, (name, values) in enumerate(lines.items()):
+            color = colors[i % len(colors)]
+            data_series.append(ft.LineChartData(
+                data_points=[ft.LineChartDataPoint(x, values.get(x, 0), tooltip=f"{name}: {values.get(x, 0):.2f}") for x in range(len(periods))],
+                color=color, stroke_width=2, curved=True, prevent_curve_over_shooting=True,
+            ))
+            if len(lines) > 1:
+                self.report_legend.controls.append(ft.Row([ft.Container(width=12, height=12, bgcolor=color, border_radius=6), ft.Text(name, color=TEXT_COLOR, size=12)], spacing=5))
+
+        step = max(1, len(periods) // 8)
+        labels = [ft.ChartAxisLabel(value=i, label=ft.Text(self.format_period(p, grouping), size=10, color=TEXT_COLOR))
+                  for i, p in enumerate(periods) if i % step == 0]
+        max_y = max((v for values in lines.values() for v in values.values()), default=0)
+        return ft.LineChart(
+            data_series=data_series,
+            min_y=0,
+            max_y=max_y * 1.1 or 1,
+            left_axis=ft.ChartAxis(labels_size=60),
+            bottom_axis=ft.ChartAxis(labels=labels, labels_size=30),
+            horizontal_grid_lines=ft.ChartGridLines(color=with_opacity(0.1, NEON_BLUE), width=1),
+            tooltip_bgcolor=CARD_BG,
+            expand=True,
+        )
+
+    # --- Mais vendidos por categoria (contador total_vendido / vendas_dia_produto) ---
+
+    def build_best_sellers_section(self):
+        self.best_sellers_window = ft.Dropdown(
+            label="Período", width=170, value="total", on_change=lambda e: self.load_best_sellers(update=True),
+            options=[ft.dropdown.Option("total", "Desde o início")] + [ft.dropdown.Option(str(days), f"{days} dias") for days in JANELAS_MAIS_VENDIDOS],
+            border_color=NEON_BLUE, text_style=ft.TextStyle(color=TEXT_COLOR),
+        )
+        self.best_sellers_grid = ft.Row(wrap=True, spacing=20, run_spacing=20, alignment=ft.MainAxisAlignment.CENTER)
+        return ft.Column([
+            ft.Text("Mais Vendidos por Categoria", size=20, weight=ft.FontWeight.BOLD, color=NEON_PURPLE),
+            self.best_sellers_window,
+            self.best_sellers_grid,
+        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
+
+    def load_best_sellers(self, update=False):
+        window = self.best_sellers_window.value
+        ranking = get_mais_vendidos_por_categoria(limite=3, dias=None if window == "total" else int(window))
+        self.best_sellers_grid.controls.clear()
+        for category, products in ranking.items():
+            rows = [ft.Text(category, size=16, weight=ft.FontWeight.BOLD, color=NEON_BLUE)]
+            for position, product in enumerate(products, 1):
+                rows.append(ft.Text(f"{position}. {product['nome']} ({product['vendido']} un.)", color=TEXT_COLOR, size=12))
+            self.best_sellers_grid.controls.append(GlassCard(ft.Column(rows, spacing=4, width=230), padding=15))
+        if not ranking:
+            self.best_sellers_grid.controls.append(ft.Text("Sem vendas no período.", color=TEXT_COLOR))
+        if update and self.page:
+            self.update()
+
+    # --- Curva ABC, margem, giro e cobertura (analise.py) ---------------------
+
+    def build_analysis_section(self):
+        self.analysis_period = ft.Dropdown(
+            label="Período", width=170, value="90", on_change=lambda e: (self.schedule_analysis(), self.update()),
+            options=[ft.dropdown.Option(key, text) for key, text in ANALYSIS_PERIODS],
+            border_color=NEON_BLUE, text_style=ft.TextStyle(color=TEXT_COLOR),
+        )
+        self.analysis_summary = ft.Text("Calculando análise...", color=TEXT_COLOR)
+        # A análise (analise.py) roda numa thread depois que a tela aparece; na
+        # primeira vez monta o cache de itens vendidos, o que pode levar segundos
+        self.analysis_lock = threading.Lock()
+        self.analysis_running = False
+        self.analysis_pending = False
+        self.analysis_started = False
+        self.abc_row = ft.Row(alignment=ft.MainAxisAlignment.CENTER, spacing=20)
+        self.categories_table = ft.Column(spacing=4)
+        self.low_cover_list = ft.Column(spacing=4)
+        return ft.Column([
+            ft.Text("Curva ABC e Giro de Estoque", size=20, weight=ft.FontWeight.BOLD, color=NEON_PURPLE),
+            self.analysis_period,
+            self.analysis_summary,
+            self.abc_row,
+            ft.Row([
+                GlassCard(ft.Column([ft.Text("Por categoria", size=16, weight=ft.FontWeight.BOLD, color=NEON_BLUE), self.categories_table], width=560), padding=15),
+                GlassCard(ft.Column([ft.Text("Estoque acabando", size=16, weight=ft.FontWeight.BOLD, color=NEON_RED), self.low_cover_list], width=320), padding=15),
+            ], alignment=ft.MainAxisAlignment.CENTER, vertical_alignment=ft.CrossAxisAlignment.START, wrap=True, spacing=20),
+        ], horizontal_alignment=ft.CrossAxisAlignment.CENTER)
+
+    def did_mount(self):
+        # Primeira exibição (load_data roda antes do primeiro quadro e não inicia a análise)
+        if not self.analysis_started:
+            self.schedule_analysis()
+            self.update()
+
+    def schedule_analysis(self):
+        if self.page is None:
+            return
+        self.analysis_started = True
+        with self.analysis_lock:
+            if self.analysis_running:
+                # Já calculando: refaz ao terminar, com o período escolhido por último
+                self.analysis_pending = True
+                return
+            self.analysis_running = True
+        self.analysis_summary.value = "Calculando análise..."
+        threading.Thread(target=self.run_analysis, name="analise", daemon=True).start()
+
+    def run_analysis(self):
+        while True:
+            self.analysis_pending = False
+            period = self.analysis_period.value
+            try:
+                summary = analise.resumo_analitico(dias=None if period == "tudo" else int(period), limite=8)
+            except Exception as e:
+                print(f"Erro na análise de vendas: {e}")
+                self.analysis_summary.value = f"Erro ao calcular a análise: {e}"
+            else:
+                self.render_analysis(summary)
+            with self.analysis_lock:
+                if not self.analysis_pending:
+                    self.analysis_running = False
+                    break
         if self.page:
             self.update()
 
+    def render_analysis(self, summary):
+        self.abc_row.controls.clear()
+        self.categories_table.controls.clear()
+        self.low_cover_list.controls.clear()
+        if summary is None:
+            self.analysis_summary.value = "Análise indisponível: instale o numpy (pip install numpy)."
+        else:
+            self.analysis_summary.value = (f"{summary['linhas']} itens de venda | R$ {summary['faturamento']:.2f} | "
+                                           f"margem {summary['margem_pct']:.1f}% | {summary['sem_vendas']} produtos ativos sem venda")
+            for row, color in zip(summary['abc'], (NEON_GREEN, NEON_BLUE, NEON_PURPLE)):
+                value = ft.Text(f"{row['produtos']} produtos", size=20, weight=ft.FontWeight.BOLD, color=color)
+                detail = ft.Text(f"{row['participacao']:.1f}% do faturamento", size=12, color=TEXT_COLOR)
+                self.abc_row.controls.append(self.build_stat_card(f"Classe {row['classe']}", ft.Column([value, detail], horizontal_alignment=ft.CrossAxisAlignment.CENTER), ft.Icons.LEADERBOARD, color))
+
+            headers = ("Categoria", "Faturamento", "Margem", "Giro", "Cobertura")
+            widths = (150, 110, 70, 70, 90)
+            self.categories_table.controls.append(ft.Row([ft.Text(h, width=w, size=12, weight=ft.FontWeight.BOLD, color=NEON_BLUE) for h, w in zip(headers, widths)]))
+            for row in summary['categorias'][:12]:
+                cover = f"{row['dias_cobertura']:.0f} dias" if row['dias_cobertura'] is not None else "-"
+                values = (row['categoria'], f"R$ {row['faturamento']:.2f}", f"{row['margem_pct']:.1f}%", f"{row['giro']:.1f}%", cover)
+                self.categories_table.controls.append(ft.Row([ft.Text(v, width=w, size=12, color=TEXT_COLOR, no_wrap=True) for v, w in zip(values, widths)]))
+
+            for row in summary['cobertura_baixa']:
+                cover = f"{row['dias_cobertura']:.1f} dias" if row['dias_cobertura'] else "sem estoque"
+                self.low_cover_list.controls.append(ft.Text(f"{row['nome']} ({row['classe']}): {row['estoque']} un., {cover}", size=12, color=TEXT_COLOR))
+            if not summary['cobertura_baixa']:
+                self.low_cover_list.controls.append(ft.Text("Sem vendas no período.", size=12, color=TEXT_COLOR))
+
+    def format_period(self, period, grouping):
+        if grouping == "mes":
+            year, month = period.split("-")
+            return f"{month}/{year[2:]}"
+        year, month, day = period.split("-")
+        return f"{day}/{month}"
+
 class DebtorsView(ft.Column):
     def __init__(self):
         super().__init__()
         self.expand = True
-        self.debtors_list = ft.ListView(expand=True, spacing=10)
+        # Maiores saldos primeiro; a próxima página é carregada ao rolar
+        self.debtors_list = ft.ListView(expand=True, spacing=10, on_scroll=self.on_debtors_scroll, on_scroll_interval=100)
+        self.summary_text = ft.Text("", color=NEON_BLUE, size=12)
+        self.next_cursor = None
+        self.page_lock = threading.Lock()
         self.controls = [
             PageHeader("Clientes Devedores"),
+            self.summary_text,
             self.debtors_list
         ]
-        self.load_debtors()
 
-    def load_debtors(self):
+    def load_debtors(self, prefetched=None):
+        self.render_debtors(prefetched or self.fetch_debtors())
+
+    @staticmethod
+    def fetch_debtors():
+        return get_resumo_devedores(), get_devedores(page_size=DEBTORS_PAGE_SIZE)
+
+    @staticmethod
+    def prefetch():
+        return DebtorsView.fetch_debtors()
+
+    def render_debtors(self, result):
+        resumo, devedores = result
         self.debtors_list.controls.clear()
-        devedores = get_devedores()
+        self.summary_text.value = f"{resumo['clientes']} cliente(s) devendo, total a receber R$ {resumo['total']:.2f}"
+        self.next_cursor = proximo_cursor(devedores) if len(devedores) == DEBTORS_PAGE_SIZE else None
         if not devedores:
             self.debtors_list.controls.append(ft.Text("Nenhum cliente com débito pendente.", color=TEXT_COLOR))
-        
-        for d in devedores:
-            # d: (id, nome, telefone, total_divida)
-            self.debtors_list.controls.append(
-                GlassCard(
-                    ft.Row([
-                        ft.Column([
-                            ft.Text(d[1], size=18, weight=ft.FontWeight.BOLD, color=NEON_BLUE),
-                            ft.Text(f"Tel: {d[2]}", color=TEXT_COLOR),
-                        ], expand=True),
-                        ft.Text(f"R$ {d[3]:.2f}", size=20, color=NEON_RED, weight=ft.FontWeight.BOLD),
-                        NeonButton("Quitar Dívida", lambda e, id=d[0]: self.pay_debt(id), icon=ft.Icons.MONEY_OFF, color=NEON_GREEN)
-                    ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
-                )
-            )
+        self.debtors_list.controls.extend(self.build_debtor_card(d) for d in devedores)
         if self.page:
             self.update()
 
+    def on_debtors_scroll(self, e):
+        if self.next_cursor is not None and e.pixels >= e.max_scroll_extent - SCROLL_LOAD_THRESHOLD:
+            self.load_next_page()
+
+    def load_next_page(self):
+        if not self.page_lock.acquire(blocking=False):
+            return
+        try:
+            if self.next_cursor is None:
+                return
+            devedores = get_devedores(cursor=self.next_cursor, page_size=DEBTORS_PAGE_SIZE)
+            self.next_cursor = proximo_cursor(devedores) if len(devedores) == DEBTORS_PAGE_SIZE else None
+            self.debtors_list.controls.extend(self.build_debtor_card(d) for d in devedores)
+            if self.page:
+                self.debtors_list.update()
+        finally:
+            self.page_lock.release()
+
+    def build_debtor_card(self, d):
+        # Faixas de atraso: só as que têm valor
+        aging = [
+            ft.Container(
+                ft.Text(f"{label}: R$ {d[key]:.2f}", size=12, color=color),
+                border=ft.border.all(1, color), border_radius=8, padding=ft.padding.symmetric(2, 8),
+            )
+            for key, label, color in (("ate_30", "até 30 dias", NEON_GREEN), ("de_31_a_60", "31 a 60 dias", NEON_PURPLE), ("acima_60", "mais de 60 dias", NEON_RED))
+            if d[key] > 0.005
+        ]
+        return GlassCard(
+            ft.Row([
+                ft.Column([
+                    ft.Text(d['nome'], size=18, weight=ft.FontWeight.BOLD, color=NEON_BLUE),
+                    ft.Text(f"Tel: {d['telefone']} | {d['vendas_abertas']} venda(s) em aberto desde {d['venda_mais_antiga'][:10]}", color=TEXT_COLOR),
+                    ft.Row(aging, spacing=5, wrap=True),
+                ], expand=True),
+                ft.Text(f"R$ {d['total_divida']:.2f}", size=20, color=NEON_RED, weight=ft.FontWeight.BOLD),
+                NeonButton("Receber", lambda e, d=d: self.open_payment_dialog(d), icon=ft.Icons.PAYMENTS, color=NEON_GREEN),
+                NeonButton("Quitar Dívida", lambda e, id=d['id']: self.pay_debt(id), icon=ft.Icons.MONEY_OFF, color=NEON_GREEN)
+            ], alignment=ft.MainAxisAlignment.SPACE_BETWEEN)
+        )
+
+    def open_payment_dialog(self, d):
+        valor = NeonTextField(label="Valor recebido", keyboard_type=ft.KeyboardType.NUMBER, value=f"{d['total_divida']:.2f}", autofocus=True)
+        observacao = NeonTextField(label="Observação")
+
+        def save(e):
+            try:
+                quantia = float(valor.value.replace(",", "."))
+            except ValueError:
+                valor.error_text = "Informe um valor numérico"
+                valor.update()
+                return
+            try:
+                registrar_pagamento(d['id'], quantia, observacao.value or "")
+            except ValueError as erro:
+                valor.error_text = str(erro)
+                valor.update()
+                return
+            self.page.close(dialog)
+            self.show_message("Pagamento registrado!")
+            self.load_debtors()
+
+        dialog = ft.AlertDialog(
+            title=ft.Text(f"Receber de {d['nome']}", color=NEON_BLUE),
+            content=ft.Column([
+                ft.Text(f"Saldo devedor: R$ {d['total_divida']:.2f} (abatido das vendas mais antigas primeiro)", color=TEXT_COLOR),
+                valor,
+                observacao,
+            ], tight=True),
+            actions=[
+                NeonButton("Registrar", save, icon=ft.Icons.CHECK),
+                ft.TextButton("Cancelar", on_click=lambda e: self.page.close(dialog))
+            ],
+            bgcolor=CARD_BG
+        )
+        self.page.open(dialog)
+
     def pay_debt(self, client_id):
         quitar_divida(client_id)
-        self.page.snack_bar = ft.SnackBar(ft.Text("Dívida quitada com sucesso!", color=ft.Colors.GREEN))
+        self.show_message("Dívida quitada com sucesso!")
+        self.load_debtors()
+
+    def show_message(self, text):
+        self.page.snack_bar = ft.SnackBar(ft.Text(text, color=ft.Colors.GREEN))
         self.page.snack_bar.open = True
         self.page.update()
-        self.load_debtors()
+
+class DiagnosticsView(ft.Column):
+    """Painel oculto (Ctrl+Shift+D) com o perfil das chamadas ao banco desde a abertura do app."""
+    def __init__(self):
+        super().__init__()
+        self.width = 900
+        self.height = 600
+        self.scroll = ft.ScrollMode.AUTO
+        self.active_switch = ft.Switch(label="Profiler ativo", value=profiler.ativo(), on_change=self.toggle_profiler)
+        self.report_text = ft.Text(font_family="monospace", size=12, color=TEXT_COLOR, selectable=True)
+        self.slow_list = ft.Column(spacing=5)
+        self.controls = [
+            ft.Row([
+                self.active_switch,
+                ft.TextButton("Atualizar", icon=ft.Icons.REFRESH, on_click=lambda e: self.load_report()),
+                ft.TextButton("Zerar", icon=ft.Icons.DELETE_SWEEP, on_click=self.reset),
+            ]),
+            self.report_text,
+            ft.Divider(color=NEON_BLUE),
+            ft.Text(f"Consultas lentas (>= {profiler.LIMITE_LENTO_MS:.0f} ms, log em {profiler.ARQUIVO_LOG})", color=NEON_BLUE, weight=ft.FontWeight.BOLD),
+            self.slow_list,
+        ]
+        self.load_report()
+
+    def toggle_profiler(self, e):
+        if self.active_switch.value:
+            profiler.ativar()
+        else:
+            profiler.desativar()
+        self.load_report()
+
+    def reset(self, e):
+        profiler.zerar()
+        self.load_report()
+
+    def load_report(self):
+        cache = estatisticas_cache()
+        self.report_text.value = (inicializacao.relatorio() + "\n\n" + profiler.relatorio() +
+            f"\n\nCache de referência: {cache['acertos']} acertos, {cache['faltas']} faltas, carregado: {', '.join(cache['chaves']) or '-'}"
+            f"\nLeitor de código de barras: {cache['leitor']['acertos']} no mapa, {cache['leitor']['faltas']} fora dele")
+        self.slow_list.controls.clear()
+        for consulta in profiler.consultas_lentas():
+            plan_text = ft.Text(font_family="monospace", size=11, color=TEXT_COLOR, selectable=True)
+            self.slow_list.controls.append(ft.Column([
+                ft.Row([
+                    ft.Text(f"{consulta['data'][11:19]}  {consulta['ms']:.1f} ms  {consulta['funcao']} ({consulta['linhas']} linhas) <- {consulta['local']}", color=NEON_RED, size=12, expand=True),
+                    ft.TextButton("Plano", on_click=lambda e, c=consulta, t=plan_text: self.show_plan(c, t)),
+                ]),
+                plan_text,
+            ], spacing=0))
+        if not self.slow_list.controls:
+            self.slow_list.controls.append(ft.Text("Nenhuma consulta lenta registrada.", color=TEXT_COLOR))
+        if self.page:
+            self.update()
+
+    def show_plan(self, consulta, plan_text):
+        linhas = []
+        for sql, params, lote in consulta["_sql"]:
+            linhas.append(sql)
+            linhas += ["    " + l for l in profiler.explicar(sql, params[0] if lote and params else params)]
+        plan_text.value = "\n".join(linhas)
+        plan_text.update()